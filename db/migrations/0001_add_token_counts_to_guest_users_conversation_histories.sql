@@ -0,0 +1,5 @@
+-- 会話履歴を取得する度にトークン数を計算しなくて済むように、保存時に計算したトークン数を保存する
+-- カラムを追加する前に保存された行はNULLになり、会話履歴の取得時に計算する
+ALTER TABLE guest_users_conversation_histories
+  ADD COLUMN user_message_token_count INT UNSIGNED NULL AFTER ai_message,
+  ADD COLUMN ai_message_token_count INT UNSIGNED NULL AFTER user_message_token_count;
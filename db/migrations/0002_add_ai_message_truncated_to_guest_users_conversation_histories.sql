@@ -0,0 +1,3 @@
+-- クライアントが応答の途中で切断した場合に、途中までの応答を保存した事を記録する
+ALTER TABLE guest_users_conversation_histories
+  ADD COLUMN ai_message_truncated TINYINT(1) NOT NULL DEFAULT 0 AFTER ai_message_token_count;
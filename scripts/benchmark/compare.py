@@ -0,0 +1,74 @@
+# run.py または startup.py で保存した2つの結果を比較する
+#
+# python scripts/benchmark/compare.py <変更前の結果のJSON> <変更後の結果のJSON>
+import json
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+compared_metrics: List[Tuple[str, Optional[str]]] = [
+    ("throughput_rps", None),
+    ("tokens_per_second", None),
+    ("frames_per_request", None),
+    ("failed", None),
+    ("ttft_ms", "p50"),
+    ("ttft_ms", "p95"),
+    ("ttft_ms", "p99"),
+    ("stream_duration_ms", "p50"),
+    ("stream_duration_ms", "p95"),
+    ("stream_duration_ms", "p99"),
+]
+
+startup_compared_metrics: List[Tuple[str, Optional[str]]] = [
+    ("import_main_ms", None),
+    ("ready_ms", None),
+    ("first_request_ttft_ms", None),
+    ("first_request_duration_ms", None),
+    ("second_request_ttft_ms", None),
+    ("second_request_duration_ms", None),
+]
+
+
+def metric_value(
+    summary: Dict[str, Any], key: str, field: Optional[str]
+) -> Optional[float]:
+    value = summary.get(key)
+    if field is not None:
+        value = value.get(field) if isinstance(value, dict) else None
+    return value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    args = parser.parse_args()
+
+    before = json.loads(args.before.read_text(encoding="utf-8"))
+    after = json.loads(args.after.read_text(encoding="utf-8"))
+
+    print(f"before: {before['commit'][:7]} ({before['profile_name']})")
+    print(f"after:  {after['commit'][:7]} ({after['profile_name']})")
+    metrics = (
+        startup_compared_metrics
+        if after.get("benchmark") == "startup"
+        else compared_metrics
+    )
+    for key, field in metrics:
+        name = key if field is None else f"{key}.{field}"
+        before_value = metric_value(before["summary"], key, field)
+        after_value = metric_value(after["summary"], key, field)
+        if before_value is None or after_value is None:
+            print(f"{name:<28} {before_value!s:>10} {after_value!s:>10}")
+            continue
+
+        change = (
+            f"{(after_value - before_value) / before_value * 100:+.1f}%"
+            if before_value != 0
+            else "-"
+        )
+        print(f"{name:<28} {before_value:>10} {after_value:>10} {change:>8}")
+
+
+if __name__ == "__main__":
+    main()
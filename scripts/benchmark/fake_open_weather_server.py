@@ -0,0 +1,63 @@
+# OpenWeatherの現在の天気とジオコーディングのAPIを、プロファイルで指定した遅延で返す偽のサーバー
+#
+# python scripts/benchmark/fake_open_weather_server.py [--port 18081] [--profile typical] [--seed 0]
+#
+# アプリケーションは OPEN_WEATHER_API_BASE_URL=http://127.0.0.1:18081 を指定して起動する
+import sys
+import random
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import FastAPI
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmark.latency_profile import (  # noqa: E402
+    LatencyProfile,
+    load_latency_profile,
+    sample,
+)
+
+
+def create_app(profile: LatencyProfile, seed: int = 0) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(seed)
+
+    @app.get("/health")
+    async def health() -> Dict[str, str]:
+        return {"status": "ok"}
+
+    @app.get("/data/2.5/weather")
+    async def fetch_current_weather(lat: float, lon: float) -> Dict[str, Any]:
+        await asyncio.sleep(sample(profile["weather_seconds"], rng))
+        return {
+            "coord": {"lat": lat, "lon": lon},
+            "weather": [{"id": 800, "main": "Clear", "description": "晴天"}],
+            "main": {"temp": round(rng.uniform(5, 30), 2)},
+        }
+
+    @app.get("/geo/1.0/direct")
+    async def geocoding(q: str) -> List[Dict[str, Any]]:
+        await asyncio.sleep(sample(profile["weather_seconds"], rng))
+        return [{"name": q.split(",")[0], "lat": 35.6895, "lon": 139.6917}]
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18081)
+    parser.add_argument("--profile", default="typical")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app(load_latency_profile(args.profile), args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+# OpenAIのChat Completions APIと同じ形式のレスポンスを、プロファイルで指定した遅延で返す偽のサーバー
+#
+# python scripts/benchmark/fake_openai_server.py [--port 18080] [--profile typical] [--seed 0]
+#
+# アプリケーションは OPENAI_BASE_URL=http://127.0.0.1:18080/v1 を指定して起動する
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from collections.abc import AsyncIterator
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmark.latency_profile import (  # noqa: E402
+    LatencyProfile,
+    load_latency_profile,
+    sample,
+)
+
+# 応答のchunkとして順番に返す文字列、実際のストリーミングと同じく1chunkがおおよそ1トークンになる
+response_fragments = [
+    "こんにちは",
+    "だにゃん",
+    "🐱",
+    "今日",
+    "は",
+    "いい",
+    "天気",
+    "だにゃん",
+    "。",
+    "何か",
+    "お手伝い",
+    "できる",
+    "事",
+    "は",
+    "ある",
+    "にゃんか",
+    "？",
+]
+
+# toolsの引数のサンプル値、存在しない引数は "Tokyo" を渡す
+tool_argument_examples = {
+    "city_name": "Tokyo",
+    "timezone": "Asia/Tokyo",
+}
+
+
+def create_tool_calls(
+    tools: List[Dict[str, Any]], rng: random.Random, completion_id: str
+) -> List[Dict[str, Any]]:
+    tool = rng.choice(tools)["function"]
+    required = tool.get("parameters", {}).get("required", [])
+    arguments = {name: tool_argument_examples.get(name, "Tokyo") for name in required}
+    return [
+        {
+            "id": f"call_{completion_id}",
+            "type": "function",
+            "function": {
+                "name": tool["name"],
+                "arguments": json.dumps(arguments, ensure_ascii=False),
+            },
+        }
+    ]
+
+
+def should_call_tools(
+    body: Dict[str, Any], profile: LatencyProfile, rng: random.Random
+) -> bool:
+    if not body.get("tools") or body.get("tool_choice") == "none":
+        return False
+    # toolsの実行結果を含むリクエストでは再度toolsを呼び出さない
+    if any(message.get("role") == "tool" for message in body.get("messages", [])):
+        return False
+    if body.get("tool_choice") == "required":
+        return True
+    return rng.random() < profile["tool_call_rate"]
+
+
+def create_app(profile: LatencyProfile, seed: int = 0) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(seed)
+    completion_ids = itertools.count()
+
+    @app.get("/health")
+    async def health() -> Dict[str, str]:
+        return {"status": "ok"}
+
+    # アプリケーションの起動時やkeep-aliveでコネクションを確立する為に送られる
+    @app.get("/v1/models/{model}")
+    async def retrieve_model(model: str) -> Dict[str, Any]:
+        return {"id": model, "object": "model", "created": 0, "owned_by": "system"}
+
+    @app.post("/v1/chat/completions")
+    async def create_chat_completion(request: Request) -> Response:
+        body = await request.json()
+        completion_id = f"chatcmpl-fake-{next(completion_ids)}"
+        created = int(time.time())
+        model = body.get("model", "gpt-4o-mini")
+
+        if rng.random() < profile["error_rate"]:
+            status_code = rng.choice([429, 500])
+            return JSONResponse(
+                status_code=status_code,
+                content={
+                    "error": {
+                        "message": "fake error for benchmarking",
+                        "type": "server_error",
+                        "code": str(status_code),
+                    }
+                },
+            )
+
+        ttft = sample(profile["ttft_seconds"], rng)
+        token_count = max(1, round(sample(profile["response_tokens"], rng)))
+        inter_token_delays = [
+            sample(profile["inter_token_seconds"], rng) for _ in range(token_count)
+        ]
+        tool_calls: Optional[List[Dict[str, Any]]] = None
+        if should_call_tools(body, profile, rng):
+            tool_calls = create_tool_calls(body["tools"], rng, completion_id)
+
+        if not body.get("stream"):
+            await asyncio.sleep(ttft)
+            if tool_calls is not None:
+                message: Dict[str, Any] = {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": tool_calls,
+                }
+            elif body.get("response_format", {}).get("type") == "json_object":
+                message = {"role": "assistant", "content": '{"use_tools": false}'}
+            else:
+                message = {
+                    "role": "assistant",
+                    "content": "".join(
+                        itertools.islice(
+                            itertools.cycle(response_fragments), token_count
+                        )
+                    ),
+                }
+            return JSONResponse(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": message,
+                            "finish_reason": "stop"
+                            if tool_calls is None
+                            else "tool_calls",
+                            "logprobs": None,
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 0,
+                        "completion_tokens": token_count,
+                        "total_tokens": token_count,
+                    },
+                }
+            )
+
+        def format_chunk(delta: Dict[str, Any], finish_reason: Optional[str]) -> str:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": delta,
+                        "finish_reason": finish_reason,
+                        "logprobs": None,
+                    }
+                ],
+            }
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+        async def stream() -> AsyncIterator[str]:
+            await asyncio.sleep(ttft)
+            yield format_chunk({"role": "assistant", "content": ""}, None)
+
+            if tool_calls is not None:
+                for index, tool_call in enumerate(tool_calls):
+                    yield format_chunk(
+                        {"tool_calls": [{"index": index, **tool_call}]}, None
+                    )
+                yield format_chunk({}, "tool_calls")
+            else:
+                fragments = itertools.cycle(response_fragments)
+                for delay in inter_token_delays:
+                    yield format_chunk({"content": next(fragments)}, None)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                yield format_chunk({}, "stop")
+
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--profile", default="typical")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app(load_latency_profile(args.profile), args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
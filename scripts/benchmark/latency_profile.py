@@ -0,0 +1,87 @@
+# 偽のOpenAI, OpenWeatherのサーバーが返すレスポンスの遅延やエラーの発生率の設定
+import json
+import math
+import random
+from pathlib import Path
+from typing import Dict, TypedDict
+
+
+# 中央値とp95を指定した対数正規分布、実際のAPIの遅延は右に裾が長い分布になる
+class Distribution(TypedDict):
+    median: float
+    p95: float
+
+
+class LatencyProfile(TypedDict):
+    # リクエストを受けてから最初のchunkを返すまでの時間（秒）
+    ttft_seconds: Distribution
+    # chunkを返す間隔（秒）
+    inter_token_seconds: Distribution
+    # 1回の応答で返すchunkの数
+    response_tokens: Distribution
+    # toolsが渡された場合にtoolsの呼び出しを返す割合
+    tool_call_rate: float
+    # 500または429を返す割合
+    error_rate: float
+    # OpenWeatherのAPIの応答時間（秒）
+    weather_seconds: Distribution
+
+
+latency_profiles: Dict[str, LatencyProfile] = {
+    # サーバー側の処理だけを測る為に、偽のサーバーの遅延をほぼ無くす
+    "instant": {
+        "ttft_seconds": {"median": 0.001, "p95": 0.002},
+        "inter_token_seconds": {"median": 0.0, "p95": 0.0},
+        "response_tokens": {"median": 40, "p95": 80},
+        "tool_call_rate": 0.2,
+        "error_rate": 0.0,
+        "weather_seconds": {"median": 0.001, "p95": 0.002},
+    },
+    # 本番で観測しているgpt-4o-miniの応答に近い値
+    "typical": {
+        "ttft_seconds": {"median": 0.45, "p95": 1.2},
+        "inter_token_seconds": {"median": 0.015, "p95": 0.04},
+        "response_tokens": {"median": 60, "p95": 150},
+        "tool_call_rate": 0.2,
+        "error_rate": 0.0,
+        "weather_seconds": {"median": 0.08, "p95": 0.3},
+    },
+    "slow": {
+        "ttft_seconds": {"median": 1.5, "p95": 4.0},
+        "inter_token_seconds": {"median": 0.04, "p95": 0.12},
+        "response_tokens": {"median": 60, "p95": 150},
+        "tool_call_rate": 0.2,
+        "error_rate": 0.0,
+        "weather_seconds": {"median": 0.3, "p95": 1.5},
+    },
+    # エラー時の挙動（リトライ、エラーレスポンス）を確認する
+    "flaky": {
+        "ttft_seconds": {"median": 0.45, "p95": 1.2},
+        "inter_token_seconds": {"median": 0.015, "p95": 0.04},
+        "response_tokens": {"median": 60, "p95": 150},
+        "tool_call_rate": 0.2,
+        "error_rate": 0.05,
+        "weather_seconds": {"median": 0.08, "p95": 0.3},
+    },
+}
+
+
+# 組み込みのプロファイル名、またはJSONファイルのパスを受け取る
+def load_latency_profile(name_or_path: str) -> LatencyProfile:
+    if name_or_path in latency_profiles:
+        return latency_profiles[name_or_path]
+
+    with Path(name_or_path).open(encoding="utf-8") as file:
+        profile: LatencyProfile = json.load(file)
+    return profile
+
+
+def sample(distribution: Distribution, rng: random.Random) -> float:
+    median = distribution["median"]
+    if median <= 0:
+        return 0.0
+
+    p95 = max(distribution["p95"], median)
+    # p95は平均から1.645σの位置になる
+    sigma = math.log(p95 / median) / 1.645
+    return rng.lognormvariate(math.log(median), sigma)
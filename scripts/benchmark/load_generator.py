@@ -0,0 +1,222 @@
+# 起動しているアプリケーションにHTTPでリクエストを送り、スループットと最初のトークンまでの時間等を集計する
+import json
+import math
+import time
+import uuid
+import asyncio
+import itertools
+from collections import Counter
+from typing import Dict, List, Optional, TypedDict
+
+import httpx
+
+
+class LoadConfig(TypedDict):
+    base_url: str
+    cat_id: str
+    message: str
+    # 同時に実行するリクエストの数
+    concurrency: int
+    requests: int
+    # 同じ会話で続けて送るメッセージの数、2以上にすると会話履歴の取得も含めて計測する
+    turns_per_conversation: int
+    username: str
+    password: str
+    timeout_seconds: float
+    # 指定した場合はリクエストヘッダーでトークンをまとめて返す設定を上書きする
+    coalesce_max_bytes: Optional[int]
+    coalesce_max_delay_ms: Optional[float]
+
+
+class RequestResult(TypedDict):
+    status_code: int
+    # 最初のメッセージを受け取るまでの時間、1つも受け取れなかった場合はNone
+    ttft_seconds: Optional[float]
+    duration_seconds: float
+    # 受け取ったメッセージのイベントの数、トークンをまとめて返す場合はトークン数より少なくなる
+    chunk_count: int
+    # 最後のtimingイベントで受け取ったトークン数、受け取れなかった場合はNone
+    token_count: Optional[int]
+    # エラーのイベントを受け取った場合や、通信に失敗した場合の内容
+    error: Optional[str]
+
+
+class PercentileSummary(TypedDict):
+    p50: float
+    p95: float
+    p99: float
+    mean: float
+    max: float
+
+
+class LoadSummary(TypedDict):
+    requests: int
+    succeeded: int
+    failed: int
+    elapsed_seconds: float
+    throughput_rps: float
+    tokens_per_second: float
+    frames_per_request: float
+    ttft_ms: Optional[PercentileSummary]
+    stream_duration_ms: Optional[PercentileSummary]
+    status_counts: Dict[str, int]
+    error_counts: Dict[str, int]
+
+
+def percentile(sorted_values: List[float], rate: float) -> float:
+    index = max(0, math.ceil(rate * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize_percentiles(values_seconds: List[float]) -> Optional[PercentileSummary]:
+    if not values_seconds:
+        return None
+
+    values = sorted(value * 1000 for value in values_seconds)
+    return PercentileSummary(
+        p50=round(percentile(values, 0.5), 1),
+        p95=round(percentile(values, 0.95), 1),
+        p99=round(percentile(values, 0.99), 1),
+        mean=round(sum(values) / len(values), 1),
+        max=round(values[-1], 1),
+    )
+
+
+def summarize(results: List[RequestResult], elapsed_seconds: float) -> LoadSummary:
+    succeeded = [result for result in results if result["error"] is None]
+    return LoadSummary(
+        requests=len(results),
+        succeeded=len(succeeded),
+        failed=len(results) - len(succeeded),
+        elapsed_seconds=round(elapsed_seconds, 3),
+        throughput_rps=round(len(succeeded) / elapsed_seconds, 2),
+        tokens_per_second=round(
+            sum(
+                result["chunk_count"]
+                if result["token_count"] is None
+                else result["token_count"]
+                for result in succeeded
+            )
+            / elapsed_seconds,
+            1,
+        ),
+        frames_per_request=round(
+            sum(result["chunk_count"] for result in succeeded) / len(succeeded), 1
+        )
+        if succeeded
+        else 0.0,
+        ttft_ms=summarize_percentiles(
+            [
+                result["ttft_seconds"]
+                for result in succeeded
+                if result["ttft_seconds"] is not None
+            ]
+        ),
+        stream_duration_ms=summarize_percentiles(
+            [result["duration_seconds"] for result in succeeded]
+        ),
+        status_counts=dict(Counter(str(result["status_code"]) for result in results)),
+        error_counts=dict(
+            Counter(
+                result["error"] for result in results if result["error"] is not None
+            )
+        ),
+    )
+
+
+async def send_message(
+    client: httpx.AsyncClient,
+    config: LoadConfig,
+    conversation_id: str,
+) -> RequestResult:
+    request_body = {
+        "userId": str(uuid.uuid4()),
+        "message": config["message"],
+        "conversationId": conversation_id,
+    }
+    started_at = time.perf_counter()
+    ttft_seconds: Optional[float] = None
+    chunk_count = 0
+    token_count: Optional[int] = None
+    error: Optional[str] = None
+    status_code = 0
+    # トークン数とイベントの数を受け取る為に、最後にtimingイベントを返すように指定する
+    headers = {"Ai-Meow-Cat-Timing": "1"}
+    if config["coalesce_max_bytes"] is not None:
+        headers["Ai-Meow-Cat-Coalesce-Max-Bytes"] = str(config["coalesce_max_bytes"])
+    if config["coalesce_max_delay_ms"] is not None:
+        headers["Ai-Meow-Cat-Coalesce-Max-Delay-Ms"] = str(
+            config["coalesce_max_delay_ms"]
+        )
+
+    try:
+        async with client.stream(
+            "POST",
+            f"/cats/{config['cat_id']}/messages-for-guest-users",
+            json=request_body,
+            headers=headers,
+        ) as response:
+            status_code = response.status_code
+            event: Optional[str] = None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line.removeprefix("event: ")
+                    continue
+                if not line.startswith("data: "):
+                    continue
+
+                data = json.loads(line.removeprefix("data: "))
+                if event == "timing":
+                    token_count = data["tokenCount"]
+                    event = None
+                    continue
+                if "type" in data:
+                    error = data["type"]
+                    continue
+
+                if ttft_seconds is None:
+                    ttft_seconds = time.perf_counter() - started_at
+                chunk_count += 1
+    except httpx.HTTPError as e:
+        error = type(e).__name__
+
+    if error is None and status_code != 200:
+        error = f"HTTP_{status_code}"
+
+    return RequestResult(
+        status_code=status_code,
+        ttft_seconds=ttft_seconds,
+        duration_seconds=time.perf_counter() - started_at,
+        chunk_count=chunk_count,
+        token_count=token_count,
+        error=error,
+    )
+
+
+async def run_load(config: LoadConfig) -> List[RequestResult]:
+    results: List[RequestResult] = []
+    request_numbers = itertools.count()
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        conversation_id = str(uuid.uuid4())
+        turn = 0
+        while next(request_numbers) < config["requests"]:
+            # 1つの会話で指定した数のメッセージを送ったら新しい会話を始める
+            if turn == config["turns_per_conversation"]:
+                conversation_id = str(uuid.uuid4())
+                turn = 0
+            results.append(await send_message(client, config, conversation_id))
+            turn += 1
+
+    async with httpx.AsyncClient(
+        base_url=config["base_url"],
+        auth=(config["username"], config["password"]),
+        timeout=config["timeout_seconds"],
+        limits=httpx.Limits(
+            max_connections=config["concurrency"],
+            max_keepalive_connections=config["concurrency"],
+        ),
+    ) as client:
+        await asyncio.gather(*[worker(client) for _ in range(config["concurrency"])])
+
+    return results
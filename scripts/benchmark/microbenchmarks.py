@@ -0,0 +1,735 @@
+# リクエスト毎、ストリーミングのchunk毎にCPUで実行する処理のマイクロベンチマーク
+#
+# 計測: python scripts/benchmark/microbenchmarks.py
+# ベースラインとの比較: python scripts/benchmark/microbenchmarks.py --check [--threshold 1.5]
+# ベースラインの更新: python scripts/benchmark/microbenchmarks.py --update-baseline
+#
+# 外部のAPIやDBには接続せず、infrastructure/repository/mock のリポジトリを利用する
+# tiktokenのファイルを取得出来ない環境ではトークン数の計算を含むベンチマークはスキップする
+import os
+import sys
+import ssl
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import statistics
+import httpx
+from pathlib import Path
+from typing import Any, Dict, List, Optional, TypedDict, cast
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Callable
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletionMessageParam
+from langsmith.wrappers import wrap_openai
+
+sys.path.append(str(Path(__file__).parent.parent.parent / "src"))
+
+# infrastructure.db の読み込み時に証明書のパスが必要になる
+os.environ.setdefault("SSL_CERT_PATH", ssl.get_default_verify_paths().cafile or "")
+os.environ.setdefault("OPEN_WEATHER_API_KEY", "benchmark")
+
+from domain.repository.cat_message_repository_interface import (  # noqa: E402
+    GenerateMessageForGuestUserDto,
+    GenerateMessageForGuestUserResult,
+)
+from infrastructure.conversation_cache import (  # noqa: E402
+    ConversationCache,
+    ConversationWindow,
+)
+from infrastructure.openai import chat_completion_model  # noqa: E402
+from infrastructure.intent_classifier import (  # noqa: E402
+    IntentClassifier,
+    LabelledMessage,
+    train_intent_classifier_model,
+)
+from infrastructure.db import create_db_pool_config  # noqa: E402
+from infrastructure.openai_client import (  # noqa: E402
+    SharedOpenAiClient,
+    create_openai_client_config,
+)
+from infrastructure.weather_cache import (  # noqa: E402
+    WeatherCache,
+    create_weather_cache_config,
+)
+from infrastructure.repository.openai.openai_cat_message_repository import (  # noqa: E402
+    OpenAiCatMessageRepository,
+    create_openai_cat_message_repository_config,
+)
+from infrastructure.tokenizer import get_encoding_for_model, get_tokenizer  # noqa: E402
+from infrastructure.repository.aiomysql.aiomysql_guest_users_conversation_history_repository import (  # noqa: E402
+    AiomysqlGuestUsersConversationHistoryRepository,
+)
+from infrastructure.repository.aiomysql.aiomysql_pool_db_handler import (  # noqa: E402
+    AiomysqlPoolDbHandler,
+)
+from infrastructure.repository.mock.mock_cat_message_repository import (  # noqa: E402
+    MockCatMessageRepository,
+)
+from infrastructure.repository.mock.mock_db_handler import MockDbHandler  # noqa: E402
+from infrastructure.repository.mock.mock_users_conversation_history_repository import (  # noqa: E402
+    MockGuestUsersConversationHistoryRepository,
+)
+from log.logger import (  # noqa: E402
+    AppLogger,
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    SuccessLogExtra,
+)
+from log.request_timing import RequestTiming  # noqa: E402
+from presentation.container import AppContainer  # noqa: E402
+from presentation.sse import SseMessageEncoder, format_sse  # noqa: E402
+from presentation.stream_coalescer import (  # noqa: E402
+    StreamCoalescingConfig,
+    coalesce_stream,
+)
+from presentation.controller.generate_cat_message_for_guest_user_controller import (  # noqa: E402
+    GenerateCatMessageForGuestUserController,
+    GenerateCatMessageForGuestUserSuccessResponseBody,
+)
+from usecase.generate_cat_message_for_guest_user_use_case import (  # noqa: E402
+    GenerateCatMessageForGuestUserUseCase,
+    GenerateCatMessageForGuestUserUseCaseDto,
+    GenerateCatMessageForGuestUserUseCaseSuccessResult,
+    is_error_result,
+    is_success_result,
+)
+
+baseline_path = Path(__file__).parent / "microbenchmark_baseline.json"
+labelled_messages_path = (
+    Path(__file__).parent.parent / "data" / "intent_classifier_labelled_messages.jsonl"
+)
+
+# 1回の計測がこの秒数以上になるようにループ回数を決める
+min_run_seconds = 0.05
+repeat = 5
+
+user_message = (
+    "もこちゃんこんにちは🐱今日は仕事で疲れたから、何か元気が出る話をしてほしいにゃん。"
+)
+ai_message = (
+    "おつかれさまだにゃん🐱 もこはねこだけど、毎日ゴロゴロするのが仕事だにゃん。"
+    "今日はおいしいチュールを食べたから、とっても元気だにゃん！人間ちゃんも美味しいものを食べてゆっくり休むにゃん🐱"
+)
+long_message = (user_message + ai_message) * 30
+
+
+class MicroBenchmark(TypedDict):
+    name: str
+    # loops回実行した経過時間（秒）を返す関数を作成する、計測する時まで準備の処理を遅らせる
+    create_run: Callable[[], Callable[[int], float]]
+    requires_encoding: bool
+
+
+class BenchmarkMeasurement(TypedDict):
+    ns_per_op: float
+    # 直前に計測した基準の処理に対する時間の比率、マシンの性能差や計測中の負荷の変動の影響を受けにくいのでこちらで比較する
+    relative_cost: float
+
+
+class BenchmarkBaseline(TypedDict):
+    python_version: str
+    benchmarks: Dict[str, BenchmarkMeasurement]
+
+
+def sync_benchmark(operation: Callable[[], object]) -> Callable[[int], float]:
+    def run(loops: int) -> float:
+        started_at = time.perf_counter()
+        for _ in range(loops):
+            operation()
+        return time.perf_counter() - started_at
+
+    return run
+
+
+def async_benchmark(
+    operation: Callable[[], Awaitable[object]],
+) -> Callable[[int], float]:
+    async def run_loops(loops: int) -> float:
+        started_at = time.perf_counter()
+        for _ in range(loops):
+            await operation()
+        return time.perf_counter() - started_at
+
+    def run(loops: int) -> float:
+        return asyncio.run(run_loops(loops))
+
+    return run
+
+
+# 補正に利用する、アプリケーションのコードに依存しない純粋なPythonの処理
+def reference_operation() -> None:
+    values = {str(i): i * 2 for i in range(100)}
+    json.dumps(values)
+    sorted(values.values(), reverse=True)
+
+
+def calibrate_loops(run: Callable[[int], float]) -> int:
+    loops = 1
+    while run(loops) < min_run_seconds:
+        loops *= 2
+    return loops
+
+
+def measure(
+    run: Callable[[int], float], reference_run: Callable[[int], float]
+) -> BenchmarkMeasurement:
+    loops = calibrate_loops(run)
+    reference_loops = calibrate_loops(reference_run)
+
+    seconds_per_op: List[float] = []
+    relative_costs: List[float] = []
+    for _ in range(repeat):
+        reference_seconds = reference_run(reference_loops) / reference_loops
+        seconds = run(loops) / loops
+        seconds_per_op.append(seconds)
+        relative_costs.append(seconds / reference_seconds)
+
+    return BenchmarkMeasurement(
+        ns_per_op=round(min(seconds_per_op) * 1e9, 1),
+        relative_cost=round(statistics.median(relative_costs), 4),
+    )
+
+
+def create_conversation_window() -> ConversationWindow:
+    return {
+        "turns": [
+            {
+                "user_message": user_message,
+                "ai_message": ai_message,
+                "user_message_token_count": 40,
+                "ai_message_token_count": 70,
+            }
+            for _ in range(10)
+        ],
+        "truncated": False,
+    }
+
+
+# 判定する文字数の上限の長いメッセージでも、リクエスト毎の判定が1ms未満に収まる事を確認する
+def create_intent_classifier_run() -> Callable[[int], float]:
+    with labelled_messages_path.open(encoding="utf-8") as file:
+        labelled_messages: List[LabelledMessage] = [
+            json.loads(line) for line in file if line.strip()
+        ]
+    classifier = IntentClassifier(train_intent_classifier_model(labelled_messages))
+    message = "もこちゃん" * 200
+
+    return sync_benchmark(lambda: classifier.classify(message))
+
+
+# 書き込むスレッドの処理を含めずに、ログを出力したスレッドでの処理だけを計測する為のキュー
+class DiscardingQueue:
+    def put_nowait(self, item: object) -> None:
+        pass
+
+
+class StreamingMockCatMessageRepository(MockCatMessageRepository):
+    # 待ち時間を入れずに実際の応答と同程度のchunkを返す
+    async def generate_message_for_guest_user(
+        self, dto: GenerateMessageForGuestUserDto
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]:
+        for _ in range(50):
+            yield GenerateMessageForGuestUserResult(
+                ai_response_id="chatcmpl-abcdefghijklmnopqrstuvwxyz001",
+                message="だにゃん",
+            )
+
+
+def create_use_case_with_mocks() -> GenerateCatMessageForGuestUserUseCase:
+    return GenerateCatMessageForGuestUserUseCase(
+        GenerateCatMessageForGuestUserUseCaseDto(
+            request_id="dummy000-0000-0000-0000-requestid000",
+            user_id="dummy000-user-id00-0000-000000000000",
+            cat_id="moko",
+            message=user_message,
+            db_handler=MockDbHandler(),
+            guest_users_conversation_history_repository=MockGuestUsersConversationHistoryRepository(),
+            cat_message_repository=StreamingMockCatMessageRepository(),
+        )
+    )
+
+
+async def execute_use_case_with_mocks() -> None:
+    async for _ in create_use_case_with_mocks().execute():
+        pass
+
+
+# 1回の応答でSSEのbytesを組み立てるまでの処理、トークンをまとめた場合と比較する
+def create_stream_encoded_with_mocks(
+    stream_coalescing_config: Optional[StreamCoalescingConfig],
+) -> Callable[[], Awaitable[object]]:
+    async def operation() -> object:
+        sse_encoder = SseMessageEncoder("dummy000-0000-0000-0000-requestid000")
+        frames = [
+            GenerateCatMessageForGuestUserController._format_use_case_result(
+                result, sse_encoder
+            )
+            async for result in coalesce_stream(
+                create_use_case_with_mocks().execute(), stream_coalescing_config
+            )
+        ]
+        return frames
+
+    return operation
+
+
+# 組み立てたSSEを別のプロセスが読み込むパイプに書き込むまでの処理
+# uvicornと同様にイベント毎に書き込むので、イベント数に比例するシステムコールの処理も含めてトークンをまとめた場合と比較する
+# 読み込む側の処理を計測に含めないように、読み込みは別のプロセス（cat）で行う
+def create_stream_written_to_pipe_with_mocks(
+    stream_coalescing_config: Optional[StreamCoalescingConfig],
+) -> Callable[[int], float]:
+    encode_stream = create_stream_encoded_with_mocks(stream_coalescing_config)
+
+    async def run_loops(loops: int) -> float:
+        process = await asyncio.create_subprocess_exec(
+            "cat",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+        )
+        writer = cast(asyncio.StreamWriter, process.stdin)
+
+        started_at = time.perf_counter()
+        for _ in range(loops):
+            for frame in cast(List[bytes], await encode_stream()):
+                writer.write(frame)
+                await writer.drain()
+        elapsed = time.perf_counter() - started_at
+
+        writer.close()
+        await process.wait()
+        return elapsed
+
+    def run(loops: int) -> float:
+        return asyncio.run(run_loops(loops))
+
+    return run
+
+
+# OpenAIのストリーミングのレスポンスと同じ形式で、1つのchunkを1回のbytesとして返す
+def create_openai_stream_body() -> List[bytes]:
+    return [
+        f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode()
+        for chunk in [
+            {
+                "id": "chatcmpl-abcdefghijklmnopqrstuvwxyz001",
+                "object": "chat.completion.chunk",
+                "created": 1700000000,
+                "model": chat_completion_model,
+                "system_fingerprint": "fp_0123456789",
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": "だにゃん"},
+                        "logprobs": None,
+                        "finish_reason": None,
+                    }
+                ],
+            }
+            for _ in range(50)
+        ]
+    ] + [b"data: [DONE]\n\n"]
+
+
+# HTTPのリクエストを除いて、OpenAIのストリーミングのレスポンスから回答を取り出すまでの処理
+def create_openai_stream_with_mock_transport(
+    raw_stream_enabled: bool,
+) -> Callable[[], Awaitable[object]]:
+    stream_body = create_openai_stream_body()
+
+    async def handle_request(request: httpx.Request) -> httpx.Response:
+        async def byte_chunks() -> AsyncIterator[bytes]:
+            for byte_chunk in stream_body:
+                yield byte_chunk
+
+        return httpx.Response(
+            200, headers={"content-type": "text/event-stream"}, content=byte_chunks()
+        )
+
+    repository = OpenAiCatMessageRepository(
+        wrap_openai(
+            AsyncOpenAI(
+                api_key="benchmark",
+                http_client=httpx.AsyncClient(
+                    transport=httpx.MockTransport(handle_request)
+                ),
+            )
+        ),
+        raw_stream_enabled=raw_stream_enabled,
+    )
+    messages: List[ChatCompletionMessageParam] = [
+        {"role": "user", "content": user_message}
+    ]
+
+    async def operation() -> object:
+        return [
+            result
+            async for result in repository._stream_chat_completion(
+                messages, "dummy000-user-id00-0000-000000000000"
+            )
+        ]
+
+    return operation
+
+
+# 1回のリクエストでユースケースに渡すリポジトリ等を生成するまでの処理
+# 変更前と同じく環境変数を読み込んで生成する場合と、起動時に生成したコンテナから生成する場合を比較する
+# どちらもトークン数の計算は利用しないので、tokenizerは読み込まない
+def create_request_dependencies(
+    from_container: bool,
+) -> Callable[[], Awaitable[object]]:
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    openai_client = SharedOpenAiClient(create_openai_client_config())
+    weather_cache = WeatherCache(cast(Any, None), create_weather_cache_config())
+    db_pool_config = create_db_pool_config()
+    tokenizer = cast(Any, object())
+    container = AppContainer(
+        logger=AppLogger().logger,
+        tokenizer=tokenizer,
+        openai_client=openai_client,
+        weather_cache=weather_cache,
+        cat_message_repository_config=create_openai_cat_message_repository_config(),
+        db_pool_config=db_pool_config,
+        # Poolのコネクションはクエリを実行するまで借りないので、生成するだけなら接続は不要
+        db_pool=cast(Any, object()),
+    )
+
+    async def operation_from_env() -> object:
+        controller_logger = AppLogger().logger
+        db_handler = AiomysqlPoolDbHandler(
+            cast(Any, object()), db_pool_config["health_check_interval_seconds"]
+        )
+        repository = AiomysqlGuestUsersConversationHistoryRepository(
+            db_handler, tokenizer=tokenizer
+        )
+        cat_message_repository = OpenAiCatMessageRepository(
+            openai_client.client,
+            weather_cache=weather_cache,
+            request_timing=RequestTiming(),
+        )
+        use_case_logger = AppLogger().logger
+        return (
+            controller_logger,
+            repository,
+            cat_message_repository,
+            use_case_logger,
+        )
+
+    async def operation_from_container() -> object:
+        conversation_history_dependencies = (
+            await container.create_conversation_history_dependencies()
+        )
+        cat_message_repository = container.create_cat_message_repository(
+            RequestTiming(), None
+        )
+        return (
+            container.logger,
+            conversation_history_dependencies,
+            cat_message_repository,
+            container.logger,
+        )
+
+    return operation_from_container if from_container else operation_from_env
+
+
+def create_benchmarks() -> List[MicroBenchmark]:
+    success_result = GenerateCatMessageForGuestUserUseCaseSuccessResult(
+        conversation_id="dummy000-0000-0000-0000-requestid000",
+        message="だにゃん",
+    )
+
+    log_record = logging.getLogger("benchmark").makeRecord(
+        "root",
+        logging.INFO,
+        __file__,
+        0,
+        "success",
+        (),
+        None,
+        extra=SuccessLogExtra(
+            request_id="dummy000-0000-0000-0000-requestid000",
+            conversation_id="dummy000-0000-0000-0000-requestid000",
+            cat_id="moko",
+            user_id="dummy000-user-id00-0000-000000000000",
+            ai_response_id="chatcmpl-abcdefghijklmnopqrstuvwxyz001",
+        ),
+    )
+    json_formatter = JsonFormatter()
+    queue_handler = NonBlockingQueueHandler(cast(Any, DiscardingQueue()))
+    sse_encoder = SseMessageEncoder(success_result["conversation_id"])
+
+    window = create_conversation_window()
+
+    def format_sse_with_model_dump() -> str:
+        return format_sse(
+            GenerateCatMessageForGuestUserSuccessResponseBody(
+                conversationId=success_result["conversation_id"],
+                message=success_result["message"],
+            ).model_dump()
+        )
+
+    def create_messages_from_conversation_cache() -> Callable[[], Awaitable[object]]:
+        conversation_cache = ConversationCache(
+            {"ttl_seconds": 600, "max_bytes": 64 * 1024 * 1024}
+        )
+        repository = AiomysqlGuestUsersConversationHistoryRepository(
+            cast(Any, None),
+            datetime_context_enabled=False,
+            tokenizer=get_tokenizer(),
+            conversation_cache=conversation_cache,
+        )
+
+        # キャッシュに存在する場合はDBに接続せずに会話履歴を選択する
+        conversation_cache.put("benchmark", window)
+
+        async def operation() -> object:
+            return await repository.create_messages_with_conversation_history(
+                {
+                    "conversation_id": "benchmark",
+                    "request_message": user_message,
+                    "cat_id": "moko",
+                }
+            )
+
+        return operation
+
+    return [
+        # ストリーミングのchunk毎の処理
+        {
+            "name": "format_sse_with_model_dump",
+            "create_run": lambda: sync_benchmark(format_sse_with_model_dump),
+            "requires_encoding": False,
+        },
+        {
+            "name": "controller_format_use_case_result",
+            "create_run": lambda: sync_benchmark(
+                lambda: GenerateCatMessageForGuestUserController._format_use_case_result(
+                    success_result, sse_encoder
+                )
+            ),
+            "requires_encoding": False,
+        },
+        {
+            "name": "sse_message_encoder_encode",
+            "create_run": lambda: sync_benchmark(
+                lambda: sse_encoder.encode(success_result["message"])
+            ),
+            "requires_encoding": False,
+        },
+        {
+            "name": "is_success_result",
+            "create_run": lambda: sync_benchmark(
+                lambda: is_success_result(dict(success_result))
+            ),
+            "requires_encoding": False,
+        },
+        {
+            "name": "is_error_result",
+            "create_run": lambda: sync_benchmark(
+                lambda: is_error_result(dict(success_result))
+            ),
+            "requires_encoding": False,
+        },
+        # OpenAIのストリーミングの読み込み、50chunk分
+        {
+            "name": "openai_sdk_stream_50_chunks",
+            "create_run": lambda: async_benchmark(
+                create_openai_stream_with_mock_transport(False)
+            ),
+            "requires_encoding": False,
+        },
+        {
+            "name": "openai_raw_stream_50_chunks",
+            "create_run": lambda: async_benchmark(
+                create_openai_stream_with_mock_transport(True)
+            ),
+            "requires_encoding": False,
+        },
+        # リクエスト毎の処理
+        {
+            "name": "json_formatter_format",
+            "create_run": lambda: sync_benchmark(
+                lambda: json_formatter.format(log_record)
+            ),
+            "requires_encoding": False,
+        },
+        {
+            "name": "log_queue_handler_handle",
+            "create_run": lambda: sync_benchmark(
+                lambda: queue_handler.handle(log_record)
+            ),
+            "requires_encoding": False,
+        },
+        {
+            "name": "request_dependencies_from_env",
+            "create_run": lambda: async_benchmark(create_request_dependencies(False)),
+            "requires_encoding": False,
+        },
+        {
+            "name": "request_dependencies_from_container",
+            "create_run": lambda: async_benchmark(create_request_dependencies(True)),
+            "requires_encoding": False,
+        },
+        {
+            "name": "select_history_messages",
+            "create_run": lambda: sync_benchmark(
+                lambda: AiomysqlGuestUsersConversationHistoryRepository._select_history_messages(
+                    window, 40
+                )
+            ),
+            "requires_encoding": False,
+        },
+        {
+            "name": "intent_classifier_classify_long_message",
+            "create_run": create_intent_classifier_run,
+            "requires_encoding": False,
+        },
+        {
+            "name": "use_case_execute_50_chunks",
+            "create_run": lambda: async_benchmark(execute_use_case_with_mocks),
+            "requires_encoding": False,
+        },
+        {
+            "name": "stream_50_chunks_encoded",
+            "create_run": lambda: async_benchmark(
+                create_stream_encoded_with_mocks(None)
+            ),
+            "requires_encoding": False,
+        },
+        {
+            "name": "stream_50_chunks_coalesced_encoded",
+            "create_run": lambda: async_benchmark(
+                create_stream_encoded_with_mocks(
+                    StreamCoalescingConfig(max_bytes=48, max_delay_seconds=0.005)
+                )
+            ),
+            "requires_encoding": False,
+        },
+        {
+            "name": "stream_50_chunks_written_to_pipe",
+            "create_run": lambda: create_stream_written_to_pipe_with_mocks(None),
+            "requires_encoding": False,
+        },
+        {
+            "name": "stream_50_chunks_coalesced_written_to_pipe",
+            "create_run": lambda: create_stream_written_to_pipe_with_mocks(
+                StreamCoalescingConfig(max_bytes=48, max_delay_seconds=0.005)
+            ),
+            "requires_encoding": False,
+        },
+        {
+            "name": "token_count_japanese_message",
+            "create_run": lambda: sync_benchmark(
+                lambda: get_tokenizer().count(user_message)
+            ),
+            "requires_encoding": True,
+        },
+        {
+            "name": "token_count_japanese_long_message",
+            "create_run": lambda: sync_benchmark(
+                lambda: get_tokenizer().count(long_message)
+            ),
+            "requires_encoding": True,
+        },
+        {
+            "name": "create_messages_with_conversation_history_from_cache",
+            "create_run": lambda: async_benchmark(
+                create_messages_from_conversation_cache()
+            ),
+            "requires_encoding": True,
+        },
+    ]
+
+
+def is_encoding_available() -> bool:
+    try:
+        get_encoding_for_model(chat_completion_model)
+    except Exception:
+        return False
+    return True
+
+
+def load_baseline() -> Optional[BenchmarkBaseline]:
+    if not baseline_path.exists():
+        return None
+    baseline: BenchmarkBaseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    return baseline
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--update-baseline", action="store_true")
+    # ベースラインの何倍を超えたら失敗とするか
+    parser.add_argument("--threshold", type=float, default=1.5)
+    parser.add_argument("--filter", default="")
+    args = parser.parse_args()
+
+    encoding_available = is_encoding_available()
+    # 計測中にログが出力されないようにする
+    logging.disable(logging.CRITICAL)
+
+    reference_run = sync_benchmark(reference_operation)
+    baseline = load_baseline()
+
+    results: Dict[str, BenchmarkMeasurement] = {}
+    regressions: List[str] = []
+
+    print(
+        f"{'benchmark':<56} {'ns/op':>10} {'relative':>9} {'baseline':>9} {'ratio':>6}"
+    )
+    for benchmark in create_benchmarks():
+        name = benchmark["name"]
+        if args.filter not in name:
+            continue
+        if benchmark["requires_encoding"] and not encoding_available:
+            print(f"{name:<56} {'skipped (tiktoken encoding is not available)':>33}")
+            continue
+
+        measurement = measure(benchmark["create_run"](), reference_run)
+        results[name] = measurement
+
+        baseline_measurement = (
+            None if baseline is None else baseline["benchmarks"].get(name)
+        )
+        if baseline_measurement is None:
+            print(
+                f"{name:<56} {measurement['ns_per_op']:>10.0f} {measurement['relative_cost']:>9.3f} {'-':>9} {'-':>6}"
+            )
+            continue
+
+        ratio = measurement["relative_cost"] / baseline_measurement["relative_cost"]
+        print(
+            f"{name:<56} {measurement['ns_per_op']:>10.0f} {measurement['relative_cost']:>9.3f} {baseline_measurement['relative_cost']:>9.3f} {ratio:>6.2f}"
+        )
+        if ratio > args.threshold:
+            regressions.append(name)
+
+    if args.update_baseline:
+        # 今回計測していないベンチマークは以前の値を残す
+        benchmarks = {} if baseline is None else dict(baseline["benchmarks"])
+        benchmarks.update(results)
+        baseline_path.write_text(
+            json.dumps(
+                BenchmarkBaseline(
+                    python_version=platform.python_version(),
+                    benchmarks=dict(sorted(benchmarks.items())),
+                ),
+                indent=2,
+            )
+            + "\n",
+            encoding="utf-8",
+        )
+        print(f"updated: {baseline_path}")
+
+    if args.check and regressions:
+        print(
+            f"regressed more than {args.threshold}x from the baseline: {', '.join(regressions)}"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# 偽のOpenAI, OpenWeatherのサーバーとアプリケーションを起動して負荷をかけ、結果をJSONで保存する
+#
+# python scripts/benchmark/run.py [--profile typical] [--concurrency 16] [--requests 200]
+#   [--app-env CONVERSATION_CACHE_ENABLED=1 ...] [--app-url http://127.0.0.1:5000]
+#
+# 会話履歴はDB_HOST等の環境変数で指定したMySQLに保存する（docker composeのMySQLを想定）
+# --app-url を指定した場合はアプリケーションを起動せず、起動済みのアプリケーションに負荷をかける
+import os
+import sys
+import json
+import asyncio
+import argparse
+import subprocess
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmark.latency_profile import load_latency_profile  # noqa: E402
+from benchmark.load_generator import (  # noqa: E402
+    LoadConfig,
+    run_load,
+    summarize,
+)
+
+root_dir = Path(__file__).parent.parent.parent
+benchmark_dir = Path(__file__).parent
+
+
+def git_revision() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=root_dir, capture_output=True, text=True
+        ).stdout.strip()
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": git("status", "--porcelain", "--untracked-files=no") != "",
+    }
+
+
+def parse_app_env(values: List[str]) -> Dict[str, str]:
+    app_env: Dict[str, str] = {}
+    for value in values:
+        key, _, env_value = value.partition("=")
+        app_env[key] = env_value
+    return app_env
+
+
+async def start_process(
+    args: List[str], env: Dict[str, str], cwd: Path
+) -> asyncio.subprocess.Process:
+    return await asyncio.create_subprocess_exec(*args, env=env, cwd=cwd)
+
+
+# 何らかのHTTPレスポンスが返ってきたら起動が完了したとみなす
+async def wait_until_ready(
+    url: str, timeout_seconds: float = 30, poll_interval_seconds: float = 0.1
+) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout_seconds
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                if loop.time() > deadline:
+                    raise TimeoutError(
+                        f"{url} did not start in {timeout_seconds} seconds"
+                    )
+                await asyncio.sleep(poll_interval_seconds)
+
+
+async def stop_processes(processes: List[asyncio.subprocess.Process]) -> None:
+    for process in processes:
+        if process.returncode is None:
+            process.terminate()
+    await asyncio.gather(*[process.wait() for process in processes])
+
+
+# 偽のOpenAI, OpenWeatherのサーバーを起動する
+async def start_fake_servers(
+    profile_name: str, seed: int, openai_port: int, weather_port: int
+) -> List[asyncio.subprocess.Process]:
+    processes: List[asyncio.subprocess.Process] = []
+    for server, port in (
+        ("fake_openai_server.py", openai_port),
+        ("fake_open_weather_server.py", weather_port),
+    ):
+        processes.append(
+            await start_process(
+                [
+                    sys.executable,
+                    str(benchmark_dir / server),
+                    "--port",
+                    str(port),
+                    "--profile",
+                    profile_name,
+                    "--seed",
+                    str(seed),
+                ],
+                dict(os.environ),
+                root_dir,
+            )
+        )
+        await wait_until_ready(f"http://127.0.0.1:{port}/health")
+    return processes
+
+
+# 偽のサーバーに接続するようにアプリケーションを起動する
+async def start_app(
+    args: argparse.Namespace, app_env: Dict[str, str]
+) -> asyncio.subprocess.Process:
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.openai_port}/v1",
+        "OPEN_WEATHER_API_KEY": "benchmark",
+        "OPEN_WEATHER_API_BASE_URL": f"http://127.0.0.1:{args.weather_port}",
+        "BASIC_AUTH_USERNAME": args.username,
+        "BASIC_AUTH_PASSWORD": args.password,
+        "LANGCHAIN_TRACING_V2": "false",
+        **app_env,
+    }
+    return await start_process(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(args.app_port),
+            "--log-level",
+            "warning",
+        ],
+        env,
+        root_dir / "src",
+    )
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    profile = load_latency_profile(args.profile)
+    app_env = parse_app_env(args.app_env)
+    processes: List[asyncio.subprocess.Process] = []
+    app_url: Optional[str] = args.app_url
+
+    try:
+        processes.extend(
+            await start_fake_servers(
+                args.profile, args.seed, args.openai_port, args.weather_port
+            )
+        )
+
+        if app_url is None:
+            app_url = f"http://127.0.0.1:{args.app_port}"
+            processes.append(await start_app(args, app_env))
+            await wait_until_ready(app_url, timeout_seconds=60)
+
+        load_config = LoadConfig(
+            base_url=app_url,
+            cat_id=args.cat_id,
+            message=args.message,
+            concurrency=args.concurrency,
+            requests=args.requests,
+            turns_per_conversation=args.turns_per_conversation,
+            username=args.username,
+            password=args.password,
+            timeout_seconds=args.timeout_seconds,
+            coalesce_max_bytes=args.coalesce_max_bytes,
+            coalesce_max_delay_ms=args.coalesce_max_delay_ms,
+        )
+
+        # コネクションの確立やキャッシュの作成等、起動直後の影響を除く為に先にリクエストを送っておく
+        if args.warmup_requests > 0:
+            await run_load({**load_config, "requests": args.warmup_requests})
+
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        results = await run_load(load_config)
+        elapsed_seconds = loop.time() - started_at
+    finally:
+        await stop_processes(processes)
+
+    return {
+        **git_revision(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "profile_name": args.profile,
+        "profile": profile,
+        "load": {key: value for key, value in load_config.items() if key != "password"},
+        "app_env": app_env,
+        "summary": summarize(results, elapsed_seconds),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default="typical")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup-requests", type=int, default=16)
+    parser.add_argument("--turns-per-conversation", type=int, default=3)
+    parser.add_argument("--cat-id", default="moko")
+    parser.add_argument(
+        "--message", default="ねこちゃんこんにちは🐱今日の東京の天気を教えて"
+    )
+    parser.add_argument("--timeout-seconds", type=float, default=120)
+    # リクエストヘッダーでトークンをまとめて返す設定を指定する、0を指定するとまとめずに返す
+    parser.add_argument("--coalesce-max-bytes", type=int, default=None)
+    parser.add_argument("--coalesce-max-delay-ms", type=float, default=None)
+    parser.add_argument("--username", default="benchmark")
+    parser.add_argument("--password", default="benchmark")
+    parser.add_argument("--app-url", default=None)
+    parser.add_argument("--app-port", type=int, default=15000)
+    parser.add_argument("--openai-port", type=int, default=18080)
+    parser.add_argument("--weather-port", type=int, default=18081)
+    # アプリケーションに渡す環境変数、機能の有効化の比較等に利用する
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--output-dir", type=Path, default=benchmark_dir / "results")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    created_at = datetime.fromisoformat(result["created_at"])
+    output_path = args.output_dir / (
+        f"{created_at.strftime('%Y%m%dT%H%M%SZ')}-{result['commit'][:7]}-{args.profile}.json"
+    )
+    output_path.write_text(
+        json.dumps(result, ensure_ascii=False, indent=2) + "\n", encoding="utf-8"
+    )
+
+    print(json.dumps(result["summary"], ensure_ascii=False, indent=2))
+    print(f"saved: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+-- 負荷試験用のローカルのMySQLに作成するテーブル、本番のスキーマはPlanetScale上で管理している（db/migrations/ を適用した状態）
+CREATE TABLE IF NOT EXISTS guest_users_conversation_histories (
+  id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+  conversation_id VARCHAR(36) NOT NULL,
+  cat_id VARCHAR(255) NOT NULL,
+  user_id VARCHAR(36) NOT NULL,
+  user_message TEXT NOT NULL,
+  ai_message TEXT NOT NULL,
+  user_message_token_count INT UNSIGNED NULL,
+  ai_message_token_count INT UNSIGNED NULL,
+  ai_message_truncated TINYINT(1) NOT NULL DEFAULT 0,
+  created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (id),
+  KEY idx_conversation_id_id (conversation_id, id)
+);
@@ -0,0 +1,257 @@
+# 自動停止したマシンが起動する場合を想定して、アプリケーションの起動から最初のリクエストまでの時間を計測する
+#
+# python scripts/benchmark/startup.py [--profile instant] [--repeat 5] [--app-env STARTUP_WARMUP_ENABLED=0 ...]
+#
+# 以下をプロセスを起動し直して --repeat 回計測し、中央値をJSONで保存する
+#   - 新しいプロセスで main を読み込むまでの時間と、main から直接読み込んでいるモジュール毎の時間
+#   - プロセスを起動してからHTTPのレスポンスを返せるようになるまでの時間
+#   - 起動直後の最初のリクエストと2回目のリクエストの、最初のトークンまでの時間と全体の時間
+#
+# 会話履歴は run.py と同じく DB_HOST 等の環境変数で指定したMySQLに保存する
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, TypedDict
+
+import httpx
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmark.load_generator import LoadConfig, RequestResult, send_message  # noqa: E402
+from benchmark.run import (  # noqa: E402
+    benchmark_dir,
+    git_revision,
+    parse_app_env,
+    root_dir,
+    start_app,
+    start_fake_servers,
+    stop_processes,
+    wait_until_ready,
+)
+
+
+class StartupMeasurement(TypedDict):
+    ready_ms: float
+    first_request_ttft_ms: Optional[float]
+    first_request_duration_ms: float
+    second_request_ttft_ms: Optional[float]
+    second_request_duration_ms: float
+    errors: List[str]
+
+
+# -X importtime の出力から main と、main から直接読み込んでいるモジュールの累積時間（ミリ秒）を取り出す
+def measure_import_ms(app_env: Dict[str, str]) -> Dict[str, float]:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=root_dir / "src",
+        env={**os.environ, "LANGCHAIN_TRACING_V2": "false", **app_env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # 読み込んだモジュールの後に読み込み元のモジュールが出力されるので、main の直前までの1段深いモジュールを集める
+    children: Dict[str, float] = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        # 先頭の1文字の空白の後に、読み込んだモジュールの深さだけインデントされている
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        cumulative_ms = round(int(cumulative) / 1000, 1)
+        if depth == 1:
+            children[name.strip()] = cumulative_ms
+        elif depth == 0:
+            if name.strip() == "main":
+                return {"main": cumulative_ms, **children}
+            children = {}
+    return children
+
+
+async def measure_startup(
+    args: argparse.Namespace, app_env: Dict[str, str]
+) -> StartupMeasurement:
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    load_config = LoadConfig(
+        base_url=app_url,
+        cat_id=args.cat_id,
+        message=args.message,
+        concurrency=1,
+        requests=1,
+        turns_per_conversation=1,
+        username=args.username,
+        password=args.password,
+        timeout_seconds=args.timeout_seconds,
+        coalesce_max_bytes=None,
+        coalesce_max_delay_ms=None,
+    )
+
+    started_at = time.perf_counter()
+    process = await start_app(args, app_env)
+    try:
+        # 起動に失敗した場合にタイムアウトまで待たないように、プロセスの終了も待つ
+        ready = asyncio.create_task(
+            wait_until_ready(app_url, timeout_seconds=60, poll_interval_seconds=0.005)
+        )
+        exited = asyncio.create_task(process.wait())
+        await asyncio.wait({ready, exited}, return_when=asyncio.FIRST_COMPLETED)
+        if not ready.done():
+            ready.cancel()
+            raise RuntimeError(
+                f"the app exited with {process.returncode} before it became ready"
+            )
+        exited.cancel()
+        await ready
+        ready_ms = (time.perf_counter() - started_at) * 1000
+
+        results: List[RequestResult] = []
+        async with httpx.AsyncClient(
+            base_url=app_url,
+            auth=(args.username, args.password),
+            timeout=args.timeout_seconds,
+        ) as client:
+            for _ in range(2):
+                results.append(
+                    await send_message(client, load_config, str(uuid.uuid4()))
+                )
+    finally:
+        await stop_processes([process])
+
+    def to_ms(seconds: Optional[float]) -> Optional[float]:
+        return None if seconds is None else round(seconds * 1000, 1)
+
+    return StartupMeasurement(
+        ready_ms=round(ready_ms, 1),
+        first_request_ttft_ms=to_ms(results[0]["ttft_seconds"]),
+        first_request_duration_ms=round(results[0]["duration_seconds"] * 1000, 1),
+        second_request_ttft_ms=to_ms(results[1]["ttft_seconds"]),
+        second_request_duration_ms=round(results[1]["duration_seconds"] * 1000, 1),
+        errors=[result["error"] for result in results if result["error"] is not None],
+    )
+
+
+def median(values: List[Optional[float]]) -> Optional[float]:
+    measured = [value for value in values if value is not None]
+    return round(statistics.median(measured), 1) if measured else None
+
+
+def summarize(
+    import_measurements: List[Dict[str, float]],
+    startup_measurements: List[StartupMeasurement],
+) -> Dict[str, Any]:
+    import_ms = {
+        name: median([measurement.get(name) for measurement in import_measurements])
+        for name in import_measurements[0]
+    }
+    return {
+        "import_main_ms": import_ms.pop("main", None),
+        "ready_ms": median(
+            [measurement["ready_ms"] for measurement in startup_measurements]
+        ),
+        "first_request_ttft_ms": median(
+            [
+                measurement["first_request_ttft_ms"]
+                for measurement in startup_measurements
+            ]
+        ),
+        "first_request_duration_ms": median(
+            [
+                measurement["first_request_duration_ms"]
+                for measurement in startup_measurements
+            ]
+        ),
+        "second_request_ttft_ms": median(
+            [
+                measurement["second_request_ttft_ms"]
+                for measurement in startup_measurements
+            ]
+        ),
+        "second_request_duration_ms": median(
+            [
+                measurement["second_request_duration_ms"]
+                for measurement in startup_measurements
+            ]
+        ),
+        "errors": [
+            error
+            for measurement in startup_measurements
+            for error in measurement["errors"]
+        ],
+        # main から直接読み込んでいるモジュール、時間の掛かる順
+        "import_ms_by_module": dict(
+            sorted(import_ms.items(), key=lambda item: item[1] or 0.0, reverse=True)
+        ),
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    app_env = parse_app_env(args.app_env)
+
+    import_measurements = [measure_import_ms(app_env) for _ in range(args.repeat)]
+
+    startup_measurements: List[StartupMeasurement] = []
+    processes = await start_fake_servers(
+        args.profile, args.seed, args.openai_port, args.weather_port
+    )
+    try:
+        for _ in range(args.repeat):
+            startup_measurements.append(await measure_startup(args, app_env))
+    finally:
+        await stop_processes(processes)
+
+    return {
+        **git_revision(),
+        "benchmark": "startup",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "profile_name": args.profile,
+        "repeat": args.repeat,
+        "app_env": app_env,
+        "summary": summarize(import_measurements, startup_measurements),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default="instant")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cat-id", default="moko")
+    parser.add_argument(
+        "--message", default="ねこちゃんこんにちは🐱今日の東京の天気を教えて"
+    )
+    parser.add_argument("--timeout-seconds", type=float, default=120)
+    parser.add_argument("--username", default="benchmark")
+    parser.add_argument("--password", default="benchmark")
+    parser.add_argument("--app-port", type=int, default=15000)
+    parser.add_argument("--openai-port", type=int, default=18080)
+    parser.add_argument("--weather-port", type=int, default=18081)
+    # アプリケーションに渡す環境変数、起動時の準備の有無の比較等に利用する
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--output-dir", type=Path, default=benchmark_dir / "results")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    created_at = datetime.fromisoformat(result["created_at"])
+    output_path = args.output_dir / (
+        f"{created_at.strftime('%Y%m%dT%H%M%SZ')}-{result['commit'][:7]}-startup.json"
+    )
+    output_path.write_text(
+        json.dumps(result, ensure_ascii=False, indent=2) + "\n", encoding="utf-8"
+    )
+
+    print(json.dumps(result["summary"], ensure_ascii=False, indent=2))
+    print(f"saved: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
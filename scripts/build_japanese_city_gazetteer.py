@@ -0,0 +1,137 @@
+# 天気を取得するtoolで利用する全市区町村の緯度経度のデータを生成する
+# Geolonia 住所データ（https://github.com/geolonia/japanese-addresses, CC BY 4.0）の
+# 町丁目毎の代表点を市区町村毎に平均し、japanese_cities.tsv と同じ列のTSVとして保存する
+# 同じデータから生成出来るように、取得元はコミットを固定し、SHA-256が一致しない場合は失敗させる
+#
+# python scripts/build_japanese_city_gazetteer.py (--commit <コミットのハッシュ> | --source <CSVのパス>) --sha256 <CSVのSHA-256> [--output <TSVのパス>]
+import io
+import re
+import csv
+import sys
+import hashlib
+import argparse
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, TextIO, TypedDict
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from infrastructure.japanese_city_gazetteer import (  # noqa: E402
+    JapaneseCityGazetteer,
+    default_gazetteer_path,
+    default_municipalities_path,
+)
+
+source_url_template = "https://raw.githubusercontent.com/geolonia/japanese-addresses/{commit}/data/latest.csv"
+
+required_columns = (
+    "市区町村コード",
+    "市区町村名",
+    "市区町村名カナ",
+    "市区町村名ローマ字",
+    "緯度",
+    "経度",
+)
+
+
+class Municipality(TypedDict):
+    name: str
+    kana: str
+    romaji: str
+    lats: List[float]
+    lons: List[float]
+
+
+def create_source_url(commit: str) -> str:
+    # ブランチ名やタグは指す内容が変わるので、コミットのハッシュのみ受け付ける
+    if re.fullmatch(r"[0-9a-f]{40}", commit) is None:
+        raise ValueError(f"commit must be a full 40 character hash: {commit}")
+    return source_url_template.format(commit=commit)
+
+
+def read_source(source: str) -> bytes:
+    if source.startswith(("http://", "https://")):
+        with urllib.request.urlopen(source) as response:
+            data: bytes = response.read()
+            return data
+
+    return Path(source).read_bytes()
+
+
+def verify_sha256(data: bytes, expected_sha256: str) -> None:
+    actual_sha256 = hashlib.sha256(data).hexdigest()
+    if actual_sha256 != expected_sha256.lower():
+        raise ValueError(
+            f"sha256 mismatch: expected {expected_sha256}, actual {actual_sha256}"
+        )
+
+
+def collect_municipalities(file: TextIO) -> List[Municipality]:
+    reader = csv.DictReader(file)
+    missing_columns = [
+        column for column in required_columns if column not in (reader.fieldnames or [])
+    ]
+    if missing_columns:
+        raise ValueError(f"missing columns in the source: {missing_columns}")
+
+    municipalities: Dict[str, Municipality] = {}
+    for row in reader:
+        if not row["緯度"] or not row["経度"]:
+            continue
+
+        municipality = municipalities.setdefault(
+            row["市区町村コード"],
+            {
+                "name": row["市区町村名"],
+                "kana": row["市区町村名カナ"],
+                "romaji": row["市区町村名ローマ字"].title(),
+                "lats": [],
+                "lons": [],
+            },
+        )
+        municipality["lats"].append(float(row["緯度"]))
+        municipality["lons"].append(float(row["経度"]))
+
+    return [municipalities[code] for code in sorted(municipalities)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument("--commit")
+    source_group.add_argument("--source")
+    parser.add_argument("--sha256", required=True)
+    parser.add_argument("--output", type=Path, default=default_municipalities_path)
+    args = parser.parse_args()
+
+    source = args.source if args.source else create_source_url(args.commit)
+    data = read_source(source)
+    verify_sha256(data, args.sha256)
+
+    with io.StringIO(data.decode("utf-8")) as file:
+        municipalities = collect_municipalities(file)
+
+    with args.output.open("w", encoding="utf-8") as file:
+        file.write("# 天気を取得するtoolで利用する全市区町村の緯度経度\n")
+        file.write(
+            "# scripts/build_japanese_city_gazetteer.py で生成（出典: Geolonia 住所データ, CC BY 4.0）\n"
+        )
+        file.write("# 漢字名\tかな\tローマ字\t緯度\t経度\t別名（カンマ区切り）\n")
+        for municipality in municipalities:
+            lat = sum(municipality["lats"]) / len(municipality["lats"])
+            lon = sum(municipality["lons"]) / len(municipality["lons"])
+            file.write(
+                f"{municipality['name']}\t{municipality['kana']}\t"
+                f"{municipality['romaji']}\t{lat:.4f}\t{lon:.4f}\t\n"
+            )
+
+    # 保存したファイルから読み込めるかを確認する
+    gazetteer = JapaneseCityGazetteer.load((default_gazetteer_path, args.output))
+    print(f"source: {source} (sha256: {args.sha256.lower()})")
+    print(f"municipalities: {len(municipalities)}")
+    print(f"entries in the gazetteer: {len(gazetteer)}")
+    print(f"saved: {args.output} ({args.output.stat().st_size} bytes)")
+
+
+if __name__ == "__main__":
+    main()
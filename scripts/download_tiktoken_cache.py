@@ -0,0 +1,38 @@
+# tiktokenのBPEのファイルをダウンロードし、アプリケーションの起動時にネットワークに接続せずに読み込めるようにする
+# Dockerイメージのビルド時に実行し、ファイルをイメージに同梱する
+#
+# python scripts/download_tiktoken_cache.py [--cache-dir src/infrastructure/data/tiktoken_cache]
+import os
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from infrastructure.openai import chat_completion_model  # noqa: E402
+from infrastructure.tokenizer import (  # noqa: E402
+    bundled_tiktoken_cache_dir,
+    get_encoding_for_model,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cache-dir", type=Path, default=bundled_tiktoken_cache_dir)
+    args = parser.parse_args()
+
+    args.cache_dir.mkdir(parents=True, exist_ok=True)
+    os.environ["TIKTOKEN_CACHE_DIR"] = str(args.cache_dir)
+
+    encoding = get_encoding_for_model(chat_completion_model)
+    # 保存したファイルから読み込めるかを確認する為に、実際にトークン数を計算する
+    token_count = len(encoding.encode_ordinary("ねこちゃんこんにちは🐱"))
+
+    print(f"model: {chat_completion_model}, encoding: {encoding.name}")
+    print(f"token count of the sample message: {token_count}")
+    for path in sorted(args.cache_dir.iterdir()):
+        print(f"saved: {path} ({path.stat().st_size} bytes)")
+
+
+if __name__ == "__main__":
+    main()
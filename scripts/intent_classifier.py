@@ -0,0 +1,89 @@
+# toolsの利用要否を判定するローカルの分類器の学習と評価を行う
+#
+# 学習: python scripts/intent_classifier.py train <ラベル付きのJSONL> <出力するモデルのパス>
+# 評価: python scripts/intent_classifier.py evaluate <ラベル付きのJSONL> [モデルのパス]
+#
+# ラベル付きのJSONLは1行毎に {"message": "...", "label": "needs_tools" | "no_tools"} の形式
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import List
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from infrastructure.intent_classifier import (  # noqa: E402
+    IntentClassifier,
+    LabelledMessage,
+    evaluate_intent_classifier,
+    train_intent_classifier_model,
+)
+
+
+def load_labelled_messages(path: Path) -> List[LabelledMessage]:
+    with path.open(encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def train(args: argparse.Namespace) -> None:
+    model = train_intent_classifier_model(
+        load_labelled_messages(Path(args.labelled_messages)),
+        ngram_min=args.ngram_min,
+        ngram_max=args.ngram_max,
+        min_count=args.min_count,
+    )
+
+    with Path(args.output).open("w", encoding="utf-8") as file:
+        json.dump(model, file, ensure_ascii=False, separators=(",", ":"))
+
+
+def evaluate(args: argparse.Namespace) -> None:
+    classifier = (
+        IntentClassifier.load(Path(args.model)) if args.model else IntentClassifier()
+    )
+    labelled_messages = load_labelled_messages(Path(args.labelled_messages))
+
+    evaluation = evaluate_intent_classifier(classifier, labelled_messages)
+
+    started_at = time.perf_counter()
+    for labelled_message in labelled_messages:
+        classifier.classify(labelled_message["message"])
+    elapsed = time.perf_counter() - started_at
+
+    print(
+        json.dumps(
+            {
+                **evaluation,
+                "microseconds_per_message": elapsed / len(labelled_messages) * 1e6
+                if labelled_messages
+                else 0.0,
+            },
+            indent=2,
+        )
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(required=True)
+
+    train_parser = subparsers.add_parser("train")
+    train_parser.add_argument("labelled_messages")
+    train_parser.add_argument("output")
+    train_parser.add_argument("--ngram-min", type=int, default=1)
+    train_parser.add_argument("--ngram-max", type=int, default=3)
+    train_parser.add_argument("--min-count", type=int, default=2)
+    train_parser.set_defaults(func=train)
+
+    evaluate_parser = subparsers.add_parser("evaluate")
+    evaluate_parser.add_argument("labelled_messages")
+    evaluate_parser.add_argument("model", nargs="?")
+    evaluate_parser.set_defaults(func=evaluate)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# トークン数の計算がイベントループをブロックする時間を、変更前の実装とTokenizerで比較する
+#
+# python scripts/tokenizer_benchmark.py [--requests 20] [--messages 20] [--message-length 5000]
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tiktoken
+from pathlib import Path
+from typing import List, TypedDict
+from collections.abc import Awaitable, Callable
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from infrastructure.tokenizer import get_tokenizer  # noqa: E402
+
+
+class BenchmarkResult(TypedDict):
+    elapsed_ms: float
+    # イベントループが他のタスクを実行出来なかった時間の最大値と合計
+    max_blocking_ms: float
+    total_blocking_ms: float
+
+
+# 変更前の calculate_token_count と同じく、呼び出す度にencodingを取得してイベントループ上で計算する
+async def count_legacy(texts: List[str]) -> List[int]:
+    return [
+        len(tiktoken.encoding_for_model("gpt-3.5-turbo").encode(text)) for text in texts
+    ]
+
+
+async def count_with_tokenizer(texts: List[str]) -> List[int]:
+    return await get_tokenizer().count_batch_async(texts)
+
+
+async def measure(
+    count: Callable[[List[str]], Awaitable[List[int]]],
+    histories: List[List[str]],
+    interval: float = 0.001,
+) -> BenchmarkResult:
+    loop = asyncio.get_running_loop()
+    blocking: List[float] = []
+    finished = asyncio.Event()
+
+    async def monitor() -> None:
+        while not finished.is_set():
+            expected_at = loop.time() + interval
+            await asyncio.sleep(interval)
+            blocking.append(max(0.0, loop.time() - expected_at))
+
+    monitor_task = asyncio.create_task(monitor())
+    await asyncio.sleep(interval)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(count(history) for history in histories))
+    elapsed = time.perf_counter() - started_at
+
+    finished.set()
+    await monitor_task
+
+    return BenchmarkResult(
+        elapsed_ms=elapsed * 1000,
+        max_blocking_ms=max(blocking, default=0.0) * 1000,
+        total_blocking_ms=sum(blocking) * 1000,
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--message-length", type=int, default=5000)
+    args = parser.parse_args()
+
+    text = ("もこはねこだけど運動は苦手だにゃん🐱 Moko is a Persian cat. " * 200)[
+        : args.message_length
+    ]
+    histories = [[text] * args.messages for _ in range(args.requests)]
+
+    # encodingの読み込み時間は計測に含めない
+    tiktoken.encoding_for_model("gpt-3.5-turbo")
+    get_tokenizer()
+
+    print(
+        json.dumps(
+            {
+                "before": await measure(count_legacy, histories),
+                "after": await measure(count_with_tokenizer, histories),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,3 +1,5 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
 from typing import Literal
 
 moko_template = """
@@ -51,3 +53,21 @@ CatId = Literal["moko"]
 # ねこのIDからプロンプトのtemplateを返す、ねこの種類は後で増やす予定
 def get_prompt_by_cat_id(cat_id: CatId) -> str:
     return moko_template
+
+
+# ねこが住んでいる地域のタイムゾーン、このタイムゾーンの現在日時はtoolsを使わずにプロンプトに含める
+default_timezone = "Asia/Tokyo"
+
+weekdays = ("月", "火", "水", "木", "金", "土", "日")
+
+
+# 毎回内容が変わるので、OpenAIのPrompt Cachingが効くように会話履歴より後ろに配置する前提
+# 分単位に丸めているので同じ1分間のリクエストでは同じ文字列になる
+def create_datetime_context_prompt(now: datetime) -> str:
+    now = now.astimezone(ZoneInfo(default_timezone)).replace(second=0, microsecond=0)
+
+    return "# Context\n- 現在日時（{timezone}）: {datetime}（{weekday}曜日）".format(
+        timezone=default_timezone,
+        datetime=now.isoformat(),
+        weekday=weekdays[now.weekday()],
+    )
@@ -1,5 +1,5 @@
 from typing import Protocol, List, TypedDict
-from collections.abc import AsyncIterator
+from collections.abc import AsyncGenerator
 from domain.message import ChatMessage
 from domain.cat import CatId
 
@@ -18,4 +18,7 @@ class GenerateMessageForGuestUserResult(TypedDict):
 class CatMessageRepositoryInterface(Protocol):
     def generate_message_for_guest_user(
         self, dto: GenerateMessageForGuestUserDto
-    ) -> AsyncIterator[GenerateMessageForGuestUserResult]: ...
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]: ...
+
+    # クライアントが切断した場合に生成中のストリーミングを中断する
+    async def cancel_generation(self) -> None: ...
@@ -9,7 +9,7 @@ class CreateMessagesWithConversationHistoryDto(TypedDict):
     cat_id: CatId
 
 
-class SaveGuestUsersConversationHistoryDto(TypedDict):
+class SaveGuestUsersConversationHistoryDtoRequiredType(TypedDict):
     conversation_id: str
     cat_id: CatId
     user_id: str
@@ -17,6 +17,18 @@ class SaveGuestUsersConversationHistoryDto(TypedDict):
     ai_message: str
 
 
+class SaveGuestUsersConversationHistoryDtoOptionalType(TypedDict, total=False):
+    # クライアントの切断により途中で生成を中断した応答の場合はTrue
+    ai_message_truncated: bool
+
+
+class SaveGuestUsersConversationHistoryDto(
+    SaveGuestUsersConversationHistoryDtoRequiredType,
+    SaveGuestUsersConversationHistoryDtoOptionalType,
+):
+    pass
+
+
 class GuestUsersConversationHistoryRepositoryInterface(Protocol):
     async def create_messages_with_conversation_history(
         self, dto: CreateMessagesWithConversationHistoryDto
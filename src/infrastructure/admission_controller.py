@@ -0,0 +1,197 @@
+import os
+import asyncio
+from collections import OrderedDict, deque
+from typing import Deque, Optional, TypedDict
+
+
+class AdmissionControlConfig(TypedDict):
+    # 同時に実行するOpenAIのストリーミングの上限、adaptive_enabledの場合は上限値として扱う
+    max_concurrency: int
+    min_concurrency: int
+    # 待ちのリクエストの上限、超えた場合は待たせずに拒否する
+    max_queue_size: int
+    # これ以上待つ事になる場合は拒否する
+    queue_timeout_seconds: float
+    # 最初のトークンまでの時間（TTFT）を見て同時実行数を調整する
+    adaptive_enabled: bool
+    target_ttft_seconds: float
+
+
+def is_admission_control_enabled() -> bool:
+    return os.getenv("ADMISSION_CONTROL_ENABLED", "0") == "1"
+
+
+def create_admission_control_config() -> AdmissionControlConfig:
+    return AdmissionControlConfig(
+        max_concurrency=int(os.getenv("ADMISSION_CONTROL_MAX_CONCURRENCY", "32")),
+        min_concurrency=int(os.getenv("ADMISSION_CONTROL_MIN_CONCURRENCY", "4")),
+        max_queue_size=int(os.getenv("ADMISSION_CONTROL_MAX_QUEUE_SIZE", "256")),
+        queue_timeout_seconds=float(
+            os.getenv("ADMISSION_CONTROL_QUEUE_TIMEOUT_SECONDS", "5")
+        ),
+        adaptive_enabled=os.getenv("ADMISSION_CONTROL_ADAPTIVE_ENABLED", "0") == "1",
+        target_ttft_seconds=float(
+            os.getenv("ADMISSION_CONTROL_TARGET_TTFT_SECONDS", "1.5")
+        ),
+    )
+
+
+class AdmissionRejectedError(Exception):
+    pass
+
+
+class AdmissionControlMetricsSnapshot(TypedDict):
+    concurrency_limit: int
+    in_flight: int
+    queue_depth: int
+    admitted_count: int
+    # 待ちが発生したリクエストの数
+    queued_count: int
+    rejected_count: int
+    queue_wait_seconds_total: float
+    max_queue_wait_seconds: float
+
+
+# 実行枠を確保した事を表す、ストリーミングが終わったらreleaseを呼び出す
+class AdmissionTicket:
+    def __init__(self, controller: "AdmissionController", wait_seconds: float) -> None:
+        self.controller = controller
+        self.wait_seconds = wait_seconds
+        self._acquired_at = asyncio.get_running_loop().time()
+        self._released = False
+
+    # 複数回呼び出されても1度だけ枠を返却する
+    def release(self) -> None:
+        if self._released:
+            return
+
+        self._released = True
+        self.controller._release(asyncio.get_running_loop().time() - self._acquired_at)
+
+
+# OpenAIへのリクエストの同時実行数を制限する、待ちのリクエストはuser_id毎に順番に実行枠を割り当てる
+class AdmissionController:
+    def __init__(self, config: AdmissionControlConfig) -> None:
+        self.config = config
+        self._limit = float(config["max_concurrency"])
+        self._in_flight = 0
+        # user_id毎の待ち行列、先頭のユーザーから1件ずつ割り当てて末尾に回す
+        self._waiters: OrderedDict[str, Deque[asyncio.Future[None]]] = OrderedDict()
+        self._queue_depth = 0
+        # 1リクエストあたりの実行時間の移動平均、待ち時間の見積もりに利用する
+        self._service_seconds: Optional[float] = None
+        self.admitted_count = 0
+        self.queued_count = 0
+        self.rejected_count = 0
+        self.queue_wait_seconds_total = 0.0
+        self.max_queue_wait_seconds = 0.0
+
+    @property
+    def concurrency_limit(self) -> int:
+        return max(1, int(self._limit))
+
+    async def acquire(self, user_id: str) -> AdmissionTicket:
+        if self._in_flight < self.concurrency_limit and self._queue_depth == 0:
+            self._in_flight += 1
+            return self._admit(0.0)
+
+        if (
+            self._queue_depth >= self.config["max_queue_size"]
+            or self._estimate_wait_seconds() > self.config["queue_timeout_seconds"]
+        ):
+            self.rejected_count += 1
+            raise AdmissionRejectedError("too many requests are waiting")
+
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        future: asyncio.Future[None] = loop.create_future()
+        self._waiters.setdefault(user_id, deque()).append(future)
+        self._queue_depth += 1
+        self.queued_count += 1
+
+        try:
+            await asyncio.wait_for(future, self.config["queue_timeout_seconds"])
+        except (TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # タイムアウトと同時に実行枠が割り当てられていた場合は返却する
+                self._release(None)
+            else:
+                self._remove_waiter(user_id, future)
+            if isinstance(e, TimeoutError):
+                self.rejected_count += 1
+                raise AdmissionRejectedError("queue timeout exceeded") from e
+            raise
+
+        return self._admit(loop.time() - started_at)
+
+    # 最初のトークンまでの時間が目標を超えた場合は同時実行数を減らし、収まっている場合は少しずつ増やす
+    def record_ttft(self, ttft_seconds: float) -> None:
+        if not self.config["adaptive_enabled"]:
+            return
+
+        if ttft_seconds > self.config["target_ttft_seconds"]:
+            self._limit = max(float(self.config["min_concurrency"]), self._limit * 0.9)
+        else:
+            self._limit = min(
+                float(self.config["max_concurrency"]), self._limit + 1 / self._limit
+            )
+            self._dispatch()
+
+    def _admit(self, wait_seconds: float) -> AdmissionTicket:
+        self.admitted_count += 1
+        self.queue_wait_seconds_total += wait_seconds
+        self.max_queue_wait_seconds = max(self.max_queue_wait_seconds, wait_seconds)
+        return AdmissionTicket(self, wait_seconds)
+
+    def _estimate_wait_seconds(self) -> float:
+        if self._service_seconds is None:
+            return 0.0
+        return (self._queue_depth + 1) * self._service_seconds / self.concurrency_limit
+
+    def _release(self, service_seconds: Optional[float]) -> None:
+        self._in_flight -= 1
+        if service_seconds is not None:
+            self._service_seconds = (
+                service_seconds
+                if self._service_seconds is None
+                else self._service_seconds * 0.9 + service_seconds * 0.1
+            )
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._in_flight < self.concurrency_limit and self._waiters:
+            user_id, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+            self._queue_depth -= 1
+            if waiters:
+                self._waiters.move_to_end(user_id)
+            else:
+                del self._waiters[user_id]
+
+            if future.done():
+                continue
+
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _remove_waiter(self, user_id: str, future: asyncio.Future[None]) -> None:
+        waiters = self._waiters.get(user_id)
+        if waiters is None or future not in waiters:
+            return
+
+        waiters.remove(future)
+        self._queue_depth -= 1
+        if not waiters:
+            del self._waiters[user_id]
+
+    def snapshot(self) -> AdmissionControlMetricsSnapshot:
+        return AdmissionControlMetricsSnapshot(
+            concurrency_limit=self.concurrency_limit,
+            in_flight=self._in_flight,
+            queue_depth=self._queue_depth,
+            admitted_count=self.admitted_count,
+            queued_count=self.queued_count,
+            rejected_count=self.rejected_count,
+            queue_wait_seconds_total=self.queue_wait_seconds_total,
+            max_queue_wait_seconds=self.max_queue_wait_seconds,
+        )
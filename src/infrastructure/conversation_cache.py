@@ -0,0 +1,160 @@
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import List, Optional, TypedDict
+
+# 会話履歴として利用する直近の会話の数、DBから取得する際のLIMITと同じ値にする
+conversation_history_window_size = 10
+
+# dictやlistなど文字列以外のオブジェクトのサイズの概算（1往復の会話あたり）
+conversation_turn_overhead_bytes = 400
+
+
+class ConversationCacheConfig(TypedDict):
+    ttl_seconds: float
+    # キャッシュ全体で利用するメモリの上限（バイト）、超えた場合は最も使われていない会話から削除する
+    max_bytes: int
+
+
+def is_conversation_cache_enabled() -> bool:
+    return os.getenv("CONVERSATION_CACHE_ENABLED", "0") == "1"
+
+
+def create_conversation_cache_config() -> ConversationCacheConfig:
+    return ConversationCacheConfig(
+        ttl_seconds=float(os.getenv("CONVERSATION_CACHE_TTL_SECONDS", "600")),
+        max_bytes=int(os.getenv("CONVERSATION_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    )
+
+
+class ConversationTurn(TypedDict):
+    user_message: str
+    ai_message: str
+    user_message_token_count: int
+    ai_message_token_count: int
+
+
+class ConversationWindow(TypedDict):
+    # 古い順
+    turns: List[ConversationTurn]
+    # トークン数の上限を超える為にDBから取得しなかった古い会話がある場合はTrue
+    truncated: bool
+
+
+class ConversationCacheEntry(TypedDict):
+    window: ConversationWindow
+    expires_at: float
+    size_bytes: int
+
+
+class ConversationCacheMetricsSnapshot(TypedDict):
+    hit_count: int
+    miss_count: int
+    # キャッシュには存在したが、取得しなかった古い会話が必要になりDBから取得し直した回数
+    fallback_count: int
+    eviction_count: int
+    # DBに問い合わせずに会話履歴を返せた割合
+    hit_ratio: float
+    size: int
+    size_bytes: int
+    max_bytes: int
+
+
+def _calculate_window_size_bytes(window: ConversationWindow) -> int:
+    return sum(
+        sys.getsizeof(turn["user_message"])
+        + sys.getsizeof(turn["ai_message"])
+        + conversation_turn_overhead_bytes
+        for turn in window["turns"]
+    )
+
+
+# 同じプロセスで保存した直近の会話をconversation_id毎に保持して、会話履歴の取得時にDBへの問い合わせを省略する
+class ConversationCache:
+    def __init__(self, config: ConversationCacheConfig) -> None:
+        self.config = config
+        self._entries: OrderedDict[str, ConversationCacheEntry] = OrderedDict()
+        self.size_bytes = 0
+        self.hit_count = 0
+        self.miss_count = 0
+        self.fallback_count = 0
+        self.eviction_count = 0
+
+    def get(self, conversation_id: str) -> Optional[ConversationWindow]:
+        entry = self._entries.get(conversation_id)
+        if entry is None or entry["expires_at"] <= time.monotonic():
+            if entry is not None:
+                self._remove(conversation_id)
+            self.miss_count += 1
+            return None
+
+        self._entries.move_to_end(conversation_id)
+        self.hit_count += 1
+        return entry["window"]
+
+    def record_fallback(self) -> None:
+        self.fallback_count += 1
+
+    def put(self, conversation_id: str, window: ConversationWindow) -> None:
+        if conversation_id in self._entries:
+            self._remove(conversation_id)
+
+        size_bytes = _calculate_window_size_bytes(window)
+        # 1つの会話だけで上限を超える場合はキャッシュしない
+        if size_bytes > self.config["max_bytes"]:
+            return
+
+        self._entries[conversation_id] = {
+            "window": window,
+            "expires_at": time.monotonic() + self.config["ttl_seconds"],
+            "size_bytes": size_bytes,
+        }
+        self.size_bytes += size_bytes
+
+        while self.size_bytes > self.config["max_bytes"]:
+            evicted_conversation_id = next(iter(self._entries))
+            self._remove(evicted_conversation_id)
+            self.eviction_count += 1
+
+    # 会話の保存時に呼び出す、キャッシュに存在しない会話は次回の取得時にDBから読み込む
+    def append_turn(self, conversation_id: str, turn: ConversationTurn) -> None:
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return
+
+        turns = [*entry["window"]["turns"], turn][-conversation_history_window_size:]
+        self.put(
+            conversation_id,
+            {
+                "turns": turns,
+                # 直近の会話だけで取得する範囲が埋まった場合は、取得しなかった古い会話は範囲外になる
+                "truncated": entry["window"]["truncated"]
+                and len(turns) < conversation_history_window_size,
+            },
+        )
+
+    def invalidate(self, conversation_id: str) -> None:
+        if conversation_id in self._entries:
+            self._remove(conversation_id)
+
+    def _remove(self, conversation_id: str) -> None:
+        entry = self._entries.pop(conversation_id)
+        self.size_bytes -= entry["size_bytes"]
+
+    def snapshot(self) -> ConversationCacheMetricsSnapshot:
+        lookup_count = self.hit_count + self.miss_count
+        return ConversationCacheMetricsSnapshot(
+            hit_count=self.hit_count,
+            miss_count=self.miss_count,
+            fallback_count=self.fallback_count,
+            eviction_count=self.eviction_count,
+            hit_ratio=(
+                (self.hit_count - self.fallback_count) / lookup_count
+                if lookup_count
+                else 0.0
+            ),
+            size=len(self._entries),
+            size_bytes=self.size_bytes,
+            max_bytes=self.config["max_bytes"],
+        )
@@ -0,0 +1,312 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Dict, List, Optional, Set, Tuple, TypedDict
+from domain.repository.guest_users_conversation_history_repository_interface import (
+    SaveGuestUsersConversationHistoryDto,
+)
+from infrastructure.conversation_cache import ConversationCache, ConversationTurn
+from infrastructure.tokenizer import Tokenizer
+from log.logger import AppLogger, ConversationHistoryDropLogExtra
+
+
+class ConversationHistoryRecord(SaveGuestUsersConversationHistoryDto):
+    user_message_token_count: int
+    ai_message_token_count: int
+
+
+SaveConversationHistories = Callable[[List[ConversationHistoryRecord]], Awaitable[None]]
+
+# キューに入れた時に採番する連番と会話、同じ内容の会話が続いた場合も区別出来るように連番で識別する
+PendingConversationHistory = Tuple[int, ConversationHistoryRecord]
+
+
+class ConversationHistoryWriterConfig(TypedDict):
+    # キューが一杯の場合は空きが出来るまで保存を待たせる
+    max_queue_size: int
+    # この件数が溜まるか、最初の1件から flush_interval_seconds が経過したらまとめて保存する
+    batch_size: int
+    flush_interval_seconds: float
+    # 保存に失敗した場合のリトライ回数、リトライしても失敗した場合は会話の内容をログに出力して破棄する
+    max_retries: int
+    retry_backoff_seconds: float
+
+
+def is_conversation_history_write_behind_enabled() -> bool:
+    return os.getenv("CONVERSATION_HISTORY_WRITE_BEHIND_ENABLED", "0") == "1"
+
+
+def create_conversation_history_writer_config() -> ConversationHistoryWriterConfig:
+    return ConversationHistoryWriterConfig(
+        max_queue_size=int(
+            os.getenv("CONVERSATION_HISTORY_WRITE_BEHIND_MAX_QUEUE_SIZE", "1000")
+        ),
+        batch_size=int(os.getenv("CONVERSATION_HISTORY_WRITE_BEHIND_BATCH_SIZE", "50")),
+        flush_interval_seconds=float(
+            os.getenv("CONVERSATION_HISTORY_WRITE_BEHIND_FLUSH_INTERVAL_SECONDS", "0.5")
+        ),
+        max_retries=int(
+            os.getenv("CONVERSATION_HISTORY_WRITE_BEHIND_MAX_RETRIES", "3")
+        ),
+        retry_backoff_seconds=float(
+            os.getenv("CONVERSATION_HISTORY_WRITE_BEHIND_RETRY_BACKOFF_SECONDS", "0.5")
+        ),
+    )
+
+
+class ConversationHistoryWriterMetricsSnapshot(TypedDict):
+    queue_depth: int
+    enqueued_count: int
+    flushed_count: int
+    flush_count: int
+    retry_count: int
+    dropped_count: int
+    last_batch_size: int
+    max_batch_size: int
+    # 1回の保存（リトライを含む）にかかった時間
+    last_flush_seconds: float
+    max_flush_seconds: float
+    flush_seconds_total: float
+
+
+# 会話履歴をキューに溜めて、バックグラウンドで複数行のINSERTにまとめて保存する
+class ConversationHistoryWriter:
+    def __init__(
+        self,
+        save: SaveConversationHistories,
+        tokenizer: Tokenizer,
+        config: ConversationHistoryWriterConfig,
+        conversation_cache: Optional[ConversationCache] = None,
+    ) -> None:
+        app_logger = AppLogger()
+        self.logger = app_logger.logger
+        self.save = save
+        self.tokenizer = tokenizer
+        self.config = config
+        self.conversation_cache = conversation_cache
+        self._queue: asyncio.Queue[PendingConversationHistory] = asyncio.Queue(
+            maxsize=config["max_queue_size"]
+        )
+        # キューに入れてからDBに保存し終わるまでの会話を連番毎に保持する、会話履歴の取得時にDBの結果と合わせて利用する
+        self._pending: Dict[str, Dict[int, ConversationHistoryRecord]] = {}
+        self._next_sequence = 0
+        # 会話履歴を取得している会話と保存している会話、同じ会話の取得と保存は同時に行わない
+        self._reading: Dict[str, int] = {}
+        self._flushing: Set[str] = set()
+        self._state_changed = asyncio.Condition()
+        self._worker_task: Optional[asyncio.Task[None]] = None
+        # バッチを集めている間に新しい会話が追加された事、または停止する事をワーカーに通知する
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self.enqueued_count = 0
+        self.flushed_count = 0
+        self.flush_count = 0
+        self.retry_count = 0
+        self.dropped_count = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.flush_seconds_total = 0.0
+
+    def start(self) -> None:
+        if self._worker_task is not None:
+            return
+
+        self._worker_task = asyncio.create_task(self._run())
+
+    async def enqueue(self, dto: SaveGuestUsersConversationHistoryDto) -> None:
+        (
+            user_message_token_count,
+            ai_message_token_count,
+        ) = await self.tokenizer.count_batch_async(
+            [dto["user_message"], dto["ai_message"]]
+        )
+        record = ConversationHistoryRecord(
+            **dto,
+            user_message_token_count=user_message_token_count,
+            ai_message_token_count=ai_message_token_count,
+        )
+
+        sequence = self._next_sequence
+        self._next_sequence += 1
+        self._pending.setdefault(dto["conversation_id"], {})[sequence] = record
+        self.enqueued_count += 1
+
+        if self.conversation_cache is not None:
+            self.conversation_cache.append_turn(
+                dto["conversation_id"], self._to_turn(record)
+            )
+
+        await self._queue.put((sequence, record))
+        self._wakeup.set()
+
+    def pending_turns(self, conversation_id: str) -> List[ConversationTurn]:
+        return [
+            self._to_turn(record)
+            for record in self._pending.get(conversation_id, {}).values()
+        ]
+
+    # DBから会話履歴を取得している間は、同じ会話の保存を開始しないようにする
+    # 保存中の場合は保存し終わるまで待つので、返した会話とDBから取得した会話は重複も欠落もしない
+    @asynccontextmanager
+    async def read_pending_turns(
+        self, conversation_id: str
+    ) -> AsyncIterator[List[ConversationTurn]]:
+        async with self._state_changed:
+            await self._state_changed.wait_for(
+                lambda: conversation_id not in self._flushing
+            )
+            self._reading[conversation_id] = self._reading.get(conversation_id, 0) + 1
+        try:
+            yield self.pending_turns(conversation_id)
+        finally:
+            async with self._state_changed:
+                self._reading[conversation_id] -= 1
+                if self._reading[conversation_id] == 0:
+                    del self._reading[conversation_id]
+                self._state_changed.notify_all()
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _next_batch(self) -> List[PendingConversationHistory]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.config["flush_interval_seconds"]
+
+        while len(batch) < self.config["batch_size"]:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            timeout = deadline - loop.time()
+            if timeout <= 0 or self._closing:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except TimeoutError:
+                break
+
+        return batch
+
+    async def _flush(self, batch: List[PendingConversationHistory]) -> None:
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        records = [record for _, record in batch]
+
+        # 先に保存する会話を知らせて新しい取得を待たせてから、取得中の会話が終わるのを待つ
+        conversation_ids = {record["conversation_id"] for record in records}
+        async with self._state_changed:
+            self._flushing = conversation_ids
+            await self._state_changed.wait_for(
+                lambda: conversation_ids.isdisjoint(self._reading)
+            )
+
+        try:
+            for attempt in range(self.config["max_retries"] + 1):
+                try:
+                    await self.save(records)
+                    self.flushed_count += len(records)
+                    break
+                except Exception:
+                    if attempt < self.config["max_retries"]:
+                        self.retry_count += 1
+                        await asyncio.sleep(
+                            self.config["retry_backoff_seconds"] * 2**attempt
+                        )
+                        continue
+                    self._drop(records)
+
+            self._remove_pending(batch)
+        finally:
+            async with self._state_changed:
+                self._flushing = set()
+                self._state_changed.notify_all()
+
+        self._record_flush(len(batch), loop.time() - started_at)
+
+    # 後から手動で復旧出来るように会話の内容をログに残す
+    def _drop(self, batch: List[ConversationHistoryRecord]) -> None:
+        self.dropped_count += len(batch)
+        for record in batch:
+            self.logger.error(
+                "failed to save the conversation history after retries",
+                exc_info=True,
+                extra=ConversationHistoryDropLogExtra(
+                    conversation_id=record["conversation_id"],
+                    cat_id=record["cat_id"],
+                    user_id=record["user_id"],
+                    user_message=record["user_message"],
+                    ai_message=record["ai_message"],
+                    truncation_exempt=True,
+                ),
+            )
+            if self.conversation_cache is not None:
+                self.conversation_cache.invalidate(record["conversation_id"])
+
+    def _remove_pending(self, batch: List[PendingConversationHistory]) -> None:
+        for sequence, record in batch:
+            records = self._pending.get(record["conversation_id"], {})
+            records.pop(sequence, None)
+            if not records:
+                self._pending.pop(record["conversation_id"], None)
+
+    def _record_flush(self, batch_size: int, flush_seconds: float) -> None:
+        self.flush_count += 1
+        self.last_batch_size = batch_size
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.last_flush_seconds = flush_seconds
+        self.max_flush_seconds = max(self.max_flush_seconds, flush_seconds)
+        self.flush_seconds_total += flush_seconds
+
+    def snapshot(self) -> ConversationHistoryWriterMetricsSnapshot:
+        return ConversationHistoryWriterMetricsSnapshot(
+            queue_depth=self._queue.qsize(),
+            enqueued_count=self.enqueued_count,
+            flushed_count=self.flushed_count,
+            flush_count=self.flush_count,
+            retry_count=self.retry_count,
+            dropped_count=self.dropped_count,
+            last_batch_size=self.last_batch_size,
+            max_batch_size=self.max_batch_size,
+            last_flush_seconds=self.last_flush_seconds,
+            max_flush_seconds=self.max_flush_seconds,
+            flush_seconds_total=self.flush_seconds_total,
+        )
+
+    # キューに残っている会話を全て保存してからワーカーを停止する
+    async def aclose(self) -> None:
+        if self._worker_task is None:
+            return
+
+        # 停止時はflush_interval_secondsを待たずに保存する
+        self._closing = True
+        self._wakeup.set()
+        await self._queue.join()
+
+        self._worker_task.cancel()
+        try:
+            await self._worker_task
+        except asyncio.CancelledError:
+            pass
+        self._worker_task = None
+
+    @staticmethod
+    def _to_turn(record: ConversationHistoryRecord) -> ConversationTurn:
+        return {
+            "user_message": record["user_message"],
+            "ai_message": record["ai_message"],
+            "user_message_token_count": record["user_message_token_count"],
+            "ai_message_token_count": record["ai_message_token_count"],
+        }
@@ -2,24 +2,157 @@ import os
 import ssl
 import asyncio
 import aiomysql
-from aiomysql import Connection
+from typing import Optional, TypedDict
+from aiomysql import Connection, Pool
+from log.metrics import db_connect_seconds
 
 ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
 ctx.load_verify_locations(cafile=os.getenv("SSL_CERT_PATH"))
 
 
+def get_db_port() -> int:
+    return int(os.getenv("DB_PORT", "3306"))
+
+
+# 負荷試験でローカルのMySQLに接続する場合のみ無効にする
+def get_db_ssl_context() -> Optional[ssl.SSLContext]:
+    if os.getenv("DB_SSL_ENABLED", "1") == "1":
+        return ctx
+    return None
+
+
 async def create_db_connection() -> Connection:
     loop = asyncio.get_event_loop()
 
-    connection = await aiomysql.connect(
+    with db_connect_seconds.time():
+        connection = await aiomysql.connect(
+            host=os.getenv("DB_HOST"),
+            port=get_db_port(),
+            user=os.getenv("DB_USERNAME"),
+            password=os.getenv("DB_PASSWORD"),
+            db=os.getenv("DB_NAME"),
+            loop=loop,
+            cursorclass=aiomysql.DictCursor,
+            ssl=get_db_ssl_context(),
+        )
+
+    return connection
+
+
+class DbPoolConfig(TypedDict):
+    min_size: int
+    max_size: int
+    # この秒数以上使われていないコネクションはPool側で破棄して作り直す
+    recycle_seconds: int
+    # この秒数以上アイドルだったコネクションはacquire時にpingで生存確認する
+    health_check_interval_seconds: float
+
+
+def is_db_pool_enabled() -> bool:
+    return os.getenv("DB_POOL_ENABLED", "1") == "1"
+
+
+def create_db_pool_config() -> DbPoolConfig:
+    return DbPoolConfig(
+        min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+        max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+        recycle_seconds=int(os.getenv("DB_POOL_RECYCLE_SECONDS", "300")),
+        health_check_interval_seconds=float(
+            os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL_SECONDS", "30")
+        ),
+    )
+
+
+async def create_db_pool(config: DbPoolConfig) -> Pool:
+    pool = await aiomysql.create_pool(
+        minsize=config["min_size"],
+        maxsize=config["max_size"],
+        pool_recycle=config["recycle_seconds"],
         host=os.getenv("DB_HOST"),
-        port=3306,
+        port=get_db_port(),
         user=os.getenv("DB_USERNAME"),
         password=os.getenv("DB_PASSWORD"),
         db=os.getenv("DB_NAME"),
-        loop=loop,
         cursorclass=aiomysql.DictCursor,
-        ssl=ctx,
+        ssl=get_db_ssl_context(),
+        # autocommit=Falseだと参照クエリだけでもトランザクション中と判定され、返却時にPoolがコネクションを破棄してしまう
+        # 書き込みはDbHandlerのbeginで明示的にトランザクションを開始する
+        autocommit=True,
     )
 
+    return pool
+
+
+class DbPoolMetricsSnapshot(TypedDict):
+    acquire_count: int
+    acquire_wait_seconds_total: float
+    acquire_wait_seconds_max: float
+    health_check_failure_count: int
+    size: int
+    free_size: int
+    in_use: int
+    max_size: int
+    # 利用中のコネクション数 / 最大コネクション数
+    saturation: float
+
+
+class DbPoolMetrics:
+    def __init__(self) -> None:
+        self.acquire_count = 0
+        self.acquire_wait_seconds_total = 0.0
+        self.acquire_wait_seconds_max = 0.0
+        self.health_check_failure_count = 0
+
+    def record_acquire(self, wait_seconds: float) -> None:
+        self.acquire_count += 1
+        self.acquire_wait_seconds_total += wait_seconds
+        if wait_seconds > self.acquire_wait_seconds_max:
+            self.acquire_wait_seconds_max = wait_seconds
+
+    def record_health_check_failure(self) -> None:
+        self.health_check_failure_count += 1
+
+    def snapshot(self, pool: Pool) -> DbPoolMetricsSnapshot:
+        in_use = pool.size - pool.freesize
+        return DbPoolMetricsSnapshot(
+            acquire_count=self.acquire_count,
+            acquire_wait_seconds_total=self.acquire_wait_seconds_total,
+            acquire_wait_seconds_max=self.acquire_wait_seconds_max,
+            health_check_failure_count=self.health_check_failure_count,
+            size=pool.size,
+            free_size=pool.freesize,
+            in_use=in_use,
+            max_size=pool.maxsize,
+            saturation=in_use / pool.maxsize if pool.maxsize else 0.0,
+        )
+
+
+db_pool_metrics = DbPoolMetrics()
+
+
+async def acquire_db_connection(
+    pool: Pool, health_check_interval_seconds: float
+) -> Connection:
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+
+    while True:
+        connection = await pool.acquire()
+
+        # 長時間アイドルだったコネクションはサーバー側で切断されている可能性があるので確認する
+        if loop.time() - connection.last_usage <= health_check_interval_seconds:
+            break
+
+        try:
+            await connection.ping(reconnect=False)
+            break
+        except Exception:
+            db_pool_metrics.record_health_check_failure()
+            connection.close()
+            pool.release(connection)
+
+    wait_seconds = loop.time() - started_at
+    db_pool_metrics.record_acquire(wait_seconds)
+    db_connect_seconds.observe(wait_seconds)
+
     return connection
@@ -0,0 +1,259 @@
+import os
+import re
+import json
+import math
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Literal, Optional, Tuple, TypedDict
+
+# no_tools: toolsは不要なのでtoolsの利用要否の判定を省略出来る
+# needs_tools: toolsが必要な事が明らか
+# unsure: 判断出来ないのでLLMに判定させる
+Intent = Literal["no_tools", "needs_tools", "unsure"]
+
+# IGNORECASEを指定すると長いメッセージで1ms以上かかるので、判定前にcasefoldして小文字のキーワードと照合する
+# これらが含まれている場合はtoolsが必要な事がほぼ確実
+strong_tool_keywords = re.compile(
+    r"天気|気温|降水|天候|予報|何時|何日|何曜|日付|時刻|"
+    r"weather|temperature|forecast|what time|what day|what date|current date"
+)
+
+# これらが含まれている場合はtoolsが必要な可能性がある
+weak_tool_keywords = re.compile(
+    r"今日|明日|今|雨|晴|雪|曇|寒|暑|傘|台風|湿度|時間|曜日|"
+    r"\b(today|tomorrow|now|time|date|rain|snow|sunny|cloudy|hot|cold|humid)\b"
+)
+
+# これより長いメッセージはキーワードの照合だけで1msを超える事があり、雑談とも限らないのでLLMに判定させる
+max_message_length = 1000
+
+# n-gramのモデルでは先頭と末尾の一部だけを利用する
+model_text_head_length = 200
+model_text_tail_length = 200
+
+default_intent_classifier_model_path = (
+    Path(__file__).parent / "data" / "intent_classifier_model.json"
+)
+
+
+class IntentClassifierModel(TypedDict):
+    ngram_min: int
+    ngram_max: int
+    # needs_tools, no_toolsそれぞれの事前確率の対数
+    log_priors: Dict[str, float]
+    # needs_tools, no_toolsそれぞれの文字n-gramの尤度の対数
+    log_likelihoods: Dict[str, Dict[str, float]]
+    # 学習データに存在しなかったn-gramの尤度の対数
+    unknown_log_likelihoods: Dict[str, float]
+
+
+class LabelledMessage(TypedDict):
+    message: str
+    label: Literal["no_tools", "needs_tools"]
+
+
+class IntentClassifierEvaluation(TypedDict):
+    total: int
+    # needs_toolsと判定されたもののうち実際にtoolsが必要だった割合
+    needs_tools_precision: float
+    needs_tools_recall: float
+    # no_toolsと判定されたもののうち実際にtoolsが不要だった割合、ここが低いとtoolsが使われず回答の品質が下がる
+    no_tools_precision: float
+    no_tools_recall: float
+    # LLMの判定にフォールバックした割合
+    unsure_rate: float
+
+
+def extract_char_ngrams(text: str, ngram_min: int, ngram_max: int) -> List[str]:
+    text = text.casefold()
+    if len(text) > model_text_head_length + model_text_tail_length:
+        text = text[:model_text_head_length] + text[-model_text_tail_length:]
+
+    return [
+        text[i : i + n]
+        for n in range(ngram_min, ngram_max + 1)
+        for i in range(len(text) - n + 1)
+    ]
+
+
+def train_intent_classifier_model(
+    labelled_messages: Iterable[LabelledMessage],
+    ngram_min: int = 1,
+    ngram_max: int = 3,
+    min_count: int = 2,
+) -> IntentClassifierModel:
+    labels = ("needs_tools", "no_tools")
+    document_counts: Counter[str] = Counter()
+    ngram_counts: Dict[str, Counter[str]] = {label: Counter() for label in labels}
+
+    for labelled_message in labelled_messages:
+        document_counts[labelled_message["label"]] += 1
+        ngram_counts[labelled_message["label"]].update(
+            extract_char_ngrams(labelled_message["message"], ngram_min, ngram_max)
+        )
+
+    total_counts: Counter[str] = ngram_counts["needs_tools"] + ngram_counts["no_tools"]
+    # 出現回数の少ないn-gramはモデルのサイズを小さくする為に除外する
+    vocabulary = {ngram for ngram, count in total_counts.items() if count >= min_count}
+    total_documents = sum(document_counts.values())
+
+    log_priors: Dict[str, float] = {}
+    log_likelihoods: Dict[str, Dict[str, float]] = {}
+    unknown_log_likelihoods: Dict[str, float] = {}
+
+    for label in labels:
+        # ラプラス平滑化
+        denominator = (
+            sum(ngram_counts[label][ngram] for ngram in vocabulary)
+            + len(vocabulary)
+            + 1
+        )
+        log_priors[label] = math.log(
+            (document_counts[label] + 1) / (total_documents + len(labels))
+        )
+        log_likelihoods[label] = {
+            ngram: math.log((ngram_counts[label][ngram] + 1) / denominator)
+            for ngram in vocabulary
+        }
+        unknown_log_likelihoods[label] = math.log(1 / denominator)
+
+    return IntentClassifierModel(
+        ngram_min=ngram_min,
+        ngram_max=ngram_max,
+        log_priors=log_priors,
+        log_likelihoods=log_likelihoods,
+        unknown_log_likelihoods=unknown_log_likelihoods,
+    )
+
+
+class IntentClassifier:
+    def __init__(
+        self,
+        model: Optional[IntentClassifierModel] = None,
+        needs_tools_threshold: float = 0.9,
+        no_tools_threshold: float = 0.1,
+    ) -> None:
+        self.model = model
+        self.needs_tools_threshold = needs_tools_threshold
+        self.no_tools_threshold = no_tools_threshold
+        self.intent_counts: Counter[Intent] = Counter()
+
+    # messageは判定対象のユーザーのメッセージ、contextは直前の会話
+    # 「大阪は？」のように直前の会話がtoolsを使う内容だった場合の続きの質問はLLMに判定させる
+    def classify(self, message: str, context: Iterable[str] = ()) -> Intent:
+        intent = self._classify(message, context)
+        self.intent_counts[intent] += 1
+        return intent
+
+    def _classify(self, message: str, context: Iterable[str]) -> Intent:
+        if len(message) > max_message_length:
+            return "unsure"
+
+        message = message.casefold()
+
+        if strong_tool_keywords.search(message):
+            return "needs_tools"
+
+        if weak_tool_keywords.search(message):
+            return "unsure"
+
+        if any(
+            strong_tool_keywords.search(text) or weak_tool_keywords.search(text)
+            for text in map(str.casefold, context)
+        ):
+            return "unsure"
+
+        # モデルが無い場合はキーワードが無いだけでtoolsが不要とは判断出来ないので、LLMに判定させる
+        if self.model is None:
+            return "unsure"
+
+        probability = self.predict_needs_tools_probability(message)
+        if probability >= self.needs_tools_threshold:
+            return "needs_tools"
+        if probability <= self.no_tools_threshold:
+            return "no_tools"
+        return "unsure"
+
+    def predict_needs_tools_probability(self, message: str) -> float:
+        if self.model is None:
+            return 0.0
+
+        model = self.model
+        scores: Dict[str, float] = {}
+        ngrams = extract_char_ngrams(message, model["ngram_min"], model["ngram_max"])
+        for label, log_prior in model["log_priors"].items():
+            log_likelihoods = model["log_likelihoods"][label]
+            unknown = model["unknown_log_likelihoods"][label]
+            scores[label] = log_prior + sum(
+                log_likelihoods.get(ngram, unknown) for ngram in ngrams
+            )
+
+        # 2クラスなのでスコアの差をシグモイド関数に通すと確率になる
+        diff = scores["no_tools"] - scores["needs_tools"]
+        if diff > 700:
+            return 0.0
+        return 1 / (1 + math.exp(diff))
+
+    @classmethod
+    def load(
+        cls, path: Path = default_intent_classifier_model_path
+    ) -> "IntentClassifier":
+        if not path.exists():
+            return cls()
+
+        with path.open(encoding="utf-8") as file:
+            model: IntentClassifierModel = json.load(file)
+
+        return cls(model)
+
+
+def is_intent_classifier_enabled() -> bool:
+    return os.getenv("INTENT_CLASSIFIER_ENABLED", "0") == "1"
+
+
+# プロセス内で1度だけ読み込む
+@lru_cache(maxsize=1)
+def get_intent_classifier() -> IntentClassifier:
+    model_path = os.getenv("INTENT_CLASSIFIER_MODEL_PATH")
+    if model_path:
+        return IntentClassifier.load(Path(model_path))
+    return IntentClassifier.load()
+
+
+def _precision_recall(
+    results: List[Tuple[str, Intent]], label: str
+) -> Tuple[float, float]:
+    true_positive = sum(
+        1 for expected, actual in results if expected == label and actual == label
+    )
+    predicted = sum(1 for _, actual in results if actual == label)
+    relevant = sum(1 for expected, _ in results if expected == label)
+
+    precision = true_positive / predicted if predicted else 0.0
+    recall = true_positive / relevant if relevant else 0.0
+    return precision, recall
+
+
+def evaluate_intent_classifier(
+    classifier: IntentClassifier, labelled_messages: Iterable[LabelledMessage]
+) -> IntentClassifierEvaluation:
+    results: List[Tuple[str, Intent]] = [
+        (labelled_message["label"], classifier.classify(labelled_message["message"]))
+        for labelled_message in labelled_messages
+    ]
+
+    needs_tools_precision, needs_tools_recall = _precision_recall(
+        results, "needs_tools"
+    )
+    no_tools_precision, no_tools_recall = _precision_recall(results, "no_tools")
+    unsure_count = sum(1 for _, actual in results if actual == "unsure")
+
+    return IntentClassifierEvaluation(
+        total=len(results),
+        needs_tools_precision=needs_tools_precision,
+        needs_tools_recall=needs_tools_recall,
+        no_tools_precision=no_tools_precision,
+        no_tools_recall=no_tools_recall,
+        unsure_rate=unsure_count / len(results) if results else 0.0,
+    )
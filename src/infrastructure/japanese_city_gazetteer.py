@@ -0,0 +1,225 @@
+import re
+import unicodedata
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, TypedDict
+
+default_gazetteer_path = Path(__file__).parent / "data" / "japanese_cities.tsv"
+
+# scripts/build_japanese_city_gazetteer.py で生成する全市区町村のデータ
+# 別名を持つ主要な都市のデータ（japanese_cities.tsv）を優先し、存在する場合のみ追加で読み込む
+default_municipalities_path = (
+    Path(__file__).parent / "data" / "japanese_municipalities.tsv"
+)
+
+# 同じ名前で異なる市区町村が登録されている事を表す
+# 誤った地点の天気を返さないように、この名前はジオコーディングAPIに任せる
+ambiguous_position = -1
+
+# 長音記号付きのローマ字は長音を残したまま展開する（Ōno → Ouno, Ono とは区別する）
+long_vowels = {
+    "ā": "aa",
+    "ī": "ii",
+    "ū": "uu",
+    "ē": "ee",
+    "ō": "ou",
+    "â": "aa",
+    "î": "ii",
+    "û": "uu",
+    "ê": "ee",
+    "ô": "ou",
+}
+
+# 「Osaka City」「Osaka-shi」のように区切り文字の後ろに付いている場合のみ取り除く
+romaji_suffixes = {
+    "city",
+    "shi",
+    "ku",
+    "ward",
+    "town",
+    "machi",
+    "cho",
+    "village",
+    "mura",
+    "prefecture",
+    "pref",
+    "ken",
+    "fu",
+    "to",
+}
+
+kanji_suffixes = ("市", "区", "町", "村", "都", "道", "府", "県")
+
+
+class GeoCoordinates(TypedDict):
+    lat: float
+    lon: float
+
+
+def _katakana_to_hiragana(value: str) -> str:
+    return "".join(
+        chr(ord(char) - 0x60) if "ァ" <= char <= "ヶ" else char for char in value
+    )
+
+
+def _remove_latin_diacritics(value: str) -> str:
+    chars = []
+    for char in value:
+        if char in long_vowels:
+            chars.append(long_vowels[char])
+            continue
+
+        decomposed = unicodedata.normalize("NFKD", char)
+        # 「が」の濁点のようなかなの結合文字は残し、ローマ字の記号だけを取り除く
+        if decomposed[0].isascii():
+            chars.append("".join(c for c in decomposed if not unicodedata.combining(c)))
+        else:
+            chars.append(char)
+
+    return "".join(chars)
+
+
+def normalize_city_name(value: str) -> str:
+    # 「Tokyo, Japan」「Tokyo,jp」のような形式の場合は都市名の部分だけを利用する
+    value = unicodedata.normalize("NFKC", value).split(",")[0].strip().casefold()
+    value = _remove_latin_diacritics(value)
+    value = _katakana_to_hiragana(value)
+    return re.sub(r"[\s\-'.・]", "", value)
+
+
+def _collapse_long_vowels(key: str) -> Optional[str]:
+    if not key.isascii():
+        return None
+
+    # Toukyou, Tookyoのような長音の表記揺れを吸収する
+    # Ono（小野）とOono（大野）のように区別が無くなる為、完全一致の索引に無い場合のみ利用する
+    return key.replace("ou", "o").replace("oo", "o").replace("uu", "u")
+
+
+def _strip_suffix(value: str) -> Optional[str]:
+    value = unicodedata.normalize("NFKC", value).split(",")[0].strip()
+
+    tokens = re.split(r"[\s\-]+", value)
+    if len(tokens) > 1 and tokens[-1].casefold() in romaji_suffixes:
+        return " ".join(tokens[:-1])
+
+    if len(value) > 1 and value.endswith(kanji_suffixes):
+        return value[:-1]
+
+    return None
+
+
+# 日本の市区町村名（漢字・かな・ローマ字）から緯度経度を引く為のインメモリの索引
+class JapaneseCityGazetteer:
+    def __init__(self) -> None:
+        self._index: Dict[str, int] = {}
+        # 長音の表記揺れを吸収した名前の索引
+        self._loose_index: Dict[str, int] = {}
+        # 先に読み込んだファイルに登録済みの名前で、後から読み込むファイルで上書きしない
+        self._preferred_keys: Set[str] = set()
+        self._preferred_loose_keys: Set[str] = set()
+        self._lats = array("d")
+        self._lons = array("d")
+
+    def _register(
+        self, index: Dict[str, int], preferred_keys: Set[str], key: str, position: int
+    ) -> None:
+        if key in preferred_keys:
+            return
+
+        registered_position = index.setdefault(key, position)
+        if registered_position != position:
+            index[key] = ambiguous_position
+
+    def add(self, names: List[str], lat: float, lon: float) -> None:
+        position = len(self._lats)
+        self._lats.append(lat)
+        self._lons.append(lon)
+
+        for name in names:
+            keys = {normalize_city_name(name)}
+            stripped_name = _strip_suffix(name)
+            if stripped_name is not None:
+                keys.add(normalize_city_name(stripped_name))
+            for key in keys:
+                if not key:
+                    continue
+                self._register(self._index, self._preferred_keys, key, position)
+                loose_key = _collapse_long_vowels(key)
+                if loose_key is not None:
+                    self._register(
+                        self._loose_index,
+                        self._preferred_loose_keys,
+                        loose_key,
+                        position,
+                    )
+
+    def _prefer_registered_names(self) -> None:
+        self._preferred_keys.update(self._index)
+        self._preferred_loose_keys.update(self._loose_index)
+
+    def _find_position(self, city_name: str) -> Optional[int]:
+        keys = [normalize_city_name(city_name)]
+        stripped_name = _strip_suffix(city_name)
+        if stripped_name is not None:
+            keys.append(normalize_city_name(stripped_name))
+
+        for key in keys:
+            if key in self._index:
+                return self._index[key]
+
+        for key in keys:
+            loose_key = _collapse_long_vowels(key)
+            if loose_key is not None and loose_key in self._loose_index:
+                return self._loose_index[loose_key]
+
+        return None
+
+    def lookup(self, city_name: str) -> Optional[GeoCoordinates]:
+        position = self._find_position(city_name)
+
+        if position is None or position == ambiguous_position:
+            return None
+
+        return {"lat": self._lats[position], "lon": self._lons[position]}
+
+    def __len__(self) -> int:
+        return len(self._lats)
+
+    @classmethod
+    def load(
+        cls,
+        paths: Sequence[Path] = (default_gazetteer_path, default_municipalities_path),
+    ) -> "JapaneseCityGazetteer":
+        gazetteer = cls()
+
+        for path in paths:
+            # 全市区町村のデータは生成していない環境もある為、存在しない場合は読み飛ばす
+            if path != paths[0] and not path.exists():
+                continue
+
+            with path.open(encoding="utf-8") as file:
+                for line in file:
+                    if line.startswith("#") or not line.strip():
+                        continue
+
+                    columns = line.rstrip("\n").split("\t")
+                    kanji, kana, romaji, lat, lon = columns[:5]
+                    aliases = (
+                        columns[5].split(",") if len(columns) > 5 and columns[5] else []
+                    )
+
+                    gazetteer.add(
+                        [kanji, kana, romaji, *aliases], float(lat), float(lon)
+                    )
+
+            gazetteer._prefer_registered_names()
+
+        return gazetteer
+
+
+# プロセス内で1度だけ読み込む
+@lru_cache(maxsize=1)
+def get_japanese_city_gazetteer() -> JapaneseCityGazetteer:
+    return JapaneseCityGazetteer.load()
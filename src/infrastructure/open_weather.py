@@ -0,0 +1,36 @@
+import os
+import math
+import httpx
+from typing import TypedDict
+
+
+# 負荷試験では偽のサーバーのURLを指定する
+def get_open_weather_api_base_url() -> str:
+    return os.getenv("OPEN_WEATHER_API_BASE_URL", "https://api.openweathermap.org")
+
+
+class WeatherObservation(TypedDict):
+    description: str
+    temperature: int
+
+
+async def fetch_current_weather_observation(
+    lat: float, lon: float, api_key: str
+) -> WeatherObservation:
+    async with httpx.AsyncClient() as client:
+        current_weather_response = await client.get(
+            f"{get_open_weather_api_base_url()}/data/2.5/weather",
+            params={
+                "lat": lat,
+                "lon": lon,
+                "units": "metric",
+                "lang": "ja",
+                "appid": api_key,
+            },
+        )
+        current_weather = current_weather_response.json()
+
+        return {
+            "description": current_weather["weather"][0]["description"],
+            "temperature": math.floor(current_weather["main"]["temp"]),
+        }
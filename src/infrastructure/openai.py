@@ -1,15 +1,22 @@
-from typing import Literal
-import tiktoken
+import os
 
+# 回答の生成とtoolsの利用要否の判定に利用するモデル、トークン数の計算にも同じモデルのencodingを利用する
+chat_completion_model = "gpt-4o-2024-08-06"
 
-def calculate_token_count(text: str, model: Literal["gpt-4", "gpt-3.5-turbo"]) -> int:
-    tiktoken_encoding = tiktoken.encoding_for_model(model)
-    encoded = tiktoken_encoding.encode(text)
-    return len(encoded)
 
+# 会話履歴に含める最大トークン数
+max_token_limit = 1000
 
-def is_token_limit_exceeded(use_token: int) -> bool:
-    # 最大トークン数
-    max_token_limit = 1000
 
+def is_token_limit_exceeded(use_token: int) -> bool:
     return use_token > max_token_limit
+
+
+# 有効な場合は現在日時をプロンプトに含め、現在日時を取得するtoolはAsia/Tokyo以外のタイムゾーンの場合のみ利用させる
+def is_datetime_context_enabled() -> bool:
+    return os.getenv("PROMPT_DATETIME_CONTEXT_ENABLED", "0") == "1"
+
+
+# 有効な場合は回答のストリーミングをSDKのモデルに変換せず、レスポンスのbytesから必要な値だけを取り出す
+def is_raw_stream_enabled() -> bool:
+    return os.getenv("OPENAI_RAW_STREAM_ENABLED", "0") == "1"
@@ -0,0 +1,124 @@
+import os
+import asyncio
+import importlib.util
+import httpx
+from logging import Logger, getLogger
+from typing import Optional, TypedDict
+from openai import AsyncOpenAI
+from infrastructure.openai import chat_completion_model
+from infrastructure.tracing import wrap_openai
+
+
+class OpenAiClientConfig(TypedDict):
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry_seconds: float
+    timeout_seconds: float
+    http2: bool
+    # 0以下の場合はkeep-alive用のpingを送信しない
+    keepalive_ping_interval_seconds: float
+
+
+def create_openai_client_config() -> OpenAiClientConfig:
+    return OpenAiClientConfig(
+        max_connections=int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(
+            os.getenv("OPENAI_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")
+        ),
+        keepalive_expiry_seconds=float(
+            os.getenv("OPENAI_HTTP_KEEPALIVE_EXPIRY_SECONDS", "60")
+        ),
+        timeout_seconds=float(os.getenv("OPENAI_HTTP_TIMEOUT_SECONDS", "60")),
+        http2=os.getenv("OPENAI_HTTP2_ENABLED", "0") == "1",
+        keepalive_ping_interval_seconds=float(
+            os.getenv("OPENAI_KEEPALIVE_PING_INTERVAL_SECONDS", "0")
+        ),
+    )
+
+
+# HTTP/2を利用するには h2 packageが必要なので、インストールされていない場合はHTTP/1.1を利用する
+# 依存関係に httpx[http2] を含めているので、通常はインストールされている
+def is_http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+# プロセス全体で1つだけ生成し、OpenAI APIへのコネクションを使い回す
+class SharedOpenAiClient:
+    def __init__(
+        self, config: OpenAiClientConfig, logger: Optional[Logger] = None
+    ) -> None:
+        if logger is None:
+            logger = getLogger()
+        self.config = config
+        self._last_request_at = 0.0
+        self._keepalive_task: Optional[asyncio.Task[None]] = None
+
+        http2 = config["http2"]
+        if http2 and not is_http2_available():
+            # 設定が無視された事に気付けるように警告を出力する
+            logger.warning(
+                "OPENAI_HTTP2_ENABLED is set but the h2 package is not installed, falling back to HTTP/1.1"
+            )
+            http2 = False
+
+        self.http_client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=config["max_connections"],
+                max_keepalive_connections=config["max_keepalive_connections"],
+                keepalive_expiry=config["keepalive_expiry_seconds"],
+            ),
+            timeout=httpx.Timeout(config["timeout_seconds"], connect=5.0),
+            event_hooks={"request": [self._on_request]},
+        )
+
+        self.client = wrap_openai(
+            AsyncOpenAI(
+                api_key=os.environ["OPENAI_API_KEY"],
+                http_client=self.http_client,
+            )
+        )
+
+    async def _on_request(self, request: httpx.Request) -> None:
+        self._last_request_at = asyncio.get_running_loop().time()
+
+    def start_keepalive(self) -> None:
+        interval = self.config["keepalive_ping_interval_seconds"]
+        if interval <= 0 or self._keepalive_task is not None:
+            return
+
+        self._keepalive_task = asyncio.create_task(self._keepalive_loop(interval))
+
+    # アクセスの少ないマシンでもコネクションが切れないように、アイドル時のみ軽量なリクエストを送る
+    async def _keepalive_loop(self, interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if loop.time() - self._last_request_at < interval:
+                continue
+            try:
+                await self._ping()
+            except Exception:
+                # keep-aliveは失敗しても次のリクエスト時に再接続されるだけなので無視する
+                pass
+
+    # 起動時に呼び出し、最初のリクエストの前にOpenAI APIとのコネクション（TLSのハンドシェイク等）を確立しておく
+    async def warmup(self) -> None:
+        await self._ping()
+
+    async def _ping(self) -> None:
+        await self.http_client.get(
+            f"{self.client.base_url}models/{chat_completion_model}",
+            headers={"Authorization": f"Bearer {self.client.api_key}"},
+        )
+
+    async def aclose(self) -> None:
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            try:
+                await self._keepalive_task
+            except asyncio.CancelledError:
+                pass
+            self._keepalive_task = None
+
+        await self.http_client.aclose()
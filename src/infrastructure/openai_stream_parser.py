@@ -0,0 +1,87 @@
+# OpenAIのストリーミングのレスポンス(text/event-stream)を、SDKのChatCompletionChunkを生成せずに読み込む為の関数郡
+# SDKのAsyncStreamと同じ結果になるように、SSEの解釈とエラーの扱いはSDKの実装に合わせている
+import json
+from typing import Any, Dict, List, Optional, Tuple, cast
+from contextlib import aclosing
+from collections.abc import AsyncGenerator, AsyncIterator
+import httpx
+from openai import APIError
+
+# event: の値（指定されていない場合はNone）と data: の値の組
+ServerSentEventFields = Tuple[Optional[bytes], bytes]
+
+
+# 受け取ったbytesを行に分割して、空行毎に1つのイベントとして返す、SDKと同じく空行が届かずに終了した最後のイベントは返さない
+async def iter_server_sent_events(
+    byte_chunks: AsyncIterator[bytes],
+) -> AsyncGenerator[ServerSentEventFields, None]:
+    pending = b""
+    event: Optional[bytes] = None
+    data_lines: List[bytes] = []
+
+    async for byte_chunk in byte_chunks:
+        lines = (pending + byte_chunk).split(b"\n")
+        # 最後の要素は改行が届いていない途中の行なので次のbytesと結合する
+        pending = lines.pop()
+
+        for line in lines:
+            if line.endswith(b"\r"):
+                line = line[:-1]
+
+            if not line:
+                if event is not None or data_lines:
+                    yield event, b"\n".join(data_lines)
+                event = None
+                data_lines = []
+                continue
+
+            if line.startswith(b":"):
+                continue
+
+            field_name, _, value = line.partition(b":")
+            if value.startswith(b" "):
+                value = value[1:]
+
+            if field_name == b"data":
+                data_lines.append(value)
+            elif field_name == b"event":
+                event = value
+
+
+def _raise_if_error(chunk: Any, response: httpx.Response) -> None:
+    if not isinstance(chunk, dict) or not chunk.get("error"):
+        return
+
+    error = chunk["error"]
+    message = error.get("message") if isinstance(error, dict) else None
+    if not message or not isinstance(message, str):
+        message = "An error occurred during streaming"
+
+    raise APIError(message=message, request=response.request, body=error)
+
+
+# Chat Completions APIのchunkをJSONを変換しただけのdictで返す
+async def iter_chat_completion_chunks(
+    response: httpx.Response,
+) -> AsyncGenerator[Dict[str, Any], None]:
+    # 途中で読み込みを止めた場合もイベントを解釈するジェネレーターと、httpxのジェネレーターを閉じる
+    byte_chunks = cast(AsyncGenerator[bytes, None], response.aiter_bytes())
+    async with (
+        aclosing(byte_chunks),
+        aclosing(iter_server_sent_events(byte_chunks)) as events,
+    ):
+        async for event, data in events:
+            if data.startswith(b"[DONE]"):
+                break
+
+            chunk = json.loads(data)
+            if event is None or event == b"error":
+                _raise_if_error(chunk, response)
+
+            # event: を指定したイベントはChat Completions APIでは返らないので、エラー以外は無視する
+            if event is None:
+                yield chunk
+
+        # SDKと同じく最後まで読み込んで、コネクションを再利用出来るようにする
+        async for _ in events:
+            pass
@@ -0,0 +1,45 @@
+import asyncio
+from contextlib import aclosing
+from collections.abc import AsyncGenerator
+from domain.repository.cat_message_repository_interface import (
+    CatMessageRepositoryInterface,
+    GenerateMessageForGuestUserDto,
+    GenerateMessageForGuestUserResult,
+)
+from infrastructure.admission_controller import AdmissionController, AdmissionTicket
+
+
+# AdmissionControllerで確保した実行枠をストリーミングが終わるまで保持し、TTFTを記録する
+class AdmissionControlledCatMessageRepository(CatMessageRepositoryInterface):
+    def __init__(
+        self,
+        repository: CatMessageRepositoryInterface,
+        admission_controller: AdmissionController,
+        ticket: AdmissionTicket,
+    ) -> None:
+        self.repository = repository
+        self.admission_controller = admission_controller
+        self.ticket = ticket
+
+    async def generate_message_for_guest_user(
+        self, dto: GenerateMessageForGuestUserDto
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]:
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        is_first_chunk = True
+
+        try:
+            async with aclosing(
+                self.repository.generate_message_for_guest_user(dto)
+            ) as generated_responses:
+                async for generated_response in generated_responses:
+                    if is_first_chunk:
+                        self.admission_controller.record_ttft(loop.time() - started_at)
+                        is_first_chunk = False
+                    yield generated_response
+        finally:
+            self.ticket.release()
+
+    async def cancel_generation(self) -> None:
+        await self.repository.cancel_generation()
+        self.ticket.release()
@@ -0,0 +1,7 @@
+from typing import Protocol
+from contextlib import AbstractAsyncContextManager
+import aiomysql
+
+
+class AiomysqlConnectionProviderInterface(Protocol):
+    def acquire(self) -> AbstractAsyncContextManager[aiomysql.Connection]: ...
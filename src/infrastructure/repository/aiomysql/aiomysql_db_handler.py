@@ -1,4 +1,6 @@
 import aiomysql
+from contextlib import asynccontextmanager
+from collections.abc import AsyncIterator
 from usecase.db_handler_interface import DbHandlerInterface
 
 
@@ -6,6 +8,10 @@ class AiomysqlDbHandler(DbHandlerInterface):
     def __init__(self, connection: aiomysql.Connection) -> None:
         self.connection = connection
 
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiomysql.Connection]:
+        yield self.connection
+
     async def begin(self) -> None:
         await self.connection.begin()
 
@@ -1,83 +1,292 @@
-from typing import cast, List, Literal
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple, Union
 import aiomysql
-from domain.cat import get_prompt_by_cat_id
+from contextlib import asynccontextmanager
+from collections.abc import AsyncIterator
+from domain.cat import create_datetime_context_prompt, get_prompt_by_cat_id
 from domain.message import ChatMessage
 from domain.repository.guest_users_conversation_history_repository_interface import (
     GuestUsersConversationHistoryRepositoryInterface,
     CreateMessagesWithConversationHistoryDto,
     SaveGuestUsersConversationHistoryDto,
 )
-from infrastructure.openai import calculate_token_count, is_token_limit_exceeded
+from infrastructure.openai import (
+    is_datetime_context_enabled,
+    is_token_limit_exceeded,
+    max_token_limit,
+)
+from infrastructure.conversation_cache import (
+    ConversationCache,
+    ConversationTurn,
+    ConversationWindow,
+    conversation_history_window_size,
+)
+from infrastructure.conversation_history_writer import (
+    ConversationHistoryRecord,
+    ConversationHistoryWriter,
+)
+from infrastructure.tokenizer import Tokenizer, get_tokenizer
+from infrastructure.repository.aiomysql.aiomysql_connection_provider_interface import (
+    AiomysqlConnectionProviderInterface,
+)
+from log.metrics import db_write_seconds, history_read_seconds
+from log.request_timing import RequestTiming, measure_stage
 
 
 class AiomysqlGuestUsersConversationHistoryRepository(
     GuestUsersConversationHistoryRepositoryInterface
 ):
-    def __init__(self, connection: aiomysql.Connection) -> None:
+    def __init__(
+        self,
+        connection: Union[aiomysql.Connection, AiomysqlConnectionProviderInterface],
+        datetime_context_enabled: Optional[bool] = None,
+        tokenizer: Optional[Tokenizer] = None,
+        conversation_cache: Optional[ConversationCache] = None,
+        conversation_history_writer: Optional[ConversationHistoryWriter] = None,
+        request_timing: Optional[RequestTiming] = None,
+    ) -> None:
         self.connection = connection
+        # 会話履歴の取得の内、コネクションの取得とクエリの実行にかかった時間を記録する
+        self.request_timing = request_timing
+        self.conversation_cache = conversation_cache
+        self.conversation_history_writer = conversation_history_writer
+        if tokenizer is None:
+            tokenizer = get_tokenizer()
+        self.tokenizer = tokenizer
+        if datetime_context_enabled is None:
+            datetime_context_enabled = is_datetime_context_enabled()
+        self.datetime_context_enabled = datetime_context_enabled
+
+    # Pool利用時はクエリを実行する間だけコネクションを借りる
+    # timing_stageを指定した場合はPoolからコネクションを取得するまでの時間を記録する
+    @asynccontextmanager
+    async def _acquire(
+        self, timing_stage: Optional[str] = None
+    ) -> AsyncIterator[aiomysql.Connection]:
+        if isinstance(self.connection, aiomysql.Connection):
+            yield self.connection
+            return
+
+        started_at = time.perf_counter()
+        async with self.connection.acquire() as connection:
+            if timing_stage is not None and self.request_timing is not None:
+                self.request_timing.record(
+                    timing_stage, time.perf_counter() - started_at
+                )
+            yield connection
 
     async def create_messages_with_conversation_history(
         self, dto: CreateMessagesWithConversationHistoryDto
     ) -> List[ChatMessage]:
-        async with self.connection.cursor() as cursor:
-            sql = """
-            SELECT user_message, ai_message
-            FROM guest_users_conversation_histories
-            WHERE conversation_id = %s
-            ORDER BY id DESC
-            LIMIT 10
-            """
-            await cursor.execute(sql, (dto["conversation_id"],))
-            result = await cursor.fetchall()
-            if result:
-                result.reverse()
-
-            conversation_history = [
-                {"role": role_type, "content": row[message_type]}
-                for row in result
-                for role_type, message_type in [
-                    ("user", "user_message"),
-                    ("assistant", "ai_message"),
-                ]
-            ]
-
-        # もし会話履歴がまだ存在しなければ、システムメッセージを追加
-        if not conversation_history:
-            conversation_history.append(
-                {"role": "system", "content": get_prompt_by_cat_id(dto["cat_id"])}
-            )
+        started_at = time.perf_counter()
+
+        # 新しいメッセージなど会話履歴以外で利用するトークン数
+        used_tokens = await self.tokenizer.count_async(dto["request_message"])
+
+        datetime_context_prompt = ""
+        if self.datetime_context_enabled:
+            datetime_context_prompt = create_datetime_context_prompt(datetime.now())
+            used_tokens += await self.tokenizer.count_async(datetime_context_prompt)
+
+        conversation_id = dto["conversation_id"]
+        history_messages: Optional[List[ChatMessage]] = None
 
-        # 新しいメッセージを会話履歴に追加
-        conversation_history.append({"role": "user", "content": dto["request_message"]})
-
-        # 実際に会話履歴に含めるメッセージ
-        chat_messages: List[ChatMessage] = []
-        total_tokens = 0
-
-        for message in reversed(conversation_history):
-            message_tokens = calculate_token_count(message["content"], "gpt-3.5-turbo")
-            if is_token_limit_exceeded(total_tokens + message_tokens) and chat_messages:
-                # トークン数が最大を超える場合、ループを抜ける
-                break
-            role = cast(Literal["system", "user", "assistant"], message["role"])
-            chat_messages.insert(0, ChatMessage(role=role, content=message["content"]))
-            total_tokens += message_tokens
-
-        if not any(message["role"] == "system" for message in chat_messages):
-            chat_messages.insert(
-                0, {"role": "system", "content": get_prompt_by_cat_id(dto["cat_id"])}
+        if self.conversation_cache is not None:
+            window = self.conversation_cache.get(conversation_id)
+            if window is not None:
+                history_messages, is_complete = self._select_history_messages(
+                    window, used_tokens
+                )
+                if not is_complete:
+                    # キャッシュに存在しない古い会話がトークン数の上限に収まる可能性があるのでDBから取得し直す
+                    self.conversation_cache.record_fallback()
+                    history_messages = None
+
+        if history_messages is None:
+            window = await self._fetch_conversation_window(
+                conversation_id, max_token_limit - used_tokens
             )
+            if self.conversation_cache is not None:
+                self.conversation_cache.put(conversation_id, window)
+            history_messages, _ = self._select_history_messages(window, used_tokens)
+
+        chat_messages: List[ChatMessage] = [
+            {"role": "system", "content": get_prompt_by_cat_id(dto["cat_id"])},
+            *history_messages,
+        ]
+
+        # システムプロンプトと会話履歴は毎回同じ内容なので、その後ろの新しいメッセージの直前に配置する
+        if datetime_context_prompt:
+            chat_messages.append({"role": "system", "content": datetime_context_prompt})
+
+        chat_messages.append({"role": "user", "content": dto["request_message"]})
+
+        history_read_seconds.observe(time.perf_counter() - started_at)
 
         return chat_messages
 
+    async def _fetch_conversation_window(
+        self, conversation_id: str, history_token_limit: int
+    ) -> ConversationWindow:
+        # キューに入っていてまだDBに保存されていない会話は最も新しい会話として扱う
+        # 取得している間は同じ会話の保存が始まらないので、DBの結果と重複しない
+        async with self._read_pending_turns(conversation_id) as pending_turns:
+            history_token_limit -= sum(
+                turn["user_message_token_count"] + turn["ai_message_token_count"]
+                for turn in pending_turns
+            )
+
+            async with (
+                self._acquire("db") as connection,
+                connection.cursor() as cursor,
+            ):
+                # 新しい順にトークン数を累積し、少なくともai_messageがトークン数の上限に収まる行だけメッセージを取得する
+                # トークン数を保存する前の行はNULLになっているので0として扱い、取得後に計算する
+                sql = """
+                SELECT
+                  CASE
+                    WHEN cumulative_token_count - COALESCE(user_message_token_count, 0) <= %s
+                    THEN user_message
+                  END AS user_message,
+                  CASE
+                    WHEN cumulative_token_count - COALESCE(user_message_token_count, 0) <= %s
+                    THEN ai_message
+                  END AS ai_message,
+                  user_message_token_count,
+                  ai_message_token_count
+                FROM (
+                  SELECT
+                    id,
+                    user_message,
+                    ai_message,
+                    user_message_token_count,
+                    ai_message_token_count,
+                    SUM(
+                      COALESCE(user_message_token_count, 0) + COALESCE(ai_message_token_count, 0)
+                    ) OVER (ORDER BY id DESC) AS cumulative_token_count
+                  FROM guest_users_conversation_histories
+                  WHERE conversation_id = %s
+                  ORDER BY id DESC
+                  LIMIT %s
+                ) AS histories
+                ORDER BY id DESC
+                """
+                with measure_stage(self.request_timing, "db_query"):
+                    await cursor.execute(
+                        sql,
+                        (
+                            history_token_limit,
+                            history_token_limit,
+                            conversation_id,
+                            conversation_history_window_size,
+                        ),
+                    )
+                    result = await cursor.fetchall()
+
+        rows = [row for row in reversed(result) if row["ai_message"] is not None]
+
+        # トークン数が保存されていないメッセージはまとめて計算する
+        uncounted_messages = [
+            (row, column)
+            for row in rows
+            for column in ("user_message", "ai_message")
+            if row[f"{column}_token_count"] is None
+        ]
+        if uncounted_messages:
+            token_counts = await self.tokenizer.count_batch_async(
+                [row[column] for row, column in uncounted_messages]
+            )
+            for (row, column), token_count in zip(uncounted_messages, token_counts):
+                row[f"{column}_token_count"] = token_count
+
+        turns: List[ConversationTurn] = [
+            {
+                "user_message": row["user_message"],
+                "ai_message": row["ai_message"],
+                "user_message_token_count": row["user_message_token_count"],
+                "ai_message_token_count": row["ai_message_token_count"],
+            }
+            for row in rows
+        ]
+
+        if pending_turns:
+            turns = [*turns, *pending_turns][-conversation_history_window_size:]
+
+        return {
+            "turns": turns,
+            "truncated": len(rows) < len(result)
+            and len(turns) < conversation_history_window_size,
+        }
+
+    @asynccontextmanager
+    async def _read_pending_turns(
+        self, conversation_id: str
+    ) -> AsyncIterator[List[ConversationTurn]]:
+        if self.conversation_history_writer is None:
+            yield []
+            return
+
+        async with self.conversation_history_writer.read_pending_turns(
+            conversation_id
+        ) as pending_turns:
+            yield pending_turns
+
+    # 新しい会話からトークン数の上限に収まる所までを会話履歴に含める
+    # 全ての会話が収まったが、取得していない古い会話が存在する場合は2番目の戻り値がFalseになる
+    @staticmethod
+    def _select_history_messages(
+        window: ConversationWindow, used_tokens: int
+    ) -> Tuple[List[ChatMessage], bool]:
+        history_messages: List[ChatMessage] = []
+        total_tokens = used_tokens
+
+        for turn in reversed(window["turns"]):
+            for message, message_tokens in [
+                (
+                    ChatMessage(role="assistant", content=turn["ai_message"]),
+                    turn["ai_message_token_count"],
+                ),
+                (
+                    ChatMessage(role="user", content=turn["user_message"]),
+                    turn["user_message_token_count"],
+                ),
+            ]:
+                if is_token_limit_exceeded(total_tokens + message_tokens):
+                    # トークン数が最大を超える場合、ループを抜ける
+                    return history_messages, True
+                history_messages.insert(0, message)
+                total_tokens += message_tokens
+
+        return history_messages, not window["truncated"]
+
     async def save_conversation_history(
         self, dto: SaveGuestUsersConversationHistoryDto
     ) -> None:
-        async with self.connection.cursor() as cursor:
+        # 会話履歴を取得する度にトークン数を計算しなくて済むように保存時に1度だけ計算する
+        (
+            user_message_token_count,
+            ai_message_token_count,
+        ) = await self.tokenizer.count_batch_async(
+            [dto["user_message"], dto["ai_message"]]
+        )
+
+        started_at = time.perf_counter()
+
+        async with self._acquire() as connection, connection.cursor() as cursor:
             sql = """
             INSERT INTO guest_users_conversation_histories
-            (conversation_id, cat_id, user_id, user_message, ai_message)
-            VALUES (%s, %s, %s, %s, %s)
+            (
+              conversation_id,
+              cat_id,
+              user_id,
+              user_message,
+              ai_message,
+              user_message_token_count,
+              ai_message_token_count,
+              ai_message_truncated
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
             """
             await cursor.execute(
                 sql,
@@ -87,5 +296,64 @@ class AiomysqlGuestUsersConversationHistoryRepository(
                     dto["user_id"],
                     dto["user_message"],
                     dto["ai_message"],
+                    user_message_token_count,
+                    ai_message_token_count,
+                    dto.get("ai_message_truncated", False),
                 ),
             )
+
+        db_write_seconds.observe(time.perf_counter() - started_at)
+
+        # 次のリクエストで会話履歴をDBから取得しなくて済むようにキャッシュにも反映する
+        # コミットに失敗した場合はキャッシュにだけ会話が残るが、TTLで期限切れになるまでの間だけなので許容する
+        if self.conversation_cache is not None:
+            self.conversation_cache.append_turn(
+                dto["conversation_id"],
+                {
+                    "user_message": dto["user_message"],
+                    "ai_message": dto["ai_message"],
+                    "user_message_token_count": user_message_token_count,
+                    "ai_message_token_count": ai_message_token_count,
+                },
+            )
+
+    # 複数の会話履歴を1回のINSERTでまとめて保存する、トークン数は計算済みのものを利用する
+    async def save_conversation_histories(
+        self, records: List[ConversationHistoryRecord]
+    ) -> None:
+        started_at = time.perf_counter()
+
+        async with self._acquire() as connection, connection.cursor() as cursor:
+            # aiomysqlのexecutemanyはVALUES句を1つにまとめた複数行のINSERTとして実行する
+            sql = """
+            INSERT INTO guest_users_conversation_histories
+            (
+              conversation_id,
+              cat_id,
+              user_id,
+              user_message,
+              ai_message,
+              user_message_token_count,
+              ai_message_token_count,
+              ai_message_truncated
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """
+            await cursor.executemany(
+                sql,
+                [
+                    (
+                        record["conversation_id"],
+                        record["cat_id"],
+                        record["user_id"],
+                        record["user_message"],
+                        record["ai_message"],
+                        record["user_message_token_count"],
+                        record["ai_message_token_count"],
+                        record.get("ai_message_truncated", False),
+                    )
+                    for record in records
+                ],
+            )
+
+        db_write_seconds.observe(time.perf_counter() - started_at)
@@ -0,0 +1,63 @@
+from typing import Optional
+import aiomysql
+from contextlib import asynccontextmanager
+from collections.abc import AsyncIterator
+from infrastructure.db import acquire_db_connection
+from usecase.db_handler_interface import DbHandlerInterface
+
+
+# リクエスト単位で生成する、コネクションはPoolから必要な時だけ借りてすぐに返却する
+class AiomysqlPoolDbHandler(DbHandlerInterface):
+    def __init__(
+        self, pool: aiomysql.Pool, health_check_interval_seconds: float
+    ) -> None:
+        self.pool = pool
+        self.health_check_interval_seconds = health_check_interval_seconds
+        # トランザクション中のみコネクションを保持する
+        self.connection: Optional[aiomysql.Connection] = None
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiomysql.Connection]:
+        if self.connection is not None:
+            yield self.connection
+            return
+
+        connection = await acquire_db_connection(
+            self.pool, self.health_check_interval_seconds
+        )
+        try:
+            yield connection
+        finally:
+            self.pool.release(connection)
+
+    async def begin(self) -> None:
+        if self.connection is None:
+            self.connection = await acquire_db_connection(
+                self.pool, self.health_check_interval_seconds
+            )
+        await self.connection.begin()
+
+    async def commit(self) -> None:
+        if self.connection is None:
+            return
+        try:
+            await self.connection.commit()
+        finally:
+            self._release()
+
+    async def rollback(self) -> None:
+        if self.connection is None:
+            return
+        try:
+            await self.connection.rollback()
+        finally:
+            self._release()
+
+    def close(self) -> None:
+        self._release()
+
+    def _release(self) -> None:
+        if self.connection is None:
+            return
+        self.pool.release(self.connection)
+        self.connection = None
@@ -1,5 +1,5 @@
 import asyncio
-from collections.abc import AsyncIterator
+from collections.abc import AsyncGenerator
 from domain.repository.cat_message_repository_interface import (
     CatMessageRepositoryInterface,
     GenerateMessageForGuestUserDto,
@@ -10,7 +10,7 @@ from domain.repository.cat_message_repository_interface import (
 class MockCatMessageRepository(CatMessageRepositoryInterface):
     async def generate_message_for_guest_user(
         self, dto: GenerateMessageForGuestUserDto
-    ) -> AsyncIterator[GenerateMessageForGuestUserResult]:
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]:
         messages = [
             "はじめましてだにゃん",
             "🐱",
@@ -25,3 +25,6 @@ class MockCatMessageRepository(CatMessageRepositoryInterface):
             yield GenerateMessageForGuestUserResult(
                 ai_response_id="chatcmpl-abcdefghijklmnopqrstuvwxyz001", message=message
             )
+
+    async def cancel_generation(self) -> None:
+        pass
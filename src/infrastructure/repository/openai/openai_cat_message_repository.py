@@ -1,26 +1,52 @@
 import os
-import math
+import asyncio
 import httpx
 import json
 from datetime import datetime
+from functools import lru_cache
 from zoneinfo import ZoneInfo
-from typing import cast, List, TypedDict, Union
-from collections.abc import AsyncIterator
+from typing import cast, Dict, List, Literal, Optional, Set, TypedDict, Union
+from contextlib import aclosing
+from collections.abc import AsyncGenerator
 from openai import AsyncOpenAI, AsyncStream
+from openai._constants import RAW_RESPONSE_HEADER
 from openai.types.chat import (
+    ChatCompletion,
+    ChatCompletionMessage,
     ChatCompletionMessageParam,
     ChatCompletionChunk,
     ChatCompletionToolParam,
+    ChatCompletionToolMessageParam,
     ChatCompletionMessageToolCall,
 )
-from langsmith.wrappers import wrap_openai
-from langsmith import traceable
+from openai.types.chat.chat_completion_message_tool_call import Function
 from domain.repository.cat_message_repository_interface import (
     CatMessageRepositoryInterface,
     GenerateMessageForGuestUserDto,
     GenerateMessageForGuestUserResult,
 )
-from domain.cat import get_prompt_by_cat_id, CatId
+from domain.cat import get_prompt_by_cat_id, CatId, default_timezone
+from infrastructure.intent_classifier import (
+    Intent,
+    IntentClassifier,
+    get_intent_classifier,
+    is_intent_classifier_enabled,
+)
+from infrastructure.japanese_city_gazetteer import get_japanese_city_gazetteer
+from infrastructure.openai import (
+    chat_completion_model,
+    is_datetime_context_enabled,
+    is_raw_stream_enabled,
+)
+from infrastructure.openai_stream_parser import iter_chat_completion_chunks
+from infrastructure.tracing import traceable, wrap_openai
+from infrastructure.open_weather import (
+    fetch_current_weather_observation,
+    get_open_weather_api_base_url,
+)
+from infrastructure.weather_cache import WeatherCache
+from log.metrics import tool_decision_seconds, tool_seconds
+from log.request_timing import RequestTiming, measure_stage
 
 
 class FetchCurrentWeatherResponse(TypedDict):
@@ -33,16 +59,425 @@ class GetCurrentDatetimeResponse(TypedDict):
     current_datetime: str
 
 
-class OpenAiCatMessageRepository(CatMessageRepositoryInterface):
+class ToolUnavailableResponse(TypedDict):
+    status: Literal["unavailable"]
+    reason: str
+
+
+class ToolCallDelta(TypedDict):
+    id: str
+    name: str
+    arguments: str
+
+
+# serial: toolsの利用要否を判定するリクエストの完了を待ってから回答をストリーミングする
+# inline: 回答をストリーミングするリクエストにtoolsを渡し、toolsが呼ばれた場合のみ実行して再度ストリーミングする
+# speculative: toolsの利用要否の判定と並行してtoolsを使わない回答のストリーミングを開始しておく
+ToolCallMode = Literal["serial", "inline", "speculative"]
+
+
+def get_tool_call_mode() -> ToolCallMode:
+    mode = os.getenv("OPENAI_TOOL_CALL_MODE", "serial")
+    if mode == "inline":
+        return "inline"
+    if mode == "speculative":
+        return "speculative"
+    return "serial"
+
+
+# 投機的に開始したストリーミングの結果をtoolsの利用要否の判定が終わるまで保持しておく
+class SpeculativeStream:
+    def __init__(self) -> None:
+        self.queue: asyncio.Queue[
+            Union[GenerateMessageForGuestUserResult, Exception, None]
+        ] = asyncio.Queue()
+        self.first_token_at: Optional[float] = None
+        self.token_count = 0
+
+
+class SpeculationMetricsSnapshot(TypedDict):
+    hit_count: int
+    miss_count: int
+    hit_rate: float
+    wasted_tokens_total: int
+    ttft_saved_seconds_total: float
+
+
+class SpeculationMetrics:
+    def __init__(self) -> None:
+        self.hit_count = 0
+        self.miss_count = 0
+        self.wasted_tokens_total = 0
+        self.ttft_saved_seconds_total = 0.0
+
+    def record_hit(self, ttft_saved_seconds: float) -> None:
+        self.hit_count += 1
+        self.ttft_saved_seconds_total += ttft_saved_seconds
+
+    def record_miss(self, wasted_tokens: int) -> None:
+        self.miss_count += 1
+        self.wasted_tokens_total += wasted_tokens
+
+    def snapshot(self) -> SpeculationMetricsSnapshot:
+        total = self.hit_count + self.miss_count
+        return SpeculationMetricsSnapshot(
+            hit_count=self.hit_count,
+            miss_count=self.miss_count,
+            hit_rate=self.hit_count / total if total else 0.0,
+            wasted_tokens_total=self.wasted_tokens_total,
+            ttft_saved_seconds_total=self.ttft_saved_seconds_total,
+        )
+
+
+speculation_metrics = SpeculationMetrics()
+
+
+default_tool_timeout_seconds = 5.0
+
+
+def create_tool_timeout_seconds() -> Dict[str, float]:
+    return {
+        "fetch_current_weather": float(
+            os.getenv("OPENAI_TOOL_TIMEOUT_FETCH_CURRENT_WEATHER_SECONDS", "5")
+        ),
+        "get_current_datetime_in_iso_format": float(
+            os.getenv(
+                "OPENAI_TOOL_TIMEOUT_GET_CURRENT_DATETIME_IN_ISO_FORMAT_SECONDS", "1"
+            )
+        ),
+    }
+
+
+tools_params = cast(
+    List[ChatCompletionToolParam],
+    [
+        {
+            "type": "function",
+            "function": {
+                "name": "fetch_current_weather",
+                "description": "指定された都市の現在の天気を取得する。（日本の都市の天気しか取得出来ない）",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "city_name": {
+                            "type": "string",
+                            "description": "英語表記の日本の都市名",
+                        }
+                    },
+                    "required": ["city_name"],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "get_current_datetime_in_iso_format",
+                "description": "指定されたタイムゾーンの現在日時をISO 8601形式で返す。",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "timezone": {
+                            "type": "string",
+                            "description": "タイムゾーン名: 例: Asia/Tokyo, UTC, America/New_York",
+                        }
+                    },
+                    "required": ["timezone"],
+                },
+            },
+        },
+    ],
+)
+
+# 現在日時をプロンプトに含めている場合は、それ以外のタイムゾーンの現在日時が必要な場合のみtoolを利用させる
+tools_params_with_datetime_context = cast(
+    List[ChatCompletionToolParam],
+    [
+        tools_params[0],
+        {
+            "type": "function",
+            "function": {
+                "name": "get_current_datetime_in_iso_format",
+                "description": f"指定されたタイムゾーンの現在日時をISO 8601形式で返す。{default_timezone}の現在日時はContextに記載されているので利用しない。",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "timezone": {
+                            "type": "string",
+                            "description": "タイムゾーン名: 例: UTC, America/New_York",
+                        }
+                    },
+                    "required": ["timezone"],
+                },
+            },
+        },
+    ],
+)
+
+tool_names = {tool["function"]["name"] for tool in tools_params}
+
+
+class DatetimeContextMetricsSnapshot(TypedDict):
+    request_count_with_context: int
+    request_count_without_context: int
+    datetime_tool_call_count_with_context: int
+    datetime_tool_call_count_without_context: int
+    # 現在日時をプロンプトに含めた場合と含めなかった場合で1リクエストあたりのtoolの呼び出し回数を比較する
+    datetime_tool_call_rate_with_context: float
+    datetime_tool_call_rate_without_context: float
+
+
+class DatetimeContextMetrics:
     def __init__(self) -> None:
-        self.OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
-        self.OPEN_WEATHER_API_KEY = os.environ["OPEN_WEATHER_API_KEY"]
-        self.client = wrap_openai(AsyncOpenAI(api_key=self.OPENAI_API_KEY))
+        self.request_count_with_context = 0
+        self.request_count_without_context = 0
+        self.datetime_tool_call_count_with_context = 0
+        self.datetime_tool_call_count_without_context = 0
+
+    def record_request(self, datetime_context_enabled: bool) -> None:
+        if datetime_context_enabled:
+            self.request_count_with_context += 1
+        else:
+            self.request_count_without_context += 1
+
+    def record_datetime_tool_call(self, datetime_context_enabled: bool) -> None:
+        if datetime_context_enabled:
+            self.datetime_tool_call_count_with_context += 1
+        else:
+            self.datetime_tool_call_count_without_context += 1
+
+    def snapshot(self) -> DatetimeContextMetricsSnapshot:
+        with_context = self.request_count_with_context
+        without_context = self.request_count_without_context
+        return DatetimeContextMetricsSnapshot(
+            request_count_with_context=with_context,
+            request_count_without_context=without_context,
+            datetime_tool_call_count_with_context=self.datetime_tool_call_count_with_context,
+            datetime_tool_call_count_without_context=self.datetime_tool_call_count_without_context,
+            datetime_tool_call_rate_with_context=(
+                self.datetime_tool_call_count_with_context / with_context
+                if with_context
+                else 0.0
+            ),
+            datetime_tool_call_rate_without_context=(
+                self.datetime_tool_call_count_without_context / without_context
+                if without_context
+                else 0.0
+            ),
+        )
+
+
+datetime_context_metrics = DatetimeContextMetrics()
+
+
+class StreamCancellationMetricsSnapshot(TypedDict):
+    completed_count: int
+    disconnected_count: int
+    # ストリーミングの1つのchunkをおおよそ1トークンとして数える
+    completed_tokens_total: int
+    disconnected_tokens_total: int
+    # 最後まで生成した場合の平均トークン数から切断時点までのトークン数を引いた推定値
+    estimated_saved_tokens_total: int
+
+
+class StreamCancellationMetrics:
+    def __init__(self) -> None:
+        self.completed_count = 0
+        self.disconnected_count = 0
+        self.completed_tokens_total = 0
+        self.disconnected_tokens_total = 0
+        self.estimated_saved_tokens_total = 0
+
+    def record_completed(self, token_count: int) -> None:
+        self.completed_count += 1
+        self.completed_tokens_total += token_count
+
+    def record_disconnected(self, token_count: int) -> None:
+        self.disconnected_count += 1
+        self.disconnected_tokens_total += token_count
+        if self.completed_count:
+            average_tokens = self.completed_tokens_total // self.completed_count
+            self.estimated_saved_tokens_total += max(0, average_tokens - token_count)
+
+    def snapshot(self) -> StreamCancellationMetricsSnapshot:
+        return StreamCancellationMetricsSnapshot(
+            completed_count=self.completed_count,
+            disconnected_count=self.disconnected_count,
+            completed_tokens_total=self.completed_tokens_total,
+            disconnected_tokens_total=self.disconnected_tokens_total,
+            estimated_saved_tokens_total=self.estimated_saved_tokens_total,
+        )
+
+
+stream_cancellation_metrics = StreamCancellationMetrics()
+
+
+# ねこ毎に内容が変わらないので、リクエスト毎に組み立てずに使い回す
+@lru_cache(maxsize=None)
+def create_tool_decision_system_prompt(cat_id: CatId) -> str:
+    return """
+        {base_system_prompt}
+        # Output Indicator
+        以下のようなJSON形式でお願いします。
+        ## use_tools
+        toolsの利用が必要な場合はtrue,不要な場合はfalseを設定します。
+        """.format(base_system_prompt=get_prompt_by_cat_id(cat_id))
+
+
+class OpenAiCatMessageRepositoryConfig(TypedDict):
+    open_weather_api_key: str
+    tool_call_mode: ToolCallMode
+    tool_timeout_seconds: Dict[str, float]
+    intent_classifier_enabled: bool
+    # 現在日時はGuestUsersConversationHistoryRepositoryでプロンプトに含めるので、同じ設定を利用する
+    datetime_context_enabled: bool
+    raw_stream_enabled: bool
+
+
+def create_openai_cat_message_repository_config() -> OpenAiCatMessageRepositoryConfig:
+    return OpenAiCatMessageRepositoryConfig(
+        open_weather_api_key=os.environ["OPEN_WEATHER_API_KEY"],
+        tool_call_mode=get_tool_call_mode(),
+        tool_timeout_seconds=create_tool_timeout_seconds(),
+        intent_classifier_enabled=is_intent_classifier_enabled(),
+        datetime_context_enabled=is_datetime_context_enabled(),
+        raw_stream_enabled=is_raw_stream_enabled(),
+    )
+
+
+class OpenAiCatMessageRepository(CatMessageRepositoryInterface):
+    # clientにはプロセス全体で共有しているSharedOpenAiClient.clientを渡す想定、省略時はこのインスタンス専用に生成する
+    # configは起動時に1度だけ生成したものを渡す想定、省略時は環境変数から生成する
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        tool_call_mode: Optional[ToolCallMode] = None,
+        tool_timeout_seconds: Optional[Dict[str, float]] = None,
+        weather_cache: Optional[WeatherCache] = None,
+        intent_classifier: Optional[IntentClassifier] = None,
+        datetime_context_enabled: Optional[bool] = None,
+        request_timing: Optional[RequestTiming] = None,
+        raw_stream_enabled: Optional[bool] = None,
+        config: Optional[OpenAiCatMessageRepositoryConfig] = None,
+    ) -> None:
+        if config is None:
+            config = create_openai_cat_message_repository_config()
+        self.OPEN_WEATHER_API_KEY = config["open_weather_api_key"]
+        if client is None:
+            client = wrap_openai(AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"]))
+        self.client = client
+        if tool_call_mode is None:
+            tool_call_mode = config["tool_call_mode"]
+        self.tool_call_mode = tool_call_mode
+        if tool_timeout_seconds is None:
+            tool_timeout_seconds = config["tool_timeout_seconds"]
+        self.tool_timeout_seconds = tool_timeout_seconds
+        self.weather_cache = weather_cache
+        self.request_timing = request_timing
+        if intent_classifier is None and config["intent_classifier_enabled"]:
+            intent_classifier = get_intent_classifier()
+        self.intent_classifier = intent_classifier
+        if datetime_context_enabled is None:
+            datetime_context_enabled = config["datetime_context_enabled"]
+        self.datetime_context_enabled = datetime_context_enabled
+        self.tools_params = (
+            tools_params_with_datetime_context
+            if datetime_context_enabled
+            else tools_params
+        )
+        if raw_stream_enabled is None:
+            raw_stream_enabled = config["raw_stream_enabled"]
+        self.raw_stream_enabled = raw_stream_enabled
+        # クライアントが切断した場合に閉じる為、読み込み中のストリーミングを保持する
+        self._open_streams: Set[
+            Union[AsyncStream[ChatCompletionChunk], httpx.Response]
+        ] = set()
+        self._streamed_token_count = 0
+        self._cancelled = False
 
     @traceable
     async def generate_message_for_guest_user(
         self, dto: GenerateMessageForGuestUserDto
-    ) -> AsyncIterator[GenerateMessageForGuestUserResult]:
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]:
+        datetime_context_metrics.record_request(self.datetime_context_enabled)
+
+        intent = self._classify_intent(
+            cast(List[ChatCompletionMessageParam], dto.get("chat_messages"))
+        )
+
+        if intent == "no_tools":
+            generated_responses = self._generate_message_without_tools(dto)
+        elif self.tool_call_mode == "inline":
+            generated_responses = self._generate_message_with_inline_tools(dto)
+        elif self.tool_call_mode == "speculative" and intent == "unsure":
+            generated_responses = self._generate_message_with_speculation(dto)
+        else:
+            # toolsが必要な事が明らかな場合は投機的なストリーミングが必ず無駄になるので直列に実行する
+            # キーワードだけで判定する場合もあるので、toolsを呼び出すかどうかはLLMに任せる（tool_choiceはauto）
+            generated_responses = self._generate_message_after_tools_decision(dto)
+
+        # 切断等で途中で閉じられた場合も、内側のジェネレーターとストリーミングを閉じる
+        async with aclosing(generated_responses):
+            async for generated_response in generated_responses:
+                # 投機的に生成して破棄したトークンは含めず、返したトークンだけを数える
+                self._streamed_token_count += 1
+                yield generated_response
+
+        stream_cancellation_metrics.record_completed(self._streamed_token_count)
+
+    # 生成中のストリーミングを閉じてOpenAI側での生成を止める、@traceableを経由するとacloseが内側のジェネレーターに伝わらないので明示的に閉じる
+    async def cancel_generation(self) -> None:
+        if self._cancelled:
+            return
+
+        self._cancelled = True
+        stream_cancellation_metrics.record_disconnected(self._streamed_token_count)
+
+        for stream in list(self._open_streams):
+            await self._close_stream(stream)
+
+    async def _close_stream(
+        self, stream: Union[AsyncStream[ChatCompletionChunk], httpx.Response]
+    ) -> None:
+        if isinstance(stream, httpx.Response):
+            await stream.aclose()
+        else:
+            await stream.close()
+        self._open_streams.discard(stream)
+
+    # 最後のユーザーのメッセージと直前の会話からtoolsの利用要否をローカルで判定する、分類器が無効の場合は常にLLMに判定させる
+    def _classify_intent(self, messages: List[ChatCompletionMessageParam]) -> Intent:
+        if self.intent_classifier is None:
+            return "unsure"
+
+        texts = [
+            message["content"]
+            for message in messages
+            if message["role"] != "system" and isinstance(message.get("content"), str)
+        ]
+        if not texts or messages[-1]["role"] != "user":
+            return "unsure"
+
+        return self.intent_classifier.classify(
+            cast(str, texts[-1]), cast(List[str], texts[-3:-1])
+        )
+
+    # toolsが不要と判定された場合はtoolsの利用要否の判定を省略して回答をストリーミングで生成する
+    async def _generate_message_without_tools(
+        self, dto: GenerateMessageForGuestUserDto
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]:
+        messages = cast(List[ChatCompletionMessageParam], dto.get("chat_messages"))
+        user = str(dto.get("user_id"))
+
+        async with aclosing(
+            self._stream_chat_completion(messages, user)
+        ) as generated_responses:
+            async for generated_response in generated_responses:
+                yield generated_response
+
+    # toolsの利用要否を判定するリクエストが完了してから回答をストリーミングで生成する
+    async def _generate_message_after_tools_decision(
+        self, dto: GenerateMessageForGuestUserDto
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]:
         messages = cast(List[ChatCompletionMessageParam], dto.get("chat_messages"))
         user = str(dto.get("user_id"))
 
@@ -53,16 +488,196 @@ class OpenAiCatMessageRepository(CatMessageRepositoryInterface):
             )
         )
 
+        async with aclosing(
+            self._stream_chat_completion(regenerated_messages, user)
+        ) as generated_responses:
+            async for generated_response in generated_responses:
+                yield generated_response
+
+    # 回答を生成するストリーミングのリクエストにtoolsを渡し、toolsの呼び出しが返ってきた場合のみ実行して再度ストリーミングする
+    async def _generate_message_with_inline_tools(
+        self, dto: GenerateMessageForGuestUserDto
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]:
+        messages = cast(List[ChatCompletionMessageParam], dto.get("chat_messages"))
+        user = str(dto.get("user_id"))
+
         response = await self.client.chat.completions.create(
-            model="gpt-4o-2024-08-06",
-            messages=regenerated_messages,
+            model=chat_completion_model,
+            messages=messages,
             stream=True,
             temperature=0.1,
             user=user,
+            tools=self.tools_params,
+            tool_choice="auto",
+        )
+
+        ai_response_id = ""
+        content = ""
+        # tool_callsはindex毎に複数のchunkに分割されて返ってくるので組み立てる
+        tool_call_deltas: Dict[int, ToolCallDelta] = {}
+
+        self._open_streams.add(response)
+        try:
+            async with aclosing(
+                cast(AsyncGenerator[ChatCompletionChunk, None], aiter(response))
+            ) as chunks:
+                async for chunk in chunks:
+                    if not chunk.choices:
+                        continue
+
+                    if ai_response_id == "":
+                        ai_response_id = chunk.id
+
+                    delta = chunk.choices[0].delta
+
+                    for tool_call_chunk in delta.tool_calls or []:
+                        tool_call_delta = tool_call_deltas.setdefault(
+                            tool_call_chunk.index,
+                            {"id": "", "name": "", "arguments": ""},
+                        )
+                        if tool_call_chunk.id:
+                            tool_call_delta["id"] = tool_call_chunk.id
+                        if tool_call_chunk.function is not None:
+                            tool_call_delta["name"] += (
+                                tool_call_chunk.function.name or ""
+                            )
+                            tool_call_delta["arguments"] += (
+                                tool_call_chunk.function.arguments or ""
+                            )
+
+                    if not delta.content:
+                        continue
+
+                    content += delta.content
+
+                    yield {
+                        "ai_response_id": ai_response_id,
+                        "message": delta.content,
+                    }
+        finally:
+            await self._close_stream(response)
+
+        if not tool_call_deltas:
+            return
+
+        tool_calls = [
+            ChatCompletionMessageToolCall(
+                id=tool_call_delta["id"],
+                type="function",
+                function=Function(
+                    name=tool_call_delta["name"],
+                    arguments=tool_call_delta["arguments"],
+                ),
+            )
+            for _, tool_call_delta in sorted(tool_call_deltas.items())
+        ]
+
+        assistant_message = ChatCompletionMessage(
+            role="assistant",
+            content=content or None,
+            tool_calls=tool_calls,
+        )
+
+        regenerated_messages = cast(
+            List[ChatCompletionMessageParam],
+            [
+                *messages,
+                assistant_message.model_dump(exclude_none=True),
+                *await self._create_tool_response_messages(tool_calls),
+            ],
         )
 
-        async for generated_response in self._extract_chat_chunks(response):
-            yield generated_response
+        async with aclosing(
+            self._stream_chat_completion(regenerated_messages, user)
+        ) as generated_responses:
+            async for generated_response in generated_responses:
+                yield generated_response
+
+    # toolsの利用要否の判定と並行して、toolsを使わない場合の回答のストリーミングを投機的に開始しておく
+    # toolsが不要だった場合はバッファしていた回答をそのまま返し、必要だった場合は投機的なストリーミングを破棄する
+    async def _generate_message_with_speculation(
+        self, dto: GenerateMessageForGuestUserDto
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]:
+        messages = cast(List[ChatCompletionMessageParam], dto.get("chat_messages"))
+        user = str(dto.get("user_id"))
+
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+
+        speculative_stream = SpeculativeStream()
+        speculative_task = asyncio.create_task(
+            self._buffer_speculative_stream(messages, user, speculative_stream)
+        )
+
+        try:
+            response = await self._decide_tools_usage(dto, messages)
+            decided_at = loop.time()
+
+            if (
+                response.choices[0].finish_reason != "tool_calls"
+                or response.choices[0].message.tool_calls is None
+            ):
+                while True:
+                    item = await speculative_stream.queue.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+
+                if speculative_stream.first_token_at is not None:
+                    # 直列に実行した場合との差分は、判定にかかった時間と最初のトークンまでの時間の短い方になる
+                    speculation_metrics.record_hit(
+                        min(
+                            decided_at - started_at,
+                            speculative_stream.first_token_at - started_at,
+                        )
+                    )
+                else:
+                    speculation_metrics.record_hit(0.0)
+                return
+
+            speculative_task.cancel()
+            await asyncio.gather(speculative_task, return_exceptions=True)
+            speculation_metrics.record_miss(speculative_stream.token_count)
+
+            regenerated_messages = (
+                await self._might_regenerate_messages_contain_tools_results(
+                    messages, response
+                )
+            )
+
+            async with aclosing(
+                self._stream_chat_completion(regenerated_messages, user)
+            ) as generated_responses:
+                async for generated_response in generated_responses:
+                    yield generated_response
+        finally:
+            if not speculative_task.done():
+                speculative_task.cancel()
+                await asyncio.gather(speculative_task, return_exceptions=True)
+
+    async def _buffer_speculative_stream(
+        self,
+        messages: List[ChatCompletionMessageParam],
+        user: str,
+        speculative_stream: SpeculativeStream,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            async for generated_response in self._stream_chat_completion(
+                messages, user
+            ):
+                if speculative_stream.first_token_at is None:
+                    speculative_stream.first_token_at = loop.time()
+                # ストリーミングの1つのchunkはおおよそ1トークンに相当する
+                speculative_stream.token_count += 1
+                speculative_stream.queue.put_nowait(generated_response)
+        except Exception as e:
+            speculative_stream.queue.put_nowait(e)
+            return
+
+        speculative_stream.queue.put_nowait(None)
 
     # 必要に応じてtoolsを実行してメッセージのリストにtoolsの実行結果を含めて再生成する
     @traceable
@@ -71,90 +686,56 @@ class OpenAiCatMessageRepository(CatMessageRepositoryInterface):
         dto: GenerateMessageForGuestUserDto,
         messages: List[ChatCompletionMessageParam],
     ) -> List[ChatCompletionMessageParam]:
-        tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": "fetch_current_weather",
-                    "description": "指定された都市の現在の天気を取得する。（日本の都市の天気しか取得出来ない）",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "city_name": {
-                                "type": "string",
-                                "description": "英語表記の日本の都市名",
-                            }
-                        },
-                        "required": ["city_name"],
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_current_datetime_in_iso_format",
-                    "description": "指定されたタイムゾーンの現在日時をISO 8601形式で返す。",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "timezone": {
-                                "type": "string",
-                                "description": "タイムゾーン名: 例: Asia/Tokyo, UTC, America/New_York",
-                            }
-                        },
-                        "required": ["timezone"],
-                    },
-                },
-            },
-        ]
-        tools_params = cast(List[ChatCompletionToolParam], tools)
+        response = await self._decide_tools_usage(dto, messages)
 
-        copied_messages = messages.copy()
-
-        system_prompt = """
-        {base_system_prompt}
-        # Output Indicator
-        以下のようなJSON形式でお願いします。
-        ## use_tools
-        toolsの利用が必要な場合はtrue,不要な場合はfalseを設定します。
-        """.format(
-            base_system_prompt=get_prompt_by_cat_id(cast(CatId, dto.get("cat_id")))
+        return await self._might_regenerate_messages_contain_tools_results(
+            messages, response
         )
 
+    # toolsの利用が必要かどうかをLLMに判定させる、必要な場合は呼び出すtoolsも返ってくる
+    async def _decide_tools_usage(
+        self,
+        dto: GenerateMessageForGuestUserDto,
+        messages: List[ChatCompletionMessageParam],
+    ) -> ChatCompletion:
+        copied_messages = messages.copy()
+
         copied_messages[0] = {
             "role": "system",
-            "content": system_prompt,
+            "content": create_tool_decision_system_prompt(
+                cast(CatId, dto.get("cat_id"))
+            ),
         }
 
-        response = await self.client.chat.completions.create(
-            model="gpt-4o-2024-08-06",
-            messages=copied_messages,
-            temperature=0,
-            user=str(dto.get("user_id")),
-            tools=tools_params,
-            tool_choice="auto",
-            response_format={"type": "json_object"},
-        )
+        with (
+            tool_decision_seconds.time(),
+            measure_stage(self.request_timing, "tool_decision"),
+        ):
+            return await self.client.chat.completions.create(
+                model=chat_completion_model,
+                messages=copied_messages,
+                temperature=0,
+                user=str(dto.get("user_id")),
+                tools=self.tools_params,
+                tool_choice="auto",
+                response_format={"type": "json_object"},
+            )
 
-        tool_response_messages = []
+    async def _might_regenerate_messages_contain_tools_results(
+        self,
+        messages: List[ChatCompletionMessageParam],
+        response: ChatCompletion,
+    ) -> List[ChatCompletionMessageParam]:
         if response.choices[0].finish_reason == "tool_calls":
             tool_calls = response.choices[0].message.tool_calls
 
             if tool_calls is None:
                 return messages
 
-            for tool_call in tool_calls:
-                tool_call_response = await self._might_call_tool(tool_call)
-                if tool_call_response is not None:
-                    tool_response_messages.append(
-                        {
-                            "tool_call_id": tool_call.id,
-                            "role": "tool",
-                            "content": json.dumps(
-                                tool_call_response, ensure_ascii=False
-                            ),
-                        }
-                    )
+            with measure_stage(self.request_timing, "tools"):
+                tool_response_messages = await self._create_tool_response_messages(
+                    tool_calls
+                )
             # tools（Function calling等）の実行結果を含めて再生成したメッセージのリストを返す
             regenerated_messages = [
                 *messages,
@@ -167,6 +748,55 @@ class OpenAiCatMessageRepository(CatMessageRepositoryInterface):
         # ここに来たという事はtoolsの実行が必要ないという事なので、引数で渡されたmessagesをそのまま返す
         return messages
 
+    # 1回のレスポンスに含まれる複数のtoolsは並行して実行する、結果の順番はtool_callsの順番と同じになる
+    async def _create_tool_response_messages(
+        self, tool_calls: List[ChatCompletionMessageToolCall]
+    ) -> List[ChatCompletionToolMessageParam]:
+        tool_call_responses = await asyncio.gather(
+            *[self._might_call_tool_with_timeout(tool_call) for tool_call in tool_calls]
+        )
+
+        tool_response_messages: List[ChatCompletionToolMessageParam] = []
+        for tool_call, tool_call_response in zip(tool_calls, tool_call_responses):
+            if tool_call_response is not None:
+                tool_response_messages.append(
+                    {
+                        "tool_call_id": tool_call.id,
+                        "role": "tool",
+                        "content": json.dumps(tool_call_response, ensure_ascii=False),
+                    }
+                )
+        return tool_response_messages
+
+    # タイムアウトしたtoolはリクエスト全体を失敗させずに、利用出来なかった事をLLMに伝える
+    async def _might_call_tool_with_timeout(
+        self, tool_call: ChatCompletionMessageToolCall
+    ) -> Union[
+        None,
+        FetchCurrentWeatherResponse,
+        GetCurrentDatetimeResponse,
+        ToolUnavailableResponse,
+    ]:
+        timeout_seconds = self.tool_timeout_seconds.get(
+            tool_call.function.name, default_tool_timeout_seconds
+        )
+        # LLMが存在しないtoolの名前を返してもラベルの種類が増えないようにする
+        tool_name = (
+            tool_call.function.name
+            if tool_call.function.name in tool_names
+            else "unknown"
+        )
+        try:
+            with tool_seconds.labels(tool_name).time():
+                return await asyncio.wait_for(
+                    self._might_call_tool(tool_call), timeout=timeout_seconds
+                )
+        except TimeoutError:
+            return {
+                "status": "unavailable",
+                "reason": f"{tool_call.function.name} timed out after {timeout_seconds} seconds",
+            }
+
     async def _might_call_tool(
         self, tool_call: ChatCompletionMessageToolCall
     ) -> Union[None, FetchCurrentWeatherResponse, GetCurrentDatetimeResponse]:
@@ -185,6 +815,9 @@ class OpenAiCatMessageRepository(CatMessageRepositoryInterface):
         if tool_call.function.name == "get_current_datetime_in_iso_format":
             function_arguments = json.loads(tool_call.function.arguments)
             timezone = function_arguments["timezone"]
+            datetime_context_metrics.record_datetime_tool_call(
+                self.datetime_context_enabled
+            )
             return await self._get_current_datetime_in_iso_format(timezone)
 
         return None
@@ -192,36 +825,36 @@ class OpenAiCatMessageRepository(CatMessageRepositoryInterface):
     async def _fetch_current_weather(
         self, city_name: str = "Tokyo"
     ) -> FetchCurrentWeatherResponse:
-        async with httpx.AsyncClient() as client:
-            geocoding_response = await client.get(
-                "http://api.openweathermap.org/geo/1.0/direct",
-                params={
-                    "q": city_name + ",jp",
-                    "limit": 1,
-                    "appid": self.OPEN_WEATHER_API_KEY,
-                },
-            )
-            geocoding_list = geocoding_response.json()
-            geocoding = geocoding_list[0]
-            lat, lon = geocoding["lat"], geocoding["lon"]
-
-            current_weather_response = await client.get(
-                "https://api.openweathermap.org/data/2.5/weather",
-                params={
-                    "lat": lat,
-                    "lon": lon,
-                    "units": "metric",
-                    "lang": "ja",
-                    "appid": self.OPEN_WEATHER_API_KEY,
-                },
+        # 同梱している市区町村のデータに存在しない場合のみジオコーディングAPIを利用する
+        coordinates = get_japanese_city_gazetteer().lookup(city_name)
+        if coordinates is not None:
+            lat, lon = coordinates["lat"], coordinates["lon"]
+        else:
+            async with httpx.AsyncClient() as client:
+                geocoding_response = await client.get(
+                    f"{get_open_weather_api_base_url()}/geo/1.0/direct",
+                    params={
+                        "q": city_name + ",jp",
+                        "limit": 1,
+                        "appid": self.OPEN_WEATHER_API_KEY,
+                    },
+                )
+                geocoding_list = geocoding_response.json()
+                geocoding = geocoding_list[0]
+                lat, lon = geocoding["lat"], geocoding["lon"]
+
+        if self.weather_cache is not None:
+            observation = await self.weather_cache.get(lat, lon)
+        else:
+            observation = await fetch_current_weather_observation(
+                lat, lon, self.OPEN_WEATHER_API_KEY
             )
-            current_weather = current_weather_response.json()
 
-            return {
-                "city_name": city_name,
-                "description": current_weather["weather"][0]["description"],
-                "temperature": math.floor(current_weather["main"]["temp"]),
-            }
+        return {
+            "city_name": city_name,
+            "description": observation["description"],
+            "temperature": observation["temperature"],
+        }
 
     @staticmethod
     async def _get_current_datetime_in_iso_format(
@@ -233,27 +866,103 @@ class OpenAiCatMessageRepository(CatMessageRepositoryInterface):
             "current_datetime": current_datetime.isoformat(),
         }
 
-    @staticmethod
+    # 回答をストリーミングで生成する、有効な場合はSDKのChatCompletionChunkを経由せずにレスポンスのbytesから回答を取り出す
+    async def _stream_chat_completion(
+        self, messages: List[ChatCompletionMessageParam], user: str
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]:
+        if not self.raw_stream_enabled:
+            stream = await self.client.chat.completions.create(
+                model=chat_completion_model,
+                messages=messages,
+                stream=True,
+                temperature=0.1,
+                user=user,
+            )
+            async with aclosing(
+                self._extract_chat_chunks(stream)
+            ) as generated_responses:
+                async for generated_response in generated_responses:
+                    yield generated_response
+            return
+
+        # リトライやエラーレスポンスの例外への変換はSDKに任せ、読み込んでいないレスポンスを受け取る
+        response = await self.client.post(
+            "/chat/completions",
+            body={
+                "model": chat_completion_model,
+                "messages": messages,
+                "stream": True,
+                "temperature": 0.1,
+                "user": user,
+            },
+            cast_to=httpx.Response,
+            options={"headers": {RAW_RESPONSE_HEADER: "stream"}},
+        )
+        async with aclosing(
+            self._extract_raw_chat_chunks(response)
+        ) as generated_responses:
+            async for generated_response in generated_responses:
+                yield generated_response
+
+    # _extract_chat_chunks と同じ結果を、chunkのJSONを変換したdictから取り出す
+    async def _extract_raw_chat_chunks(
+        self,
+        response: httpx.Response,
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]:
+        self._open_streams.add(response)
+        # 途中で読み込みを止めた場合もコネクションを返却する
+        try:
+            ai_response_id = ""
+            async with aclosing(iter_chat_completion_chunks(response)) as chunks:
+                async for chunk in chunks:
+                    chunk_message: str = (
+                        chunk["choices"][0]["delta"].get("content") or ""
+                    )
+
+                    if ai_response_id == "":
+                        ai_response_id = chunk["id"]
+
+                    if chunk_message == "":
+                        continue
+
+                    chunk_body: GenerateMessageForGuestUserResult = {
+                        "ai_response_id": ai_response_id,
+                        "message": chunk_message,
+                    }
+
+                    yield chunk_body
+        finally:
+            await self._close_stream(response)
+
     async def _extract_chat_chunks(
+        self,
         async_stream: AsyncStream[ChatCompletionChunk],
-    ) -> AsyncIterator[GenerateMessageForGuestUserResult]:
-        ai_response_id = ""
-        async for chunk in async_stream:
-            chunk_message: str = (
-                chunk.choices[0].delta.content
-                if chunk.choices[0].delta.content is not None
-                else ""
-            )
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]:
+        self._open_streams.add(async_stream)
+        # 途中で読み込みを止めた場合もコネクションを返却する
+        try:
+            ai_response_id = ""
+            async with aclosing(
+                cast(AsyncGenerator[ChatCompletionChunk, None], aiter(async_stream))
+            ) as chunks:
+                async for chunk in chunks:
+                    chunk_message: str = (
+                        chunk.choices[0].delta.content
+                        if chunk.choices[0].delta.content is not None
+                        else ""
+                    )
 
-            if ai_response_id == "":
-                ai_response_id = chunk.id
+                    if ai_response_id == "":
+                        ai_response_id = chunk.id
 
-            if chunk_message == "":
-                continue
+                    if chunk_message == "":
+                        continue
 
-            chunk_body: GenerateMessageForGuestUserResult = {
-                "ai_response_id": ai_response_id,
-                "message": chunk_message,
-            }
+                    chunk_body: GenerateMessageForGuestUserResult = {
+                        "ai_response_id": ai_response_id,
+                        "message": chunk_message,
+                    }
 
-            yield chunk_body
+                    yield chunk_body
+        finally:
+            await self._close_stream(async_stream)
@@ -0,0 +1,79 @@
+import os
+import time
+import asyncio
+import tiktoken
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional, Sequence
+from infrastructure.openai import chat_completion_model
+from log.metrics import tokenization_seconds
+
+
+def get_tokenizer_offload_threshold_chars() -> int:
+    return int(os.getenv("TOKENIZER_OFFLOAD_THRESHOLD_CHARS", "2000"))
+
+
+# Dockerイメージのビルド時に scripts/download_tiktoken_cache.py でBPEのファイルを保存するディレクトリ
+bundled_tiktoken_cache_dir = Path(__file__).parent / "data" / "tiktoken_cache"
+
+
+# TIKTOKEN_CACHE_DIR を指定していない場合は、同梱したファイルがあればそれを読み込む
+def get_tiktoken_cache_dir() -> Optional[str]:
+    cache_dir = os.getenv("TIKTOKEN_CACHE_DIR")
+    if cache_dir:
+        return cache_dir
+    if bundled_tiktoken_cache_dir.is_dir():
+        return str(bundled_tiktoken_cache_dir)
+    return None
+
+
+# encoding_for_model は呼び出す度にBPEのテーブルを探索するので、モデル毎に1度だけ生成して使い回す
+# 初回はBPEのファイルを読み込むので、キャッシュのディレクトリにファイルがあればネットワークに接続しない
+@lru_cache(maxsize=None)
+def get_encoding_for_model(model: str) -> tiktoken.Encoding:
+    cache_dir = get_tiktoken_cache_dir()
+    if cache_dir is not None:
+        # tiktokenは読み込み時にこの環境変数からキャッシュのディレクトリを決める
+        os.environ["TIKTOKEN_CACHE_DIR"] = cache_dir
+    return tiktoken.encoding_for_model(model)
+
+
+class Tokenizer:
+    def __init__(
+        self, encoding: tiktoken.Encoding, offload_threshold_chars: int
+    ) -> None:
+        self.encoding = encoding
+        self.offload_threshold_chars = offload_threshold_chars
+
+    # ユーザーが入力した <|endoftext|> のような文字列で例外にならないように特殊トークンは通常の文字列として扱う
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode_ordinary(text))
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        return [
+            len(tokens) for tokens in self.encoding.encode_ordinary_batch(list(texts))
+        ]
+
+    async def count_async(self, text: str) -> int:
+        return (await self.count_batch_async([text]))[0]
+
+    # 閾値を超える文字数の場合は他のユーザーのストリーミングを止めないようにスレッドで計算する
+    # 閾値未満の場合はスレッドの切り替えの方が高く付くのでイベントループ上で計算する
+    async def count_batch_async(self, texts: Sequence[str]) -> List[int]:
+        started_at = time.perf_counter()
+
+        if sum(len(text) for text in texts) < self.offload_threshold_chars:
+            token_counts = [self.count(text) for text in texts]
+        else:
+            token_counts = await asyncio.to_thread(self.count_batch, texts)
+
+        tokenization_seconds.observe(time.perf_counter() - started_at)
+        return token_counts
+
+
+# 実際にリクエストを送るモデルのencodingでトークン数を計算する
+@lru_cache(maxsize=None)
+def get_tokenizer(model: str = chat_completion_model) -> Tokenizer:
+    return Tokenizer(
+        get_encoding_for_model(model), get_tokenizer_offload_threshold_chars()
+    )
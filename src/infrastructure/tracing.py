@@ -0,0 +1,34 @@
+import os
+from typing import Any, Callable, TypeVar, cast
+from openai import AsyncOpenAI
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+# langsmithと同じくLANGSMITH_, LANGCHAIN_の順に TRACING_V2, TRACING の環境変数を参照する
+def is_langsmith_tracing_enabled() -> bool:
+    for name in ("TRACING_V2", "TRACING"):
+        for namespace in ("LANGSMITH", "LANGCHAIN"):
+            value = os.getenv(f"{namespace}_{name}")
+            if value is not None:
+                return value == "true"
+    return False
+
+
+# langsmithは読み込みに時間が掛かるので、トレースが無効な場合は読み込まずに起動時間を短くする
+def traceable(func: F) -> F:
+    if not is_langsmith_tracing_enabled():
+        return func
+
+    from langsmith import traceable as langsmith_traceable
+
+    return cast(F, langsmith_traceable(func))
+
+
+def wrap_openai(client: AsyncOpenAI) -> AsyncOpenAI:
+    if not is_langsmith_tracing_enabled():
+        return client
+
+    from langsmith.wrappers import wrap_openai as langsmith_wrap_openai
+
+    return langsmith_wrap_openai(client)
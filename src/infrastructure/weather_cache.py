@@ -0,0 +1,180 @@
+import os
+import asyncio
+from collections import Counter, OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Dict, Optional, Tuple, TypedDict
+from infrastructure.open_weather import WeatherObservation
+
+WeatherCacheKey = Tuple[float, float]
+
+FetchWeatherObservation = Callable[[float, float], Awaitable[WeatherObservation]]
+
+
+class WeatherCacheConfig(TypedDict):
+    ttl_seconds: float
+    max_entries: int
+    # リクエスト数の多い上位N件の都市を期限切れになる前にバックグラウンドで更新する、0の場合は更新しない
+    refresh_top_n: int
+    refresh_interval_seconds: float
+
+
+def create_weather_cache_config() -> WeatherCacheConfig:
+    return WeatherCacheConfig(
+        ttl_seconds=float(os.getenv("WEATHER_CACHE_TTL_SECONDS", "600")),
+        max_entries=int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "1000")),
+        refresh_top_n=int(os.getenv("WEATHER_CACHE_REFRESH_TOP_N", "20")),
+        refresh_interval_seconds=float(
+            os.getenv("WEATHER_CACHE_REFRESH_INTERVAL_SECONDS", "60")
+        ),
+    )
+
+
+# 緯度経度を丸めて、近い地点の天気は同じキャッシュを利用する（小数点以下2桁で約1km）
+def create_weather_cache_key(lat: float, lon: float) -> WeatherCacheKey:
+    return round(lat, 2), round(lon, 2)
+
+
+class WeatherCacheEntry(TypedDict):
+    observation: WeatherObservation
+    expires_at: float
+
+
+class WeatherCacheMetricsSnapshot(TypedDict):
+    hit_count: int
+    miss_count: int
+    refresh_count: int
+    refresh_failure_count: int
+    size: int
+
+
+class WeatherCache:
+    def __init__(
+        self, fetch: FetchWeatherObservation, config: WeatherCacheConfig
+    ) -> None:
+        self.fetch = fetch
+        self.config = config
+        self._entries: OrderedDict[WeatherCacheKey, WeatherCacheEntry] = OrderedDict()
+        # 同じ地点の取得が同時に発生した場合は1回のリクエストの結果を共有する
+        self._inflight: Dict[WeatherCacheKey, asyncio.Future[WeatherObservation]] = {}
+        self._request_counts: Counter[WeatherCacheKey] = Counter()
+        self._refresh_task: Optional[asyncio.Task[None]] = None
+        self.hit_count = 0
+        self.miss_count = 0
+        self.refresh_count = 0
+        self.refresh_failure_count = 0
+
+    async def get(self, lat: float, lon: float) -> WeatherObservation:
+        key = create_weather_cache_key(lat, lon)
+        self._request_counts[key] += 1
+
+        entry = self._entries.get(key)
+        if entry is not None and entry["expires_at"] > self._now():
+            self._entries.move_to_end(key)
+            self.hit_count += 1
+            return entry["observation"]
+
+        self.miss_count += 1
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # 先に取得を開始した呼び出し元がキャンセルされた場合は自分で取得し直す
+                if not inflight.cancelled():
+                    raise
+
+        return await self._fetch_and_store(key)
+
+    async def _fetch_and_store(self, key: WeatherCacheKey) -> WeatherObservation:
+        future: asyncio.Future[WeatherObservation] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._inflight[key] = future
+        try:
+            observation = await self.fetch(*key)
+            self._store(key, observation)
+            future.set_result(observation)
+            return observation
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 待っている呼び出し元がいない場合に未取得の例外として警告が出ないようにする
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _store(self, key: WeatherCacheKey, observation: WeatherObservation) -> None:
+        self._entries[key] = {
+            "observation": observation,
+            "expires_at": self._now() + self.config["ttl_seconds"],
+        }
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.config["max_entries"]:
+            evicted_key, _ = self._entries.popitem(last=False)
+            self._request_counts.pop(evicted_key, None)
+
+    def start_refresh(self) -> None:
+        if self.config["refresh_top_n"] <= 0 or self._refresh_task is not None:
+            return
+
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.config["refresh_interval_seconds"])
+            await self.refresh_popular_entries()
+
+    # 次の更新タイミングまでに期限切れになる人気の地点だけを更新する
+    async def refresh_popular_entries(self) -> None:
+        deadline = self._now() + self.config["refresh_interval_seconds"]
+        keys = [
+            key
+            for key, _ in self._request_counts.most_common(self.config["refresh_top_n"])
+            if key in self._entries and self._entries[key]["expires_at"] <= deadline
+        ]
+
+        results = await asyncio.gather(
+            *[self.fetch(*key) for key in keys], return_exceptions=True
+        )
+        for key, result in zip(keys, results):
+            if isinstance(result, BaseException):
+                self.refresh_failure_count += 1
+                continue
+            self._store(key, result)
+            self.refresh_count += 1
+
+        # 過去のリクエスト数の影響が残り続けないように減衰させる
+        for key in list(self._request_counts):
+            self._request_counts[key] //= 2
+            if self._request_counts[key] == 0:
+                del self._request_counts[key]
+
+    def snapshot(self) -> WeatherCacheMetricsSnapshot:
+        return WeatherCacheMetricsSnapshot(
+            hit_count=self.hit_count,
+            miss_count=self.miss_count,
+            refresh_count=self.refresh_count,
+            refresh_failure_count=self.refresh_failure_count,
+            size=len(self._entries),
+        )
+
+    async def aclose(self) -> None:
+        if self._refresh_task is None:
+            return
+
+        self._refresh_task.cancel()
+        try:
+            await self._refresh_task
+        except asyncio.CancelledError:
+            pass
+        self._refresh_task = None
+
+    @staticmethod
+    def _now() -> float:
+        return asyncio.get_running_loop().time()
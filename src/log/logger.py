@@ -1,19 +1,163 @@
+import os
+import copy
 import json
-from logging import Logger, LogRecord, getLogger, StreamHandler, Formatter, INFO
-from typing import Literal, TypedDict
+import queue
+import atexit
+import random
+from logging import (
+    Filter,
+    Logger,
+    LogRecord,
+    getLogger,
+    StreamHandler,
+    Formatter,
+    INFO,
+)
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Literal, Optional, TypedDict
+from log.metrics import log_records_dropped_total
+
+LogLevel = Literal[0, 10, 20, 30, 40, 50]
+
+
+class LoggingConfig(TypedDict):
+    # extraに含める文字列がこの文字数を超えた場合は切り詰める（0以下の場合は切り詰めない）
+    # extraの truncation_exempt が True のログは切り詰めない
+    max_field_length: int
+    # INFOのログを出力する割合、1未満の場合はリクエスト毎に出力するログを間引く
+    info_sample_rate: float
+    # 書き込みを待っているログの上限、超えた場合はイベントループを止めないように破棄する
+    max_queue_size: int
+
+
+def create_logging_config() -> LoggingConfig:
+    return LoggingConfig(
+        max_field_length=int(os.getenv("LOG_MAX_FIELD_LENGTH", "1000")),
+        info_sample_rate=float(os.getenv("LOG_INFO_SAMPLE_RATE", "1")),
+        max_queue_size=int(os.getenv("LOG_MAX_QUEUE_SIZE", "10000")),
+    )
+
+
+# LogRecordの標準の属性、extraで渡した値だけを切り詰める為に利用する
+_log_record_attributes = set(LogRecord("", 0, "", 0, "", None, None).__dict__) | {
+    "message",
+    "asctime",
+    "sample_rate",
+}
 
 
 class JsonFormatter(Formatter):
+    def __init__(self, max_field_length: int = 0) -> None:
+        super().__init__()
+        self.max_field_length = max_field_length
+
     def format(self, record: LogRecord) -> str:
         try:
             data = record.__dict__.copy()
             exc_info = data.pop("exc_info")
+            exc_text = data.pop("exc_text", None)
             if exc_info:
                 data["traceback"] = self.formatException(exc_info).splitlines()
+            elif exc_text:
+                data["traceback"] = exc_text.splitlines()
+            if self.max_field_length > 0 and not data.get("truncation_exempt", False):
+                self._truncate_fields(data)
             return json.dumps(data)
         except Exception:
             return super().format(record)
 
+    def _truncate_fields(self, data: Dict[str, Any]) -> None:
+        truncated_fields: List[str] = []
+        for key, value in data.items():
+            if (
+                key not in _log_record_attributes
+                and isinstance(value, str)
+                and len(value) > self.max_field_length
+            ):
+                data[key] = value[: self.max_field_length]
+                truncated_fields.append(key)
+        if truncated_fields:
+            data["truncated_fields"] = truncated_fields
+
+
+# INFOのログを指定した割合だけ出力する、WARNING以上のログは常に出力する
+class InfoLogSampler(Filter):
+    def __init__(self, sample_rate: float) -> None:
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: LogRecord) -> bool:
+        if record.levelno != INFO or self.sample_rate >= 1:
+            return True
+        if random.random() >= self.sample_rate:
+            return False
+        # 集計時に件数を補正出来るように出力した割合を含める
+        record.sample_rate = self.sample_rate
+        return True
+
+
+# ログの書き込みは別スレッドで行い、呼び出したスレッドではキューに入れるだけにする
+class NonBlockingQueueHandler(QueueHandler):
+    # JSONへの変換は書き込むスレッドで行う、引数と例外の情報は別スレッドで参照しないように文字列にしておく
+    def prepare(self, record: LogRecord) -> LogRecord:
+        record = copy.copy(record)
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    # キューが一杯の場合は待たずに破棄する
+    def enqueue(self, record: LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped_total.inc()
+
+
+_queue_listener: Optional[QueueListener] = None
+
+
+# ルートロガーの設定はプロセス全体で1度だけ行う、2回目以降の呼び出しでは何もしない
+def configure_logging(
+    config: Optional[LoggingConfig] = None, level: LogLevel = INFO
+) -> None:
+    global _queue_listener
+    if _queue_listener is not None:
+        return
+
+    if config is None:
+        config = create_logging_config()
+
+    stream_handler = StreamHandler()
+    stream_handler.setFormatter(JsonFormatter(config["max_field_length"]))
+
+    log_queue: queue.Queue[LogRecord] = queue.Queue(config["max_queue_size"])
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(InfoLogSampler(config["info_sample_rate"]))
+
+    root_logger = getLogger()
+    root_logger.setLevel(level)
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(queue_handler)
+
+    _queue_listener = QueueListener(log_queue, stream_handler)
+    _queue_listener.start()
+    atexit.register(shutdown_logging)
+
+
+# キューに残っているログを全て書き込んでから、書き込むスレッドを止める
+def shutdown_logging() -> None:
+    global _queue_listener
+    if _queue_listener is None:
+        return
+
+    _queue_listener.stop()
+    _queue_listener = None
+
 
 class SuccessLogExtra(TypedDict):
     request_id: str
@@ -23,6 +167,26 @@ class SuccessLogExtra(TypedDict):
     ai_response_id: str
 
 
+class ClientDisconnectedLogExtra(TypedDict):
+    request_id: str
+    conversation_id: str
+    cat_id: str
+    user_id: str
+    ai_response_id: str
+    # 切断されるまでに生成した応答の文字数
+    ai_message_length: int
+
+
+class RequestTimingLogExtra(TypedDict):
+    request_id: str
+    conversation_id: str
+    # Server-Timingヘッダーと同じ形式の処理時間の内訳
+    server_timing: str
+    ttft_ms: Optional[float]
+    token_count: int
+    total_duration_ms: float
+
+
 class ErrorLogExtra(TypedDict):
     request_id: str
     conversation_id: str
@@ -31,24 +195,24 @@ class ErrorLogExtra(TypedDict):
     user_message: str
 
 
-class InfoLogExtra(TypedDict):
-    info_message: str
+class ConversationHistoryDropLogExtra(TypedDict):
+    conversation_id: str
+    cat_id: str
+    user_id: str
+    user_message: str
+    ai_message: str
+    # 手動で復旧する為の唯一の記録なので、LOG_MAX_FIELD_LENGTH を超えていても切り詰めない
+    truncation_exempt: bool
 
 
-LogLevel = Literal[0, 10, 20, 30, 40, 50]
+class InfoLogExtra(TypedDict):
+    info_message: str
 
 
 class AppLogger:
     def __init__(self, level: LogLevel = INFO) -> None:
+        configure_logging(level=level)
         self._logger = getLogger()
-        self._logger.setLevel(level)
-
-        for handler in self._logger.handlers[:]:
-            self._logger.removeHandler(handler)
-
-        handler = StreamHandler()
-        handler.setFormatter(JsonFormatter())
-        self._logger.addHandler(handler)
 
     @property
     def logger(self) -> Logger:
@@ -0,0 +1,298 @@
+import os
+import time
+import threading
+from bisect import bisect_left
+from collections.abc import Callable, Iterator, Mapping
+from contextlib import AbstractContextManager, contextmanager
+from typing import Dict, List, Protocol, Sequence, Tuple, Union
+
+# 値の記録はイベントループのスレッドからのみ行う前提なので、ロックは取らずに数値を加算するだけにしている
+# asyncio.to_thread などで別スレッドに処理を逃がす場合も、awaitから戻った後にイベントループ側で記録する
+# ログの出力のように任意のスレッドから記録する値は、ロックを取る ThreadSafeCounter を使う
+
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+inter_token_gap_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+stream_duration_buckets = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+stream_frame_buckets = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+LabelValues = Tuple[str, ...]
+
+MetricsSnapshot = Mapping[str, object]
+
+
+def is_metrics_endpoint_enabled() -> bool:
+    return os.getenv("METRICS_ENDPOINT_ENABLED", "0") == "1"
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names: Sequence[str], label_values: Sequence[str]) -> str:
+    if not label_names:
+        return ""
+
+    labels = ",".join(
+        f'{name}="{_escape_label_value(value)}"'
+        for name, value in zip(label_names, label_values)
+    )
+    return f"{{{labels}}}"
+
+
+def _format_value(value: Union[int, float]) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(value)
+
+
+class HistogramChild:
+    __slots__ = ("bounds", "bucket_counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # 各バケットに入った件数、出力時に累積する
+        self.bucket_counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at)
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Sequence[float] = latency_buckets,
+        label_names: Sequence[str] = (),
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.bounds = tuple(sorted(buckets))
+        self.label_names = tuple(label_names)
+        self._children: Dict[LabelValues, HistogramChild] = {}
+
+    def labels(self, *label_values: str) -> HistogramChild:
+        child = self._children.get(label_values)
+        if child is None:
+            child = self._children[label_values] = HistogramChild(self.bounds)
+        return child
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> AbstractContextManager[None]:
+        return self.labels().time()
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for label_values, child in self._children.items():
+            cumulative_count = 0
+            for bound, bucket_count in zip(
+                (*self.bounds, float("inf")), child.bucket_counts
+            ):
+                cumulative_count += bucket_count
+                labels = _format_labels(
+                    (*self.label_names, "le"), (*label_values, _format_value(bound))
+                )
+                lines.append(f"{self.name}_bucket{labels} {cumulative_count}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {child.sum}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Counter:
+    metric_type = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        for label_values, value in self._values.items():
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}{labels} {_format_value(value)}")
+        return lines
+
+
+# イベントループ以外のスレッドからも加算する為、加算と出力時の参照をロックで保護する
+class ThreadSafeCounter(Counter):
+    def __init__(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        with self._lock:
+            super().inc(amount, *label_values)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return super().render()
+
+
+class Gauge(Counter):
+    metric_type = "gauge"
+
+    def dec(self, amount: float = 1, *label_values: str) -> None:
+        self.inc(-amount, *label_values)
+
+
+class Metric(Protocol):
+    def render(self) -> List[str]: ...
+
+
+# 各モジュールのsnapshot()の結果を、取得時にまとめてgaugeとして出力する
+class SnapshotCollector:
+    def __init__(self, prefix: str, snapshot: Callable[[], MetricsSnapshot]) -> None:
+        self.prefix = prefix
+        self.snapshot = snapshot
+
+    def render(self) -> List[str]:
+        lines: List[str] = []
+        for key, value in self.snapshot().items():
+            if not isinstance(value, (int, float)):
+                continue
+            name = f"{self.prefix}_{key}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, name: str, metric: Metric) -> None:
+        self._metrics[name] = metric
+
+    def register_snapshot(
+        self, prefix: str, snapshot: Callable[[], MetricsSnapshot]
+    ) -> None:
+        self.register(prefix, SnapshotCollector(prefix, snapshot))
+
+    def unregister(self, name: str) -> None:
+        self._metrics.pop(name, None)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Sequence[float] = latency_buckets,
+        label_names: Sequence[str] = (),
+    ) -> Histogram:
+        histogram = Histogram(name, documentation, buckets, label_names)
+        self.register(name, histogram)
+        return histogram
+
+    def counter(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        thread_safe: bool = False,
+    ) -> Counter:
+        counter = (
+            ThreadSafeCounter(name, documentation, label_names)
+            if thread_safe
+            else Counter(name, documentation, label_names)
+        )
+        self.register(name, counter)
+        return counter
+
+    def gauge(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ) -> Gauge:
+        gauge = Gauge(name, documentation, label_names)
+        self.register(name, gauge)
+        return gauge
+
+    # Prometheusのテキスト形式で出力する
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+
+db_connect_seconds = metrics_registry.histogram(
+    "ai_cat_db_connect_seconds",
+    "DBのコネクションの確立またはPoolからの取得にかかった時間",
+)
+history_read_seconds = metrics_registry.histogram(
+    "ai_cat_history_read_seconds", "会話履歴を含むメッセージの作成にかかった時間"
+)
+tokenization_seconds = metrics_registry.histogram(
+    "ai_cat_tokenization_seconds", "トークン数の計算にかかった時間"
+)
+tool_decision_seconds = metrics_registry.histogram(
+    "ai_cat_tool_decision_seconds", "toolsの利用要否の判定にかかった時間"
+)
+tool_seconds = metrics_registry.histogram(
+    "ai_cat_tool_seconds", "toolの実行にかかった時間", label_names=("tool",)
+)
+ttft_seconds = metrics_registry.histogram(
+    "ai_cat_ttft_seconds", "生成を開始してから最初のトークンを返すまでの時間"
+)
+inter_token_gap_seconds = metrics_registry.histogram(
+    "ai_cat_inter_token_gap_seconds",
+    "トークンを返す間隔",
+    buckets=inter_token_gap_buckets,
+)
+stream_duration_seconds = metrics_registry.histogram(
+    "ai_cat_stream_duration_seconds",
+    "生成を開始してから最後のトークンを返すまでの時間",
+    buckets=stream_duration_buckets,
+)
+db_write_seconds = metrics_registry.histogram(
+    "ai_cat_db_write_seconds", "会話履歴の保存にかかった時間"
+)
+streamed_tokens_total = metrics_registry.counter(
+    "ai_cat_streamed_tokens_total", "返却したトークン数（ストリーミングのchunk数）"
+)
+sse_frames_per_stream = metrics_registry.histogram(
+    "ai_cat_sse_frames_per_stream",
+    "1つのストリーミングで返したSSEのイベント数（トークンをまとめた場合はトークン数より少なくなる）",
+    buckets=stream_frame_buckets,
+)
+errors_total = metrics_registry.counter(
+    "ai_cat_errors_total", "エラーの発生回数", label_names=("type",)
+)
+# ログは任意のスレッドから出力されるので、ロックを取って加算する
+log_records_dropped_total = metrics_registry.counter(
+    "ai_cat_log_records_dropped_total",
+    "書き込みが追いつかずに破棄したログの件数",
+    thread_safe=True,
+)
+in_flight_streams = metrics_registry.gauge(
+    "ai_cat_in_flight_streams", "生成中のストリーミングの数"
+)
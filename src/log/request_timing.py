@@ -0,0 +1,78 @@
+import time
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from typing import Dict, Optional, TypedDict
+
+
+class RequestTimingSummary(TypedDict):
+    ttft_ms: Optional[float]
+    token_count: int
+    tokens_per_second: Optional[float]
+    total_duration_ms: float
+
+
+# 1リクエストの処理時間の内訳、Server-Timingの形式でヘッダー・ストリーミングの最後のイベント・ログに出力する
+class RequestTiming:
+    def __init__(self) -> None:
+        self.started_at = time.perf_counter()
+        # ストリーミングを開始するまでの処理の段階毎の時間（秒）、記録した順番で出力する
+        self.stages: Dict[str, float] = {}
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.token_count = 0
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started_at)
+
+    def record_token(self) -> None:
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.last_token_at = now
+        self.token_count += 1
+
+    def server_timing_header(self) -> str:
+        metrics = [
+            f"{stage};dur={seconds * 1000:.1f}"
+            for stage, seconds in self.stages.items()
+        ]
+        if self.first_token_at is not None:
+            metrics.append(
+                f"ttft;dur={(self.first_token_at - self.started_at) * 1000:.1f}"
+            )
+        return ", ".join(metrics)
+
+    def summary(self) -> RequestTimingSummary:
+        ttft_ms: Optional[float] = None
+        tokens_per_second: Optional[float] = None
+        if self.first_token_at is not None and self.last_token_at is not None:
+            ttft_ms = round((self.first_token_at - self.started_at) * 1000, 1)
+            generation_seconds = self.last_token_at - self.first_token_at
+            if generation_seconds > 0:
+                tokens_per_second = round(
+                    (self.token_count - 1) / generation_seconds, 1
+                )
+
+        return RequestTimingSummary(
+            ttft_ms=ttft_ms,
+            token_count=self.token_count,
+            tokens_per_second=tokens_per_second,
+            total_duration_ms=round((time.perf_counter() - self.started_at) * 1000, 1),
+        )
+
+
+# 計測しない場合も呼び出し側で分岐しなくて済むようにする
+def measure_stage(
+    request_timing: Optional[RequestTiming], stage: str
+) -> AbstractContextManager[None]:
+    if request_timing is None:
+        return nullcontext()
+    return request_timing.measure(stage)
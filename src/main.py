@@ -1,12 +1,100 @@
 import uvicorn
+from contextlib import asynccontextmanager
+from collections.abc import AsyncIterator
 from fastapi import FastAPI, Request, status, HTTPException
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
-from presentation.router import cats
+from presentation.router import cats, metrics
+from infrastructure.db import db_pool_metrics
+from infrastructure.intent_classifier import get_intent_classifier
+from infrastructure.repository.openai.openai_cat_message_repository import (
+    datetime_context_metrics,
+    speculation_metrics,
+    stream_cancellation_metrics,
+)
+from log.metrics import is_metrics_endpoint_enabled, metrics_registry
+from log.logger import configure_logging, create_logging_config, shutdown_logging
+from presentation.container import AppContainer, create_app_container
+from presentation.warmup import (
+    create_startup_warmup_config,
+    is_startup_warmup_enabled,
+    warmup_app_container,
+)
+
+
+# 各モジュールで集計しているメトリクスを /metrics で出力する
+def register_metrics_snapshots(container: AppContainer) -> None:
+    metrics_registry.register_snapshot(
+        "ai_cat_speculation", speculation_metrics.snapshot
+    )
+    metrics_registry.register_snapshot(
+        "ai_cat_datetime_context", datetime_context_metrics.snapshot
+    )
+    metrics_registry.register_snapshot(
+        "ai_cat_stream_cancellation", stream_cancellation_metrics.snapshot
+    )
+    metrics_registry.register_snapshot(
+        "ai_cat_weather_cache", container.weather_cache.snapshot
+    )
+
+    db_pool = container.db_pool
+    if db_pool is not None:
+        metrics_registry.register_snapshot(
+            "ai_cat_db_pool", lambda: db_pool_metrics.snapshot(db_pool)
+        )
+
+    if container.conversation_cache is not None:
+        metrics_registry.register_snapshot(
+            "ai_cat_conversation_cache", container.conversation_cache.snapshot
+        )
+
+    if container.conversation_history_writer is not None:
+        metrics_registry.register_snapshot(
+            "ai_cat_conversation_history_writer",
+            container.conversation_history_writer.snapshot,
+        )
+
+    if container.admission_controller is not None:
+        metrics_registry.register_snapshot(
+            "ai_cat_admission_control", container.admission_controller.snapshot
+        )
+
+    if container.cat_message_repository_config["intent_classifier_enabled"]:
+        intent_classifier = get_intent_classifier()
+        metrics_registry.register_snapshot(
+            "ai_cat_intent",
+            lambda: {
+                f"{intent}_count": count
+                for intent, count in intent_classifier.intent_counts.items()
+            },
+        )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # ログはリクエスト毎ではなく起動時に1度だけ設定し、書き込みは別スレッドで行う
+    configure_logging(create_logging_config())
+
+    # DBのPoolやOpenAIのClient等のリクエストを跨いで共有するオブジェクトは起動時に1度だけ生成する
+    app.state.container = await create_app_container()
+
+    # 最初のリクエストで読み込みや接続が発生しないように、リクエストを受け付ける前に済ませておく
+    if is_startup_warmup_enabled():
+        await warmup_app_container(app.state.container, create_startup_warmup_config())
+
+    register_metrics_snapshots(app.state.container)
+
+    yield
+
+    await app.state.container.aclose()
+
+    shutdown_logging()
+
 
 app = FastAPI(
     title="AI Cat API",
+    lifespan=lifespan,
 )
 
 
@@ -65,6 +153,9 @@ async def validation_exception_handler(
 
 app.include_router(cats.router)
 
+if is_metrics_endpoint_enabled():
+    app.include_router(metrics.router)
+
 
 def start() -> None:
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
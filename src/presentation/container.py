@@ -0,0 +1,269 @@
+import os
+from logging import Logger
+from typing import Optional, Protocol, TypedDict, Union, cast
+from aiomysql import Pool
+from fastapi import Request
+from presentation.stream_coalescer import (
+    StreamCoalescingConfig,
+    create_stream_coalescing_config,
+    is_stream_coalescing_enabled,
+)
+from domain.repository.cat_message_repository_interface import (
+    CatMessageRepositoryInterface,
+)
+from domain.repository.guest_users_conversation_history_repository_interface import (
+    GuestUsersConversationHistoryRepositoryInterface,
+)
+from usecase.db_handler_interface import DbHandlerInterface
+from infrastructure.db import (
+    DbPoolConfig,
+    create_db_connection,
+    create_db_pool,
+    create_db_pool_config,
+    is_db_pool_enabled,
+)
+from infrastructure.openai_client import SharedOpenAiClient, create_openai_client_config
+from infrastructure.open_weather import (
+    WeatherObservation,
+    fetch_current_weather_observation,
+)
+from infrastructure.tokenizer import Tokenizer, get_tokenizer
+from infrastructure.weather_cache import WeatherCache, create_weather_cache_config
+from infrastructure.conversation_cache import (
+    ConversationCache,
+    create_conversation_cache_config,
+    is_conversation_cache_enabled,
+)
+from infrastructure.conversation_history_writer import (
+    ConversationHistoryWriter,
+    create_conversation_history_writer_config,
+    is_conversation_history_write_behind_enabled,
+)
+from infrastructure.admission_controller import (
+    AdmissionController,
+    AdmissionTicket,
+    create_admission_control_config,
+    is_admission_control_enabled,
+)
+from infrastructure.repository.aiomysql.aiomysql_db_handler import AiomysqlDbHandler
+from infrastructure.repository.aiomysql.aiomysql_pool_db_handler import (
+    AiomysqlPoolDbHandler,
+)
+from infrastructure.repository.aiomysql.aiomysql_guest_users_conversation_history_repository import (
+    AiomysqlGuestUsersConversationHistoryRepository,
+)
+from infrastructure.repository.openai.openai_cat_message_repository import (
+    OpenAiCatMessageRepository,
+    OpenAiCatMessageRepositoryConfig,
+    create_openai_cat_message_repository_config,
+)
+from infrastructure.repository.admission_controlled_cat_message_repository import (
+    AdmissionControlledCatMessageRepository,
+)
+from usecase.generate_cat_message_for_guest_user_use_case import (
+    wait_for_client_disconnect_tasks,
+)
+from log.logger import AppLogger
+from log.request_timing import RequestTiming, measure_stage
+
+
+class ConversationHistoryDependencies(TypedDict):
+    db_handler: DbHandlerInterface
+    repository: GuestUsersConversationHistoryRepositoryInterface
+
+
+# コントローラーが利用する依存関係、テストではMockのリポジトリを返す実装に差し替える
+class AppContainerInterface(Protocol):
+    logger: Logger
+    admission_controller: Optional[AdmissionController]
+    conversation_history_writer: Optional[ConversationHistoryWriter]
+    stream_coalescing_config: Optional[StreamCoalescingConfig]
+
+    async def create_conversation_history_dependencies(
+        self, request_timing: Optional[RequestTiming] = None
+    ) -> ConversationHistoryDependencies: ...
+
+    def create_cat_message_repository(
+        self, request_timing: RequestTiming, ticket: Optional[AdmissionTicket]
+    ) -> CatMessageRepositoryInterface: ...
+
+
+# 起動時に1度だけ生成し、プロセス全体で共有するオブジェクトと環境変数から読み込んだ設定を保持する
+# リクエスト毎のオブジェクトはここから生成するので、リクエスト毎に環境変数を読み込んだりClientを生成したりしない
+class AppContainer(AppContainerInterface):
+    def __init__(
+        self,
+        logger: Logger,
+        tokenizer: Tokenizer,
+        openai_client: SharedOpenAiClient,
+        weather_cache: WeatherCache,
+        cat_message_repository_config: OpenAiCatMessageRepositoryConfig,
+        db_pool_config: DbPoolConfig,
+        db_pool: Optional[Pool] = None,
+        conversation_cache: Optional[ConversationCache] = None,
+        conversation_history_writer: Optional[ConversationHistoryWriter] = None,
+        admission_controller: Optional[AdmissionController] = None,
+        stream_coalescing_config: Optional[StreamCoalescingConfig] = None,
+        client_disconnect_shutdown_timeout_seconds: float = 5,
+    ) -> None:
+        self.logger = logger
+        self.tokenizer = tokenizer
+        self.openai_client = openai_client
+        self.weather_cache = weather_cache
+        self.cat_message_repository_config = cat_message_repository_config
+        self.db_pool_config = db_pool_config
+        self.db_pool = db_pool
+        self.conversation_cache = conversation_cache
+        self.conversation_history_writer = conversation_history_writer
+        self.admission_controller = admission_controller
+        self.stream_coalescing_config = stream_coalescing_config
+        self.client_disconnect_shutdown_timeout_seconds = (
+            client_disconnect_shutdown_timeout_seconds
+        )
+
+    async def create_conversation_history_dependencies(
+        self, request_timing: Optional[RequestTiming] = None
+    ) -> ConversationHistoryDependencies:
+        db_handler: Union[AiomysqlDbHandler, AiomysqlPoolDbHandler]
+        if self.db_pool is not None:
+            # Poolを利用する場合、コネクションは会話履歴の読み書きの間だけ借りる
+            # 借りるまでの時間は会話履歴の取得時にリポジトリで記録する
+            db_handler = AiomysqlPoolDbHandler(
+                self.db_pool, self.db_pool_config["health_check_interval_seconds"]
+            )
+        else:
+            with measure_stage(request_timing, "db"):
+                db_handler = AiomysqlDbHandler(await create_db_connection())
+
+        return ConversationHistoryDependencies(
+            db_handler=db_handler,
+            repository=AiomysqlGuestUsersConversationHistoryRepository(
+                db_handler,
+                datetime_context_enabled=self.cat_message_repository_config[
+                    "datetime_context_enabled"
+                ],
+                tokenizer=self.tokenizer,
+                conversation_cache=self.conversation_cache,
+                conversation_history_writer=self.conversation_history_writer,
+                request_timing=request_timing,
+            ),
+        )
+
+    def create_cat_message_repository(
+        self, request_timing: RequestTiming, ticket: Optional[AdmissionTicket]
+    ) -> CatMessageRepositoryInterface:
+        cat_message_repository: CatMessageRepositoryInterface = (
+            OpenAiCatMessageRepository(
+                self.openai_client.client,
+                weather_cache=self.weather_cache,
+                request_timing=request_timing,
+                config=self.cat_message_repository_config,
+            )
+        )
+        if self.admission_controller is not None and ticket is not None:
+            cat_message_repository = AdmissionControlledCatMessageRepository(
+                cat_message_repository, self.admission_controller, ticket
+            )
+        return cat_message_repository
+
+    # クライアントの切断後の後処理、会話履歴の書き込み、バックグラウンドの処理、Poolの順に閉じる
+    async def aclose(self) -> None:
+        # 途中までの応答の保存はPoolやOpenAIのClientを利用するので、閉じる前に終わるのを待つ
+        await wait_for_client_disconnect_tasks(
+            self.logger, self.client_disconnect_shutdown_timeout_seconds
+        )
+
+        # Poolを閉じる前にキューに残っている会話履歴を全て保存する
+        if self.conversation_history_writer is not None:
+            await self.conversation_history_writer.aclose()
+
+        await self.weather_cache.aclose()
+        await self.openai_client.aclose()
+
+        if self.db_pool is not None:
+            self.db_pool.close()
+            await self.db_pool.wait_closed()
+
+
+# 環境変数を読み込んでプロセス全体で共有するオブジェクトを生成し、バックグラウンドの処理を開始する
+async def create_app_container() -> AppContainer:
+    logger = AppLogger().logger
+
+    cat_message_repository_config = create_openai_cat_message_repository_config()
+
+    async def fetch_weather_observation(lat: float, lon: float) -> WeatherObservation:
+        return await fetch_current_weather_observation(
+            lat, lon, cat_message_repository_config["open_weather_api_key"]
+        )
+
+    db_pool_config = create_db_pool_config()
+    db_pool: Optional[Pool] = None
+    if is_db_pool_enabled():
+        db_pool = await create_db_pool(db_pool_config)
+
+    openai_client = SharedOpenAiClient(create_openai_client_config(), logger)
+    openai_client.start_keepalive()
+
+    weather_cache = WeatherCache(
+        fetch_weather_observation, create_weather_cache_config()
+    )
+    weather_cache.start_refresh()
+
+    conversation_cache: Optional[ConversationCache] = None
+    if is_conversation_cache_enabled():
+        conversation_cache = ConversationCache(create_conversation_cache_config())
+
+    admission_controller: Optional[AdmissionController] = None
+    if is_admission_control_enabled():
+        admission_controller = AdmissionController(create_admission_control_config())
+
+    stream_coalescing_config: Optional[StreamCoalescingConfig] = None
+    if is_stream_coalescing_enabled():
+        stream_coalescing_config = create_stream_coalescing_config()
+
+    tokenizer = get_tokenizer()
+
+    # 会話履歴をまとめて保存する為にPoolが必要
+    conversation_history_writer: Optional[ConversationHistoryWriter] = None
+    if is_conversation_history_write_behind_enabled() and db_pool is not None:
+        conversation_history_repository = (
+            AiomysqlGuestUsersConversationHistoryRepository(
+                AiomysqlPoolDbHandler(
+                    db_pool, db_pool_config["health_check_interval_seconds"]
+                ),
+                datetime_context_enabled=cat_message_repository_config[
+                    "datetime_context_enabled"
+                ],
+                tokenizer=tokenizer,
+                conversation_cache=conversation_cache,
+            )
+        )
+        conversation_history_writer = ConversationHistoryWriter(
+            conversation_history_repository.save_conversation_histories,
+            tokenizer,
+            create_conversation_history_writer_config(),
+            conversation_cache=conversation_cache,
+        )
+        conversation_history_writer.start()
+
+    return AppContainer(
+        logger=logger,
+        tokenizer=tokenizer,
+        openai_client=openai_client,
+        weather_cache=weather_cache,
+        cat_message_repository_config=cat_message_repository_config,
+        db_pool_config=db_pool_config,
+        db_pool=db_pool,
+        conversation_cache=conversation_cache,
+        conversation_history_writer=conversation_history_writer,
+        admission_controller=admission_controller,
+        stream_coalescing_config=stream_coalescing_config,
+        client_disconnect_shutdown_timeout_seconds=float(
+            os.getenv("CLIENT_DISCONNECT_SHUTDOWN_TIMEOUT_SECONDS", "5")
+        ),
+    )
+
+
+# lifespanで生成したコンテナを返す、テストでは app.dependency_overrides で差し替える
+def get_app_container(request: Request) -> AppContainerInterface:
+    return cast(AppContainerInterface, request.app.state.container)
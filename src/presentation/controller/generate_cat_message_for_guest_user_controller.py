@@ -3,27 +3,25 @@ from collections.abc import AsyncIterator
 from fastapi import status
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, field_validator, Field
-from presentation.sse import format_sse, generate_error_response
+from presentation.sse import SseMessageEncoder, format_sse, generate_error_response
+from presentation.stream_coalescer import StreamCoalescingConfig, coalesce_stream
+from presentation.container import AppContainerInterface
 from domain.cat import CatId
 from domain.unique_id import is_uuid_format, generate_unique_id
 from domain.message import is_message
-from infrastructure.db import create_db_connection
-from infrastructure.repository.aiomysql.aiomysql_db_handler import AiomysqlDbHandler
-from infrastructure.repository.aiomysql.aiomysql_guest_users_conversation_history_repository import (
-    AiomysqlGuestUsersConversationHistoryRepository,
+from infrastructure.admission_controller import (
+    AdmissionRejectedError,
+    AdmissionTicket,
 )
-from infrastructure.repository.openai.openai_cat_message_repository import (
-    OpenAiCatMessageRepository,
-)
-from log.logger import AppLogger, ErrorLogExtra
+from log.logger import ErrorLogExtra, RequestTimingLogExtra
+from log.metrics import errors_total, sse_frames_per_stream
+from log.request_timing import RequestTiming
 from usecase.generate_cat_message_for_guest_user_use_case import (
     GenerateCatMessageForGuestUserUseCase,
     GenerateCatMessageForGuestUserUseCaseDto,
     GenerateCatMessageForGuestUserUseCaseResult,
     GenerateCatMessageForGuestUserUseCaseErrorResult,
     GenerateCatMessageForGuestUserUseCaseSuccessResult,
-    is_success_result,
-    is_error_result,
 )
 
 
@@ -85,16 +83,37 @@ class GenerateCatMessageForGuestUserErrorResponseBody(BaseModel):
     title: str
 
 
+class GenerateCatMessageForGuestUserTimingResponseBody(BaseModel):
+    ttftMs: Optional[float]
+    tokenCount: int
+    tokensPerSecond: Optional[float]
+    totalDurationMs: float
+    frameCount: int
+    serverTiming: str
+
+
 class GenerateCatMessageForGuestUserController:
     def __init__(
-        self, cat_id: CatId, request_body: GenerateCatMessageForGuestUserRequestBody
+        self,
+        cat_id: CatId,
+        request_body: GenerateCatMessageForGuestUserRequestBody,
+        container: AppContainerInterface,
+        timing_event_enabled: bool = False,
+        stream_coalescing_config: Optional[StreamCoalescingConfig] = None,
     ) -> None:
-        app_logger = AppLogger()
-        self.logger = app_logger.logger
+        self.logger = container.logger
         self.cat_id = cat_id
         self.request_body = request_body
+        self.container = container
+        self.admission_controller = container.admission_controller
+        # 有効な場合はストリーミングの最後に処理時間のイベントを返す
+        self.timing_event_enabled = timing_event_enabled
+        # 指定した場合は複数のトークンをまとめて1つのSSEとして返す
+        self.stream_coalescing_config = stream_coalescing_config
 
     async def exec(self) -> StreamingResponse:
+        request_timing = RequestTiming()
+
         unique_id = generate_unique_id()
 
         conversation_id = unique_id
@@ -105,13 +124,41 @@ class GenerateCatMessageForGuestUserController:
 
         response_headers = {"Ai-Meow-Cat-Request-Id": unique_id}
 
-        try:
-            connection = await create_db_connection()
-
-            db_handler = AiomysqlDbHandler(connection)
+        # DBのコネクションを確保する前に、OpenAIへのリクエストの実行枠が空くのを待つ
+        ticket: Optional[AdmissionTicket] = None
+        if self.admission_controller is not None:
+            try:
+                ticket = await self.admission_controller.acquire(
+                    self.request_body.userId
+                )
+            except AdmissionRejectedError:
+                errors_total.inc(1, "admission_rejected")
+                return StreamingResponse(
+                    content=generate_error_response(
+                        {
+                            "type": "SERVICE_UNAVAILABLE",
+                            "title": "the server is busy. please try again later.",
+                        }
+                    ),
+                    media_type="text/event-stream",
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={**response_headers, "Retry-After": "1"},
+                )
+            # マシンのサイズや台数を決める為に、リクエスト毎の待ち時間を返す
+            response_headers["Ai-Meow-Cat-Queue-Wait-Ms"] = str(
+                round(ticket.wait_seconds * 1000)
+            )
+            request_timing.record("queue", ticket.wait_seconds)
 
-            repository = AiomysqlGuestUsersConversationHistoryRepository(connection)
+        try:
+            conversation_history_dependencies = (
+                await self.container.create_conversation_history_dependencies(
+                    request_timing
+                )
+            )
         except Exception as e:
+            errors_total.inc(1, "db_connect")
+
             self.logger.error(
                 f"An error occurred while connecting to the database: {str(e)}",
                 exc_info=True,
@@ -129,6 +176,11 @@ class GenerateCatMessageForGuestUserController:
                 "title": "an unexpected error has occurred.",
             }
 
+            if ticket is not None:
+                ticket.release()
+
+            response_headers["Server-Timing"] = request_timing.server_timing_header()
+
             return StreamingResponse(
                 content=generate_error_response(db_error_response_body),
                 media_type="text/event-stream",
@@ -136,58 +188,118 @@ class GenerateCatMessageForGuestUserController:
                 headers=response_headers,
             )
 
-        cat_message_repository = OpenAiCatMessageRepository()
-
-        use_case_dto: GenerateCatMessageForGuestUserUseCaseDto = (
-            GenerateCatMessageForGuestUserUseCaseDto(
-                request_id=unique_id,
-                user_id=self.request_body.userId,
-                cat_id=self.cat_id,
-                message=self.request_body.message,
-                db_handler=db_handler,
-                guest_users_conversation_history_repository=repository,
-                cat_message_repository=cat_message_repository,
-            )
+        cat_message_repository = self.container.create_cat_message_repository(
+            request_timing, ticket
+        )
+
+        use_case_dto: GenerateCatMessageForGuestUserUseCaseDto = GenerateCatMessageForGuestUserUseCaseDto(
+            request_id=unique_id,
+            user_id=self.request_body.userId,
+            cat_id=self.cat_id,
+            message=self.request_body.message,
+            db_handler=conversation_history_dependencies["db_handler"],
+            guest_users_conversation_history_repository=conversation_history_dependencies[
+                "repository"
+            ],
+            cat_message_repository=cat_message_repository,
+            request_timing=request_timing,
         )
 
         if self.request_body.conversationId is not None:
             use_case_dto["conversation_id"] = self.request_body.conversationId
 
-        use_case = GenerateCatMessageForGuestUserUseCase(use_case_dto)
+        if self.container.conversation_history_writer is not None:
+            use_case_dto["conversation_history_writer"] = (
+                self.container.conversation_history_writer
+            )
 
-        async def generate_cat_message_for_guest_user_stream() -> AsyncIterator[str]:
-            async for chunk in use_case.execute():
-                use_case_result: GenerateCatMessageForGuestUserUseCaseResult = chunk
+        use_case = GenerateCatMessageForGuestUserUseCase(use_case_dto, self.logger)
 
-                if is_error_result(dict(use_case_result)):
-                    error_result = cast(
-                        GenerateCatMessageForGuestUserUseCaseErrorResult,
-                        use_case_result,
-                    )
-                    yield format_sse(
-                        GenerateCatMessageForGuestUserErrorResponseBody(
-                            type=error_result["type"],
-                            title=error_result["title"],
-                        ).model_dump()
-                    )
-                    continue
-
-                if is_success_result(dict(use_case_result)):
-                    success_result = cast(
-                        GenerateCatMessageForGuestUserUseCaseSuccessResult,
-                        use_case_result,
-                    )
+        use_case_stream = coalesce_stream(
+            use_case.execute(), self.stream_coalescing_config
+        )
+
+        # 最初のトークンを待たずにレスポンスヘッダーを返す為、ヘッダーにはここまでの処理時間だけを含める
+        # 会話履歴の取得以降の内訳はtimingイベントとログで返す
+        if request_timing.stages:
+            response_headers["Server-Timing"] = request_timing.server_timing_header()
+
+        sse_encoder = SseMessageEncoder(conversation_id)
+
+        async def generate_cat_message_for_guest_user_stream() -> AsyncIterator[bytes]:
+            # クライアントが切断するとこのジェネレーターは途中で閉じられるので、ユースケース側にも切断を伝える
+            frame_count = 0
+            try:
+                async for chunk in use_case_stream:
+                    frame_count += 1
+                    yield self._format_use_case_result(chunk, sse_encoder)
+
+                sse_frames_per_stream.observe(frame_count)
 
+                if self.timing_event_enabled:
+                    timing = request_timing.summary()
                     yield format_sse(
-                        GenerateCatMessageForGuestUserSuccessResponseBody(
-                            conversationId=success_result["conversation_id"],
-                            message=success_result["message"],
-                        ).model_dump()
-                    )
-                    continue
+                        GenerateCatMessageForGuestUserTimingResponseBody(
+                            ttftMs=timing["ttft_ms"],
+                            tokenCount=timing["token_count"],
+                            tokensPerSecond=timing["tokens_per_second"],
+                            totalDurationMs=timing["total_duration_ms"],
+                            frameCount=frame_count,
+                            serverTiming=request_timing.server_timing_header(),
+                        ).model_dump(),
+                        event="timing",
+                    ).encode()
+            finally:
+                await use_case_stream.aclose()
+                # 会話履歴の取得に失敗した場合などストリーミングを開始しなかった場合も実行枠を返却する
+                if ticket is not None:
+                    ticket.release()
+                self._log_request_timing(unique_id, conversation_id, request_timing)
 
         return StreamingResponse(
             generate_cat_message_for_guest_user_stream(),
             media_type="text/event-stream",
             headers=response_headers,
         )
+
+    def _log_request_timing(
+        self, request_id: str, conversation_id: str, request_timing: RequestTiming
+    ) -> None:
+        timing = request_timing.summary()
+        self.logger.info(
+            "request timing",
+            extra=RequestTimingLogExtra(
+                request_id=request_id,
+                conversation_id=conversation_id,
+                server_timing=request_timing.server_timing_header(),
+                ttft_ms=timing["ttft_ms"],
+                token_count=timing["token_count"],
+                total_duration_ms=timing["total_duration_ms"],
+            ),
+        )
+
+    # ストリーミングのchunk毎に実行されるので、成功した結果はpydanticのモデルを経由せずにSSEを生成する
+    @staticmethod
+    def _format_use_case_result(
+        use_case_result: GenerateCatMessageForGuestUserUseCaseResult,
+        sse_encoder: SseMessageEncoder,
+    ) -> bytes:
+        if "message" in use_case_result:
+            success_result = cast(
+                GenerateCatMessageForGuestUserUseCaseSuccessResult,
+                use_case_result,
+            )
+            if success_result["conversation_id"] != sse_encoder.conversation_id:
+                sse_encoder = SseMessageEncoder(success_result["conversation_id"])
+            return sse_encoder.encode(success_result["message"])
+
+        error_result = cast(
+            GenerateCatMessageForGuestUserUseCaseErrorResult,
+            use_case_result,
+        )
+        return format_sse(
+            GenerateCatMessageForGuestUserErrorResponseBody(
+                type=error_result["type"],
+                title=error_result["title"],
+            ).model_dump()
+        ).encode()
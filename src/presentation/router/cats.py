@@ -1,7 +1,10 @@
-from fastapi import APIRouter, status, Request, Depends, Path
+from typing import Optional
+from fastapi import APIRouter, status, Depends, Path, Header
 from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBasicCredentials
 from presentation.auth import basic_auth
+from presentation.container import AppContainerInterface, get_app_container
+from presentation.stream_coalescer import resolve_stream_coalescing_config
 from presentation.controller.generate_cat_message_for_guest_user_controller import (
     GenerateCatMessageForGuestUserRequestBody,
     GenerateCatMessageForGuestUserController,
@@ -38,13 +41,25 @@ router = APIRouter()
     },
 )
 async def generate_cat_message_for_guest_user(
-    request: Request,
     request_body: GenerateCatMessageForGuestUserRequestBody,
     cat_id: CatId = Path(
         description="ねこのID .e.g. 'moko'",
         example="4ae80b0f-2e10-4d0d-938e-2c8b0d7a55a1",
     ),
     credentials: HTTPBasicCredentials = Depends(basic_auth),
+    container: AppContainerInterface = Depends(get_app_container),
+    ai_meow_cat_timing: Optional[str] = Header(
+        default=None,
+        description="'1' を指定するとストリーミングの最後に処理時間のイベントを返します。",
+    ),
+    ai_meow_cat_coalesce_max_bytes: Optional[int] = Header(
+        default=None,
+        description="複数のトークンをまとめて返す場合の1つのイベントの最大バイト数。'0' を指定するとまとめずに返します。",
+    ),
+    ai_meow_cat_coalesce_max_delay_ms: Optional[float] = Header(
+        default=None,
+        description="複数のトークンをまとめて返す場合に、次のトークンを待つ最大のミリ秒数。",
+    ),
 ) -> StreamingResponse:
     """
     このエンドポイントはねこ型AIアシスタントのメッセージを生成します。 \n
@@ -60,8 +75,26 @@ async def generate_cat_message_for_guest_user(
     < \n
     data: {"conversationId": "dc2054fa-4edd-42d2-a687-cff529456c0d", "message": "こんにちは"} \n
     data: {"conversationId": "dc2054fa-4edd-42d2-a687-cff529456c0d", "message": "、"} \n
+
+    レスポンスヘッダーの `Server-Timing` でストリーミング開始前に分かる処理時間を返します。 \n
+    リクエストヘッダーに `Ai-Meow-Cat-Timing: 1` を指定すると、最後に以下のイベントを返します。 \n
+    event: timing \n
+    data: {"ttftMs": 812.3, "tokenCount": 42, "tokensPerSecond": 35.1, "totalDurationMs": 2011.4, "frameCount": 12, "serverTiming": "queue;dur=0.2, db;dur=1.3, history;dur=9.6, ttft;dur=812.3"} \n
+
+    `Ai-Meow-Cat-Coalesce-Max-Bytes`, `Ai-Meow-Cat-Coalesce-Max-Delay-Ms` を指定すると、複数のトークンをまとめて1つのイベントとして返します。 \n
+    最初のトークンは常にまとめずに返します。 \n
     """
 
-    controller = GenerateCatMessageForGuestUserController(cat_id, request_body)
+    controller = GenerateCatMessageForGuestUserController(
+        cat_id,
+        request_body,
+        container,
+        timing_event_enabled=ai_meow_cat_timing == "1",
+        stream_coalescing_config=resolve_stream_coalescing_config(
+            container.stream_coalescing_config,
+            ai_meow_cat_coalesce_max_bytes,
+            ai_meow_cat_coalesce_max_delay_ms,
+        ),
+    )
 
     return await controller.exec()
@@ -1,11 +1,15 @@
 # Server Sent Events(SSE)のレスポンスを生成する為の関数郡
 import json
-from typing import Any, Dict, Generator
+import importlib.util
+from typing import Any, Callable, Dict, Generator, Optional
 
 
-def format_sse(response_body: Dict[str, Any]) -> str:
+# eventを指定した場合は、eventを指定しないメッセージだけを処理しているクライアントには無視される
+def format_sse(response_body: Dict[str, Any], event: Optional[str] = None) -> str:
     json_body = json.dumps(response_body, ensure_ascii=False)
     sse_message = f"data: {json_body}\n\n"
+    if event is not None:
+        sse_message = f"event: {event}\n{sse_message}"
     return sse_message
 
 
@@ -13,3 +17,35 @@ def generate_error_response(
     response_body: Dict[str, Any],
 ) -> Generator[str, None, None]:
     yield format_sse(response_body)
+
+
+def is_orjson_available() -> bool:
+    return importlib.util.find_spec("orjson") is not None
+
+
+# orjsonがインストールされている場合は高速なorjsonで文字列をJSONに変換する、どちらもjson.dumps(ensure_ascii=False)と同じ結果になる
+def create_json_string_encoder() -> Callable[[str], bytes]:
+    if not is_orjson_available():
+        return lambda value: json.dumps(value, ensure_ascii=False).encode()
+
+    import orjson
+
+    return orjson.dumps
+
+
+encode_json_string = create_json_string_encoder()
+
+
+# ストリーミングのchunk毎に返すメッセージのSSEを生成する
+# conversationIdは1つのストリーミングの間変わらないので、format_sseと同じ形式の前半部分を1度だけ組み立ててmessageだけを変換する
+class SseMessageEncoder:
+    def __init__(self, conversation_id: str) -> None:
+        self.conversation_id = conversation_id
+        self._prefix = (
+            b'data: {"conversationId": '
+            + encode_json_string(conversation_id)
+            + b', "message": '
+        )
+
+    def encode(self, message: str) -> bytes:
+        return self._prefix + encode_json_string(message) + b"}\n\n"
@@ -0,0 +1,197 @@
+# ユースケースが返すトークン毎の結果を、まとめてから1つのSSEとして返す為の処理
+import os
+import asyncio
+from collections import deque
+from contextlib import aclosing
+from typing import Deque, List, Optional, TypedDict, Union, cast
+from collections.abc import AsyncGenerator
+from usecase.generate_cat_message_for_guest_user_use_case import (
+    GenerateCatMessageForGuestUserUseCaseResult,
+    GenerateCatMessageForGuestUserUseCaseSuccessResult,
+)
+
+
+class StreamCoalescingConfig(TypedDict):
+    # まとめたメッセージのUTF-8のバイト数がこの値以上になったら返す
+    max_bytes: int
+    # 最初にまとめ始めたトークンを受け取ってからこの秒数が経過したら、次のトークンを待たずに返す
+    max_delay_seconds: float
+
+
+# 受け取ったがまだ返していない結果の上限、クライアントへの書き込みが遅い場合はユースケースの結果の受け取りを待たせる
+max_pending_results = 64
+
+
+def is_stream_coalescing_enabled() -> bool:
+    return os.getenv("STREAM_COALESCING_ENABLED", "0") == "1"
+
+
+def create_stream_coalescing_config() -> StreamCoalescingConfig:
+    return StreamCoalescingConfig(
+        max_bytes=int(os.getenv("STREAM_COALESCING_MAX_BYTES", "48")),
+        max_delay_seconds=float(
+            os.getenv("STREAM_COALESCING_MAX_DELAY_SECONDS", "0.005")
+        ),
+    )
+
+
+# リクエストヘッダーで指定した値でアプリケーションの設定を上書きする、max_bytesに0を指定するとまとめずに返す
+def resolve_stream_coalescing_config(
+    config: Optional[StreamCoalescingConfig],
+    max_bytes: Optional[int] = None,
+    max_delay_ms: Optional[float] = None,
+) -> Optional[StreamCoalescingConfig]:
+    if max_bytes is None and max_delay_ms is None:
+        return config
+
+    resolved = (
+        create_stream_coalescing_config()
+        if config is None
+        else StreamCoalescingConfig(**config)
+    )
+    if max_bytes is not None:
+        resolved["max_bytes"] = max_bytes
+    if max_delay_ms is not None:
+        resolved["max_delay_seconds"] = max_delay_ms / 1000
+    return resolved
+
+
+# ユースケースの結果を受け取るタスクが終了した事を伝える為の値
+class _StreamEnd:
+    def __init__(self, error: Optional[BaseException] = None) -> None:
+        self.error = error
+
+
+# 最初のトークンはTTFTが遅くならないように直ちに返す、エラーの結果はそれまでにまとめたメッセージを返した後にそのまま返す
+async def coalesce_use_case_results(
+    results: AsyncGenerator[GenerateCatMessageForGuestUserUseCaseResult, None],
+    config: StreamCoalescingConfig,
+) -> AsyncGenerator[GenerateCatMessageForGuestUserUseCaseResult, None]:
+    loop = asyncio.get_running_loop()
+    # 期限までに次の結果が返らなかった場合もまとめたメッセージを返せるように、ユースケースの結果は別のタスクで受け取る
+    # chunk毎の処理を減らす為、asyncio.Queueは使わずに受け取った結果を溜めて、待っている場合だけ起こす
+    received: Deque[Union[GenerateCatMessageForGuestUserUseCaseResult, _StreamEnd]] = (
+        deque()
+    )
+    waiter: Optional[asyncio.Future[None]] = None
+    # 溜めている結果が上限に達した場合に、返して空きが出来るまで受け取りを待つ
+    space_waiter: Optional[asyncio.Future[None]] = None
+
+    def receive(
+        result: Union[GenerateCatMessageForGuestUserUseCaseResult, _StreamEnd],
+    ) -> None:
+        received.append(result)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def receive_results() -> None:
+        nonlocal space_waiter
+        try:
+            # キャンセルされた場合も、受け取っているタスクで上流のジェネレータを閉じる
+            async with aclosing(results):
+                async for result in results:
+                    receive(result)
+                    if len(received) >= max_pending_results:
+                        space_waiter = loop.create_future()
+                        try:
+                            await space_waiter
+                        finally:
+                            space_waiter = None
+        except Exception as e:
+            receive(_StreamEnd(e))
+        else:
+            receive(_StreamEnd())
+
+    receive_task = asyncio.create_task(receive_results())
+
+    messages: List[str] = []
+    message_bytes = 0
+    conversation_id = ""
+    deadline = 0.0
+    is_first_token = True
+
+    def flush() -> GenerateCatMessageForGuestUserUseCaseSuccessResult:
+        nonlocal message_bytes
+        message = "".join(messages)
+        messages.clear()
+        message_bytes = 0
+        return GenerateCatMessageForGuestUserUseCaseSuccessResult(
+            conversation_id=conversation_id, message=message
+        )
+
+    try:
+        while True:
+            # 溜まっている結果を続けて処理している間も期限を過ぎたらまとめたメッセージを返す
+            if messages and received and loop.time() >= deadline:
+                yield flush()
+
+            if not received:
+                waiter = loop.create_future()
+                try:
+                    if messages:
+                        async with asyncio.timeout_at(deadline):
+                            await waiter
+                    else:
+                        await waiter
+                except TimeoutError:
+                    yield flush()
+                    continue
+                finally:
+                    waiter = None
+            result = received.popleft()
+            if space_waiter is not None and not space_waiter.done():
+                space_waiter.set_result(None)
+
+            if isinstance(result, _StreamEnd):
+                if messages:
+                    yield flush()
+                if result.error is not None:
+                    raise result.error
+                return
+
+            if "message" not in result:
+                if messages:
+                    yield flush()
+                yield result
+                continue
+
+            success_result = cast(
+                GenerateCatMessageForGuestUserUseCaseSuccessResult, result
+            )
+            if is_first_token:
+                is_first_token = False
+                yield success_result
+                continue
+
+            # conversationIdが変わる事は無いが、変わった場合はまとめずに返す
+            if messages and success_result["conversation_id"] != conversation_id:
+                yield flush()
+
+            if not messages:
+                conversation_id = success_result["conversation_id"]
+                deadline = loop.time() + config["max_delay_seconds"]
+            messages.append(success_result["message"])
+            message_bytes += len(success_result["message"].encode())
+
+            if message_bytes >= config["max_bytes"]:
+                yield flush()
+    finally:
+        # クライアントが切断した場合は結果を受け取るタスクをキャンセルして、ユースケースに切断を伝える
+        try:
+            if not receive_task.done():
+                receive_task.cancel()
+                await asyncio.wait({receive_task})
+        finally:
+            # 待機中に再度キャンセルされた場合は、上流のジェネレータはキャンセルされたタスクが閉じる
+            # タスクが開始前にキャンセルされて終わっている場合はここで閉じる
+            if receive_task.done():
+                await results.aclose()
+
+
+def coalesce_stream(
+    results: AsyncGenerator[GenerateCatMessageForGuestUserUseCaseResult, None],
+    config: Optional[StreamCoalescingConfig],
+) -> AsyncGenerator[GenerateCatMessageForGuestUserUseCaseResult, None]:
+    if config is None or config["max_bytes"] <= 0:
+        return results
+    return coalesce_use_case_results(results, config)
@@ -0,0 +1,94 @@
+import os
+import time
+import asyncio
+from typing import Dict, List, TypedDict
+from collections.abc import Awaitable, Callable
+from aiomysql import Pool
+from presentation.container import AppContainer
+from infrastructure.intent_classifier import get_intent_classifier
+from infrastructure.japanese_city_gazetteer import get_japanese_city_gazetteer
+from log.logger import InfoLogExtra
+
+
+class StartupWarmupConfig(TypedDict):
+    # DBやOpenAIへの接続を待つ最大秒数、超えた場合は接続出来ていなくても起動を続ける
+    timeout_seconds: float
+
+
+class StartupWarmupResult(TypedDict):
+    # 準備の処理毎の秒数
+    seconds: Dict[str, float]
+    failed_stages: List[str]
+
+
+def is_startup_warmup_enabled() -> bool:
+    return os.getenv("STARTUP_WARMUP_ENABLED", "1") == "1"
+
+
+def create_startup_warmup_config() -> StartupWarmupConfig:
+    return StartupWarmupConfig(
+        timeout_seconds=float(os.getenv("STARTUP_WARMUP_TIMEOUT_SECONDS", "5")),
+    )
+
+
+async def _ping_db_pool(pool: Pool) -> None:
+    connection = await pool.acquire()
+    try:
+        await connection.ping(reconnect=False)
+    finally:
+        pool.release(connection)
+
+
+# lifespanの中で実行するので、全ての準備が終わるまでリクエストを受け付けない
+# 自動停止したマシンの起動直後のリクエストで、ファイルの読み込みや接続の確立を待たせないようにする
+async def warmup_app_container(
+    container: AppContainer, config: StartupWarmupConfig
+) -> StartupWarmupResult:
+    result = StartupWarmupResult(seconds={}, failed_stages=[])
+
+    def run_stage(name: str, load: Callable[[], object]) -> None:
+        started_at = time.perf_counter()
+        try:
+            load()
+        except Exception as e:
+            result["failed_stages"].append(name)
+            container.logger.warning(f"startup warmup {name} failed: {str(e)}")
+        result["seconds"][name] = round(time.perf_counter() - started_at, 4)
+
+    async def run_stage_async(
+        name: str, connect: Callable[[], Awaitable[None]]
+    ) -> None:
+        started_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(connect(), timeout=config["timeout_seconds"])
+        except Exception as e:
+            result["failed_stages"].append(name)
+            container.logger.warning(
+                f"startup warmup {name} failed: {type(e).__name__} {str(e)}"
+            )
+        result["seconds"][name] = round(time.perf_counter() - started_at, 4)
+
+    # tiktokenは最初のencodeで正規表現等を準備するので、実際に1度計算しておく
+    run_stage("tokenizer", lambda: container.tokenizer.count("ねこちゃんこんにちは🐱"))
+    run_stage("gazetteer", get_japanese_city_gazetteer)
+    if container.cat_message_repository_config["intent_classifier_enabled"]:
+        run_stage("intent_classifier", get_intent_classifier)
+
+    connections: List[Awaitable[None]] = [
+        run_stage_async("openai", container.openai_client.warmup)
+    ]
+    db_pool = container.db_pool
+    if db_pool is not None:
+        connections.append(run_stage_async("db", lambda: _ping_db_pool(db_pool)))
+    await asyncio.gather(*connections)
+
+    container.logger.info(
+        "startup warmup completed",
+        extra=InfoLogExtra(
+            info_message=", ".join(
+                f"{name}={seconds}s" for name, seconds in result["seconds"].items()
+            )
+        ),
+    )
+
+    return result
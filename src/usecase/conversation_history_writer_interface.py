@@ -0,0 +1,8 @@
+from typing import Protocol
+from domain.repository.guest_users_conversation_history_repository_interface import (
+    SaveGuestUsersConversationHistoryDto,
+)
+
+
+class ConversationHistoryWriterInterface(Protocol):
+    async def enqueue(self, dto: SaveGuestUsersConversationHistoryDto) -> None: ...
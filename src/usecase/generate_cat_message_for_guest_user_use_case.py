@@ -1,15 +1,60 @@
-from typing import TypedDict, Union, Dict, Any
-from collections.abc import AsyncIterator
+import time
+import asyncio
+from logging import Logger
+from typing import TypedDict, Union, Dict, Any, Optional, Set
+from collections.abc import AsyncGenerator
 from usecase.db_handler_interface import DbHandlerInterface
+from usecase.conversation_history_writer_interface import (
+    ConversationHistoryWriterInterface,
+)
 from domain.repository.guest_users_conversation_history_repository_interface import (
     GuestUsersConversationHistoryRepositoryInterface,
+    SaveGuestUsersConversationHistoryDto,
 )
 from domain.repository.cat_message_repository_interface import (
     CatMessageRepositoryInterface,
     GenerateMessageForGuestUserDto,
+    GenerateMessageForGuestUserResult,
 )
 from domain.cat import CatId
-from log.logger import AppLogger, ErrorLogExtra, SuccessLogExtra
+from log.logger import (
+    AppLogger,
+    ClientDisconnectedLogExtra,
+    ErrorLogExtra,
+    SuccessLogExtra,
+)
+from log.metrics import (
+    errors_total,
+    in_flight_streams,
+    inter_token_gap_seconds,
+    stream_duration_seconds,
+    streamed_tokens_total,
+    ttft_seconds,
+)
+from log.request_timing import RequestTiming, measure_stage
+
+# クライアントの切断後に実行する後処理のタスク、実行中にGCで破棄されないように参照を保持する
+_disconnect_tasks: Set[asyncio.Task[None]] = set()
+
+
+# 終了時にDBのPool等を閉じる前に呼び出し、クライアントの切断後の後処理が終わるのを待つ
+# 待ちきれなかった後処理は中断し、保存出来なかった事が分かるようにログに出力する
+async def wait_for_client_disconnect_tasks(
+    logger: Logger, timeout_seconds: float
+) -> None:
+    if not _disconnect_tasks:
+        return
+
+    _, pending = await asyncio.wait(set(_disconnect_tasks), timeout=timeout_seconds)
+    if not pending:
+        return
+
+    logger.warning(
+        f"cancelled {len(pending)} tasks after the client disconnected on shutdown"
+    )
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
 
 
 class GenerateCatMessageForGuestUserUseCaseDtoRequiredType(TypedDict):
@@ -26,6 +71,10 @@ class GenerateCatMessageForGuestUserUseCaseDtoRequiredType(TypedDict):
 
 class GenerateCatMessageForGuestUserUseCaseDtoOptionalType(TypedDict, total=False):
     conversation_id: str
+    # 指定した場合は会話履歴をキューに入れるだけで、DBへの保存はバックグラウンドでまとめて行う
+    conversation_history_writer: ConversationHistoryWriterInterface
+    # 指定した場合は処理時間の内訳を記録する
+    request_timing: RequestTiming
 
 
 class GenerateCatMessageForGuestUserUseCaseDto(
@@ -76,29 +125,42 @@ def is_error_result(result: Dict[str, Any]) -> bool:
 
 
 class GenerateCatMessageForGuestUserUseCase:
-    def __init__(self, dto: GenerateCatMessageForGuestUserUseCaseDto) -> None:
-        app_logger = AppLogger()
-        self.logger = app_logger.logger
+    # loggerは起動時に生成したものを渡す想定、省略時はAppLoggerから取得する
+    def __init__(
+        self,
+        dto: GenerateCatMessageForGuestUserUseCaseDto,
+        logger: Optional[Logger] = None,
+    ) -> None:
+        if logger is None:
+            logger = AppLogger().logger
+        self.logger = logger
         self.dto = dto
+        # クライアントが切断した場合はDBの後処理を別のタスクに任せる
+        self._disconnected = False
 
     async def execute(
         self,
-    ) -> AsyncIterator[GenerateCatMessageForGuestUserUseCaseResult]:
+    ) -> AsyncGenerator[GenerateCatMessageForGuestUserUseCaseResult, None]:
         conversation_id: str = self.dto["request_id"]
         if self.dto.get("conversation_id") is not None:
             conversation_id = self.dto["conversation_id"]
 
+        request_timing = self.dto.get("request_timing")
+
         try:
-            chat_messages = await self.dto[
-                "guest_users_conversation_history_repository"
-            ].create_messages_with_conversation_history(
-                {
-                    "conversation_id": conversation_id,
-                    "request_message": self.dto["message"],
-                    "cat_id": self.dto["cat_id"],
-                }
-            )
+            with measure_stage(request_timing, "history"):
+                chat_messages = await self.dto[
+                    "guest_users_conversation_history_repository"
+                ].create_messages_with_conversation_history(
+                    {
+                        "conversation_id": conversation_id,
+                        "request_message": self.dto["message"],
+                        "cat_id": self.dto["cat_id"],
+                    }
+                )
         except Exception as e:
+            errors_total.inc(1, "history_read")
+
             self.logger.error(
                 f"An error occurred while connecting to the database: {str(e)}",
                 exc_info=True,
@@ -119,24 +181,46 @@ class GenerateCatMessageForGuestUserUseCase:
             yield db_error
             return
 
+        # AIの応答を結合するための変数
+        ai_response_message = ""
+
+        ai_response_id = ""
+
+        streaming_completed = False
+
+        create_message_for_guest_user_dto = GenerateMessageForGuestUserDto(
+            cat_id=self.dto["cat_id"],
+            user_id=self.dto["user_id"],
+            chat_messages=chat_messages,
+        )
+        # 途中で中断した場合も明示的に閉じる為に、ジェネレーターを保持しておく
+        generated_messages = self.dto[
+            "cat_message_repository"
+        ].generate_message_for_guest_user(create_message_for_guest_user_dto)
+
+        in_flight_streams.inc()
+
         try:
             # AIの応答を一時的に保存するためのリスト
             ai_responses = []
 
-            # AIの応答を結合するための変数
-            ai_response_message = ""
-
-            create_message_for_guest_user_dto = GenerateMessageForGuestUserDto(
-                cat_id=self.dto["cat_id"],
-                user_id=self.dto["user_id"],
-                chat_messages=chat_messages,
-            )
+            started_at = time.perf_counter()
+            last_chunk_at = started_at
+            is_first_chunk = True
+
+            async for chunk in generated_messages:
+                # chunk毎に記録するので、ヒストグラムのバケットに加算するだけの処理にしている
+                now = time.perf_counter()
+                if is_first_chunk:
+                    ttft_seconds.observe(now - started_at)
+                    is_first_chunk = False
+                else:
+                    inter_token_gap_seconds.observe(now - last_chunk_at)
+                last_chunk_at = now
+                streamed_tokens_total.inc()
+                if request_timing is not None:
+                    request_timing.record_token()
 
-            ai_response_id = ""
-
-            async for chunk in self.dto[
-                "cat_message_repository"
-            ].generate_message_for_guest_user(create_message_for_guest_user_dto):
                 # AIの応答を更新
                 ai_response_message += chunk.get("message") or ""
 
@@ -150,25 +234,22 @@ class GenerateCatMessageForGuestUserUseCase:
 
                 yield result_chunk
 
+            streaming_completed = True
+            stream_duration_seconds.observe(time.perf_counter() - started_at)
+            in_flight_streams.dec()
+
             ai_responses.append({"role": "assistant", "content": ai_response_message})
 
-            # ストリーミングが終了したときに会話履歴をDBに保存する
-            await self.dto["db_handler"].begin()
-
-            await self.dto[
-                "guest_users_conversation_history_repository"
-            ].save_conversation_history(
-                {
-                    "conversation_id": conversation_id,
-                    "cat_id": self.dto["cat_id"],
-                    "user_id": self.dto["user_id"],
-                    "user_message": self.dto["message"],
-                    "ai_message": ai_response_message,
-                }
+            await self._save_conversation_history(
+                SaveGuestUsersConversationHistoryDto(
+                    conversation_id=conversation_id,
+                    cat_id=self.dto["cat_id"],
+                    user_id=self.dto["user_id"],
+                    user_message=self.dto["message"],
+                    ai_message=ai_response_message,
+                )
             )
 
-            await self.dto["db_handler"].commit()
-
             self.logger.info(
                 "success",
                 extra=SuccessLogExtra(
@@ -179,7 +260,32 @@ class GenerateCatMessageForGuestUserUseCase:
                     ai_response_id=ai_response_id,
                 ),
             )
+        except (asyncio.CancelledError, GeneratorExit):
+            if streaming_completed:
+                raise
+
+            in_flight_streams.dec()
+
+            # クライアントが切断するとこのタスクはキャンセルされ以降のawaitも中断されるので、後処理は別のタスクで行う
+            self._disconnected = True
+            disconnect_task = asyncio.create_task(
+                self._handle_client_disconnect(
+                    conversation_id,
+                    ai_response_id,
+                    ai_response_message,
+                    generated_messages,
+                )
+            )
+            _disconnect_tasks.add(disconnect_task)
+            disconnect_task.add_done_callback(_disconnect_tasks.discard)
+            raise
         except Exception as e:
+            if streaming_completed:
+                errors_total.inc(1, "history_write")
+            else:
+                in_flight_streams.dec()
+                errors_total.inc(1, "generation")
+
             await self.dto["db_handler"].rollback()
 
             self.logger.error(
@@ -200,5 +306,82 @@ class GenerateCatMessageForGuestUserUseCase:
             )
 
             yield unexpected_error
+        finally:
+            if not self._disconnected:
+                await generated_messages.aclose()
+                self.dto["db_handler"].close()
+
+    async def _save_conversation_history(
+        self, conversation_history: SaveGuestUsersConversationHistoryDto
+    ) -> None:
+        conversation_history_writer = self.dto.get("conversation_history_writer")
+        if conversation_history_writer is not None:
+            await conversation_history_writer.enqueue(conversation_history)
+            return
+
+        # ストリーミングが終了したときに会話履歴をDBに保存する
+        await self.dto["db_handler"].begin()
+
+        await self.dto[
+            "guest_users_conversation_history_repository"
+        ].save_conversation_history(conversation_history)
+
+        await self.dto["db_handler"].commit()
+
+    # OpenAIのストリーミングを直ちに閉じて、途中までの応答を中断した事が分かるように保存する
+    async def _handle_client_disconnect(
+        self,
+        conversation_id: str,
+        ai_response_id: str,
+        ai_response_message: str,
+        generated_messages: AsyncGenerator[GenerateMessageForGuestUserResult, None],
+    ) -> None:
+        try:
+            await self.dto["cat_message_repository"].cancel_generation()
+            # 切断されたタスクの中では後処理のawaitも中断されるので、リポジトリのジェネレーターはここで閉じる
+            await generated_messages.aclose()
+
+            self.logger.info(
+                "client disconnected",
+                extra=ClientDisconnectedLogExtra(
+                    request_id=self.dto["request_id"],
+                    conversation_id=conversation_id,
+                    cat_id=self.dto["cat_id"],
+                    user_id=self.dto["user_id"],
+                    ai_response_id=ai_response_id,
+                    ai_message_length=len(ai_response_message),
+                ),
+            )
+
+            # 応答を1文字も返していない場合は会話として成立していないので保存しない
+            if ai_response_message == "":
+                return
+
+            await self._save_conversation_history(
+                SaveGuestUsersConversationHistoryDto(
+                    conversation_id=conversation_id,
+                    cat_id=self.dto["cat_id"],
+                    user_id=self.dto["user_id"],
+                    user_message=self.dto["message"],
+                    ai_message=ai_response_message,
+                    ai_message_truncated=True,
+                )
+            )
+        except Exception as e:
+            errors_total.inc(1, "history_write")
+
+            await self.dto["db_handler"].rollback()
+
+            self.logger.error(
+                f"An error occurred after the client disconnected: {str(e)}",
+                exc_info=True,
+                extra=ErrorLogExtra(
+                    request_id=self.dto["request_id"],
+                    conversation_id=conversation_id,
+                    cat_id=self.dto["cat_id"],
+                    user_id=self.dto["user_id"],
+                    user_message=self.dto["message"],
+                ),
+            )
         finally:
             self.dto["db_handler"].close()
@@ -0,0 +1,24 @@
+import os
+import aiomysql
+from aiomysql import Pool
+from typing import Tuple
+from tests.db.create_and_setup_db_connection import create_and_setup_db_connection
+
+
+async def create_and_setup_db_pool() -> Tuple[Pool, str]:
+    connection, test_db_name = await create_and_setup_db_connection()
+    connection.close()
+
+    pool = await aiomysql.create_pool(
+        minsize=1,
+        maxsize=2,
+        host="ai-cat-api-mysql",
+        port=3306,
+        user="root",
+        password=os.getenv("DB_PASSWORD"),
+        db=test_db_name,
+        cursorclass=aiomysql.DictCursor,
+        autocommit=True,
+    )
+
+    return pool, test_db_name
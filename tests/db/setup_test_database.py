@@ -1,10 +1,17 @@
 import os
 import requests
 import uuid
+import pymysql
+from pathlib import Path
 from typing import TypedDict, List
 from aiomysql import Connection
 from functools import lru_cache
 
+migrations_dir = Path(__file__).parent.parent.parent / "db" / "migrations"
+
+# 既にカラムが存在する場合のエラー、PlanetScaleのブランチに適用済みのマイグレーションは読み飛ばす
+duplicate_column_error_code = 1060
+
 
 class TableSchema(TypedDict):
     name: str
@@ -48,6 +55,14 @@ async def setup_test_database(connection: Connection, db_name: str) -> None:
             create_table_sql = table["raw"].replace("\n", " ").replace("\t", " ")
             await cursor.execute(create_table_sql)
 
+        # PlanetScaleのブランチにまだ適用していないマイグレーションも含めてテストする
+        for migration_path in sorted(migrations_dir.glob("*.sql")):
+            try:
+                await cursor.execute(migration_path.read_text(encoding="utf-8"))
+            except pymysql.err.OperationalError as e:
+                if e.args[0] != duplicate_column_error_code:
+                    raise
+
 
 def create_test_db_name() -> str:
     return f"test_db_{uuid.uuid4().hex[:8]}"
@@ -0,0 +1,20 @@
+from datetime import datetime, timezone
+from domain.cat import create_datetime_context_prompt
+
+
+def test_create_datetime_context_prompt():
+    now = datetime(2024, 11, 30, 15, 4, 59, 123456, tzinfo=timezone.utc)
+
+    expected = (
+        "# Context\n- 現在日時（Asia/Tokyo）: 2024-12-01T00:04:00+09:00（日曜日）"
+    )
+
+    assert create_datetime_context_prompt(now) == expected
+
+
+def test_create_datetime_context_prompt_is_same_within_a_minute():
+    assert create_datetime_context_prompt(
+        datetime(2024, 12, 1, 0, 4, 0, tzinfo=timezone.utc)
+    ) == create_datetime_context_prompt(
+        datetime(2024, 12, 1, 0, 4, 59, tzinfo=timezone.utc)
+    )
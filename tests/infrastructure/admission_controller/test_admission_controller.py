@@ -0,0 +1,141 @@
+import asyncio
+from typing import List
+import pytest
+from infrastructure.admission_controller import (
+    AdmissionControlConfig,
+    AdmissionController,
+    AdmissionRejectedError,
+    AdmissionTicket,
+)
+
+
+def create_config(**overrides: object) -> AdmissionControlConfig:
+    config = AdmissionControlConfig(
+        max_concurrency=1,
+        min_concurrency=1,
+        max_queue_size=10,
+        queue_timeout_seconds=1,
+        adaptive_enabled=False,
+        target_ttft_seconds=1,
+    )
+    config.update(overrides)  # type: ignore[typeddict-item]
+    return config
+
+
+@pytest.mark.asyncio
+async def test_acquire_without_waiting_under_limit():
+    controller = AdmissionController(create_config(max_concurrency=2))
+
+    first = await controller.acquire("user-1")
+    second = await controller.acquire("user-1")
+
+    assert first.wait_seconds == 0
+    assert second.wait_seconds == 0
+    assert controller.snapshot()["in_flight"] == 2
+
+    first.release()
+    # 複数回呼び出しても1度だけ返却する
+    first.release()
+    second.release()
+
+    assert controller.snapshot()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_waiting_requests_are_admitted_in_round_robin_per_user():
+    controller = AdmissionController(create_config())
+    ticket = await controller.acquire("user-a")
+    admitted_users: List[str] = []
+    admitted_tickets: asyncio.Queue[AdmissionTicket] = asyncio.Queue()
+
+    async def acquire(user_id: str) -> None:
+        admitted_ticket = await controller.acquire(user_id)
+        admitted_users.append(user_id)
+        admitted_tickets.put_nowait(admitted_ticket)
+
+    tasks = [
+        asyncio.create_task(acquire(user_id))
+        for user_id in ["user-a", "user-a", "user-a", "user-b"]
+    ]
+    await asyncio.sleep(0)
+    assert controller.snapshot()["queue_depth"] == 4
+
+    ticket.release()
+    for _ in tasks:
+        (await asyncio.wait_for(admitted_tickets.get(), 1)).release()
+    await asyncio.gather(*tasks)
+
+    # user-aが先に3件待っていても、user-bは2番目に実行枠を割り当てられる
+    assert admitted_users == ["user-a", "user-b", "user-a", "user-a"]
+    assert controller.snapshot()["queued_count"] == 4
+    assert controller.snapshot()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_reject_when_queue_is_full():
+    controller = AdmissionController(create_config(max_queue_size=1))
+    ticket = await controller.acquire("user-1")
+    waiting_task = asyncio.create_task(controller.acquire("user-2"))
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejectedError):
+        await controller.acquire("user-3")
+
+    ticket.release()
+    (await waiting_task).release()
+    assert controller.snapshot()["rejected_count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_reject_when_queue_timeout_is_exceeded():
+    controller = AdmissionController(create_config(queue_timeout_seconds=0.01))
+    ticket = await controller.acquire("user-1")
+
+    with pytest.raises(AdmissionRejectedError):
+        await controller.acquire("user-2")
+
+    snapshot = controller.snapshot()
+    assert snapshot["rejected_count"] == 1
+    assert snapshot["queue_depth"] == 0
+
+    ticket.release()
+    assert controller.snapshot()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_reject_immediately_when_estimated_wait_exceeds_timeout():
+    controller = AdmissionController(create_config(queue_timeout_seconds=0.05))
+    ticket = await controller.acquire("user-1")
+    await asyncio.sleep(0.1)
+    ticket.release()
+
+    ticket = await controller.acquire("user-1")
+
+    # 1件あたり0.1秒かかっているので、待っても0.05秒以内に実行枠は空かない
+    with pytest.raises(AdmissionRejectedError):
+        await controller.acquire("user-2")
+    assert controller.snapshot()["queued_count"] == 0
+
+    ticket.release()
+
+
+@pytest.mark.asyncio
+async def test_adaptive_concurrency_limit():
+    controller = AdmissionController(
+        create_config(
+            adaptive_enabled=True,
+            max_concurrency=10,
+            min_concurrency=5,
+            target_ttft_seconds=1,
+        )
+    )
+
+    for _ in range(10):
+        controller.record_ttft(3)
+
+    assert controller.snapshot()["concurrency_limit"] == 5
+
+    for _ in range(100):
+        controller.record_ttft(0.5)
+
+    assert controller.snapshot()["concurrency_limit"] == 10
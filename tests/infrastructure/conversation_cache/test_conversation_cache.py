@@ -0,0 +1,114 @@
+import pytest
+from infrastructure.conversation_cache import (
+    ConversationCache,
+    ConversationTurn,
+    ConversationWindow,
+)
+
+
+def create_turn(index: int) -> ConversationTurn:
+    return {
+        "user_message": f"{index}番目のメッセージ",
+        "ai_message": f"{index}番目の返信",
+        "user_message_token_count": 10,
+        "ai_message_token_count": 10,
+    }
+
+
+def create_window(size: int, truncated: bool = False) -> ConversationWindow:
+    return {"turns": [create_turn(i) for i in range(size)], "truncated": truncated}
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    fake_clock = FakeClock()
+    monkeypatch.setattr("infrastructure.conversation_cache.time.monotonic", fake_clock)
+    return fake_clock
+
+
+def test_get_returns_stored_window(clock):
+    cache = ConversationCache({"ttl_seconds": 60, "max_bytes": 1024 * 1024})
+
+    assert cache.get("conversation-1") is None
+
+    cache.put("conversation-1", create_window(2))
+
+    assert cache.get("conversation-1") == create_window(2)
+    assert cache.snapshot()["hit_count"] == 1
+    assert cache.snapshot()["miss_count"] == 1
+    assert cache.snapshot()["hit_ratio"] == 0.5
+
+
+def test_get_returns_none_after_ttl(clock):
+    cache = ConversationCache({"ttl_seconds": 60, "max_bytes": 1024 * 1024})
+    cache.put("conversation-1", create_window(2))
+
+    clock.now += 61
+
+    assert cache.get("conversation-1") is None
+    assert cache.snapshot()["size"] == 0
+    assert cache.snapshot()["size_bytes"] == 0
+
+
+def test_put_evicts_least_recently_used_over_max_bytes(clock):
+    cache = ConversationCache({"ttl_seconds": 60, "max_bytes": 1024 * 1024})
+    cache.put("conversation-1", create_window(2))
+    size_bytes = cache.size_bytes
+    cache = ConversationCache({"ttl_seconds": 60, "max_bytes": size_bytes * 2})
+
+    cache.put("conversation-1", create_window(2))
+    cache.put("conversation-2", create_window(2))
+    cache.get("conversation-1")
+    cache.put("conversation-3", create_window(2))
+
+    assert cache.get("conversation-2") is None
+    assert cache.get("conversation-1") is not None
+    assert cache.get("conversation-3") is not None
+    assert cache.snapshot()["eviction_count"] == 1
+    assert cache.size_bytes <= size_bytes * 2
+
+
+def test_put_skips_window_larger_than_max_bytes(clock):
+    cache = ConversationCache({"ttl_seconds": 60, "max_bytes": 100})
+
+    cache.put("conversation-1", create_window(2))
+
+    assert cache.get("conversation-1") is None
+    assert cache.size_bytes == 0
+
+
+def test_append_turn_updates_cached_window(clock):
+    cache = ConversationCache({"ttl_seconds": 60, "max_bytes": 1024 * 1024})
+    cache.put("conversation-1", create_window(1))
+
+    cache.append_turn("conversation-1", create_turn(1))
+    cache.append_turn("conversation-2", create_turn(1))
+
+    assert cache.get("conversation-1") == create_window(2)
+    assert cache.get("conversation-2") is None
+
+
+def test_append_turn_keeps_latest_window(clock):
+    cache = ConversationCache({"ttl_seconds": 60, "max_bytes": 1024 * 1024})
+    cache.put("conversation-1", create_window(9, truncated=True))
+
+    cache.append_turn("conversation-1", create_turn(9))
+
+    # 直近の10件が全てキャッシュに存在するので、取得しなかった古い会話は不要になる
+    assert cache.get("conversation-1") == create_window(10)
+
+    cache.append_turn("conversation-1", create_turn(10))
+
+    window = cache.get("conversation-1")
+    assert window is not None
+    assert len(window["turns"]) == 10
+    assert window["turns"][0] == create_turn(1)
+    assert window["turns"][-1] == create_turn(10)
@@ -0,0 +1,308 @@
+import json
+import asyncio
+import logging
+from typing import List
+import pytest
+from domain.repository.guest_users_conversation_history_repository_interface import (
+    SaveGuestUsersConversationHistoryDto,
+)
+from infrastructure.conversation_cache import ConversationCache
+from infrastructure.conversation_history_writer import (
+    ConversationHistoryRecord,
+    ConversationHistoryWriter,
+    ConversationHistoryWriterConfig,
+)
+from infrastructure.tokenizer import Tokenizer
+from log.logger import JsonFormatter
+from tests.infrastructure.tokenizer.byte_encoding import create_byte_encoding
+
+
+class FakeSaveConversationHistories:
+    def __init__(self, failures: int = 0) -> None:
+        self.failures = failures
+        self.batches: List[List[ConversationHistoryRecord]] = []
+
+    async def __call__(self, records: List[ConversationHistoryRecord]) -> None:
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("database is unavailable")
+        self.batches.append(records)
+
+
+def create_config(**overrides: float) -> ConversationHistoryWriterConfig:
+    config = ConversationHistoryWriterConfig(
+        max_queue_size=100,
+        batch_size=3,
+        flush_interval_seconds=0.05,
+        max_retries=2,
+        retry_backoff_seconds=0.001,
+    )
+    config.update(overrides)  # type: ignore[typeddict-item]
+    return config
+
+
+def create_writer(
+    save: FakeSaveConversationHistories,
+    config: ConversationHistoryWriterConfig,
+    conversation_cache: ConversationCache | None = None,
+) -> ConversationHistoryWriter:
+    return ConversationHistoryWriter(
+        save,
+        Tokenizer(create_byte_encoding(), offload_threshold_chars=2000),
+        config,
+        conversation_cache=conversation_cache,
+    )
+
+
+def create_dto(
+    index: int, conversation_id: str = "conversation-1"
+) -> SaveGuestUsersConversationHistoryDto:
+    return {
+        "conversation_id": conversation_id,
+        "cat_id": "moko",
+        "user_id": "user-1",
+        "user_message": f"message-{index}",
+        "ai_message": f"reply-{index}",
+    }
+
+
+@pytest.mark.asyncio
+async def test_flush_when_batch_size_is_reached():
+    save = FakeSaveConversationHistories()
+    writer = create_writer(save, create_config(flush_interval_seconds=10))
+    writer.start()
+
+    for i in range(3):
+        await writer.enqueue(create_dto(i))
+
+    await asyncio.sleep(0.01)
+
+    assert [len(batch) for batch in save.batches] == [3]
+    assert save.batches[0][0]["user_message_token_count"] == len("message-0")
+    assert save.batches[0][0]["ai_message_token_count"] == len("reply-0")
+
+    await writer.aclose()
+
+
+@pytest.mark.asyncio
+async def test_flush_when_flush_interval_has_elapsed():
+    save = FakeSaveConversationHistories()
+    writer = create_writer(save, create_config())
+    writer.start()
+
+    await writer.enqueue(create_dto(0))
+    await asyncio.sleep(0.01)
+
+    assert save.batches == []
+
+    await asyncio.sleep(0.1)
+
+    assert [len(batch) for batch in save.batches] == [1]
+
+    await writer.aclose()
+
+
+@pytest.mark.asyncio
+async def test_pending_turns_until_flushed():
+    save = FakeSaveConversationHistories()
+    writer = create_writer(save, create_config())
+    writer.start()
+
+    await writer.enqueue(create_dto(0))
+    await writer.enqueue(create_dto(1, conversation_id="conversation-2"))
+
+    assert [
+        turn["user_message"] for turn in writer.pending_turns("conversation-1")
+    ] == ["message-0"]
+
+    await writer.aclose()
+
+    assert writer.pending_turns("conversation-1") == []
+    assert writer.pending_turns("conversation-2") == []
+
+
+@pytest.mark.asyncio
+async def test_pending_turns_keeps_repeated_turns():
+    save = FakeSaveConversationHistories()
+    writer = create_writer(save, create_config(flush_interval_seconds=10))
+
+    # 同じ内容の会話が続いても別の会話として扱う
+    await writer.enqueue(create_dto(0))
+    await writer.enqueue(create_dto(0))
+
+    assert [
+        turn["user_message"] for turn in writer.pending_turns("conversation-1")
+    ] == ["message-0", "message-0"]
+
+    writer.start()
+    await writer.aclose()
+
+    assert [len(batch) for batch in save.batches] == [2]
+    assert writer.pending_turns("conversation-1") == []
+
+
+@pytest.mark.asyncio
+async def test_flush_waits_while_reading_pending_turns():
+    save = FakeSaveConversationHistories()
+    writer = create_writer(save, create_config(flush_interval_seconds=0.01))
+    writer.start()
+
+    await writer.enqueue(create_dto(0))
+    async with writer.read_pending_turns("conversation-1") as pending_turns:
+        # DBから会話履歴を取得している間は同じ会話を保存しない
+        await asyncio.sleep(0.05)
+        assert save.batches == []
+        assert [turn["user_message"] for turn in pending_turns] == ["message-0"]
+
+    await asyncio.sleep(0.01)
+
+    assert [len(batch) for batch in save.batches] == [1]
+    assert writer.pending_turns("conversation-1") == []
+
+    await writer.aclose()
+
+
+class SlowSaveConversationHistories(FakeSaveConversationHistories):
+    async def __call__(self, records: List[ConversationHistoryRecord]) -> None:
+        await asyncio.sleep(0.05)
+        await super().__call__(records)
+
+
+@pytest.mark.asyncio
+async def test_read_pending_turns_waits_for_flush():
+    save = SlowSaveConversationHistories()
+    writer = create_writer(save, create_config(batch_size=1))
+    writer.start()
+
+    await writer.enqueue(create_dto(0))
+    await asyncio.sleep(0.01)
+
+    # 保存中の会話は保存し終わるまで待ち、DBの結果と重複しないようにキューから取り除いた後の状態を返す
+    async with writer.read_pending_turns("conversation-1") as pending_turns:
+        assert [len(batch) for batch in save.batches] == [1]
+        assert pending_turns == []
+
+    await writer.aclose()
+
+
+@pytest.mark.asyncio
+async def test_aclose_drains_queue():
+    save = FakeSaveConversationHistories()
+    writer = create_writer(save, create_config(flush_interval_seconds=10))
+    writer.start()
+
+    for i in range(7):
+        await writer.enqueue(create_dto(i))
+
+    await writer.aclose()
+
+    assert [len(batch) for batch in save.batches] == [3, 3, 1]
+    assert writer.snapshot()["queue_depth"] == 0
+    assert writer.snapshot()["flushed_count"] == 7
+
+
+@pytest.mark.asyncio
+async def test_retry_until_saved():
+    save = FakeSaveConversationHistories(failures=2)
+    writer = create_writer(save, create_config())
+    writer.start()
+
+    await writer.enqueue(create_dto(0))
+    await writer.aclose()
+
+    snapshot = writer.snapshot()
+    assert len(save.batches) == 1
+    assert snapshot["retry_count"] == 2
+    assert snapshot["dropped_count"] == 0
+
+
+@pytest.mark.asyncio
+async def test_drop_after_max_retries():
+    save = FakeSaveConversationHistories(failures=3)
+    cache = ConversationCache({"ttl_seconds": 60, "max_bytes": 1024 * 1024})
+    cache.put("conversation-1", {"turns": [], "truncated": False})
+    writer = create_writer(save, create_config(), conversation_cache=cache)
+    writer.start()
+
+    await writer.enqueue(create_dto(0))
+    await writer.enqueue(create_dto(1))
+    await writer.aclose()
+
+    snapshot = writer.snapshot()
+    assert save.batches == []
+    assert snapshot["retry_count"] == 2
+    assert snapshot["dropped_count"] == 2
+    assert snapshot["flushed_count"] == 0
+    # 保存出来なかった会話がキャッシュから返されないように破棄する
+    assert cache.get("conversation-1") is None
+    assert writer.pending_turns("conversation-1") == []
+
+
+class FormattedLogs(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.setFormatter(JsonFormatter(max_field_length=1000))
+        self.lines: List[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.lines.append(self.format(record))
+
+
+@pytest.mark.asyncio
+async def test_drop_logs_long_turn_without_truncation():
+    save = FakeSaveConversationHistories(failures=3)
+    writer = create_writer(save, create_config())
+    logs = FormattedLogs()
+    writer.logger = logging.getLogger("test_conversation_history_writer")
+    writer.logger.addHandler(logs)
+    writer.start()
+
+    dto = create_dto(0)
+    dto["user_message"] = "ねこ" * 1500
+    dto["ai_message"] = "にゃん" * 1500
+    await writer.enqueue(dto)
+    await writer.aclose()
+
+    writer.logger.removeHandler(logs)
+    assert len(logs.lines) == 1
+    data = json.loads(logs.lines[0])
+    # 手動で復旧出来るように切り詰めずに出力する
+    assert data["user_message"] == "ねこ" * 1500
+    assert data["ai_message"] == "にゃん" * 1500
+    assert "truncated_fields" not in data
+
+
+@pytest.mark.asyncio
+async def test_enqueue_appends_turn_to_cached_conversation():
+    save = FakeSaveConversationHistories()
+    cache = ConversationCache({"ttl_seconds": 60, "max_bytes": 1024 * 1024})
+    cache.put("conversation-1", {"turns": [], "truncated": False})
+    writer = create_writer(save, create_config(), conversation_cache=cache)
+    writer.start()
+
+    await writer.enqueue(create_dto(0))
+
+    window = cache.get("conversation-1")
+    assert window is not None
+    assert [turn["ai_message"] for turn in window["turns"]] == ["reply-0"]
+
+    await writer.aclose()
+
+
+@pytest.mark.asyncio
+async def test_snapshot_records_batch_size_and_flush_latency():
+    save = FakeSaveConversationHistories()
+    writer = create_writer(save, create_config(flush_interval_seconds=10))
+    writer.start()
+
+    for i in range(4):
+        await writer.enqueue(create_dto(i))
+
+    await writer.aclose()
+
+    snapshot = writer.snapshot()
+    assert snapshot["enqueued_count"] == 4
+    assert snapshot["flush_count"] == 2
+    assert snapshot["last_batch_size"] == 1
+    assert snapshot["max_batch_size"] == 3
+    assert snapshot["flush_seconds_total"] >= snapshot["max_flush_seconds"] >= 0
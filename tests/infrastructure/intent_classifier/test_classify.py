@@ -0,0 +1,100 @@
+import pytest
+from infrastructure.intent_classifier import (
+    IntentClassifier,
+    evaluate_intent_classifier,
+    train_intent_classifier_model,
+)
+from tests.infrastructure.intent_classifier.trained_intent_classifier import (
+    create_trained_intent_classifier,
+    labelled_messages,
+)
+
+
+@pytest.mark.parametrize(
+    "message, expected",
+    [
+        ("東京の天気を教えて", "needs_tools"),
+        ("今何時？", "needs_tools"),
+        ("What's the weather in Tokyo?", "needs_tools"),
+        ("福岡って今雨降ってる？", "unsure"),
+        ("Is it raining now?", "unsure"),
+        # モデルが無い場合はキーワードが含まれていなくてもtoolsが不要とは判定しない
+        ("もこちゃんの好きな食べ物を教えて", "unsure"),
+        ("What is your favorite food?", "unsure"),
+        ("Nowhere to go", "unsure"),
+    ],
+)
+def test_classify_without_model(message, expected):
+    assert IntentClassifier().classify(message) == expected
+
+
+@pytest.mark.parametrize(
+    "message, expected",
+    [
+        ("東京の天気を教えて", "needs_tools"),
+        ("福岡って今雨降ってる？", "unsure"),
+        ("もこちゃんの好きな食べ物を教えて", "no_tools"),
+        ("もこちゃんはどこに住んでいます？", "no_tools"),
+    ],
+)
+def test_classify_with_model(message, expected):
+    assert create_trained_intent_classifier().classify(message) == expected
+
+
+def test_classify_falls_back_to_unsure_when_context_mentions_tools():
+    classifier = create_trained_intent_classifier()
+
+    assert classifier.classify("もこちゃんは？", ["東京の天気を教えて"]) == "unsure"
+    assert classifier.classify("もこちゃんは？", ["こんにちは"]) == "no_tools"
+
+
+def test_classify_counts_intents():
+    classifier = IntentClassifier()
+
+    classifier.classify("東京の天気を教えて")
+    classifier.classify("こんにちは")
+    classifier.classify("こんばんは")
+
+    assert classifier.intent_counts == {"needs_tools": 1, "unsure": 2}
+
+
+def test_predict_needs_tools_probability_with_trained_model():
+    classifier = IntentClassifier(
+        train_intent_classifier_model(labelled_messages, min_count=1)
+    )
+
+    assert classifier.predict_needs_tools_probability("名古屋の天気") > 0.5
+    assert classifier.predict_needs_tools_probability("もこちゃんの好きな遊び") < 0.5
+
+
+def test_evaluate_intent_classifier():
+    evaluation = evaluate_intent_classifier(
+        create_trained_intent_classifier(), labelled_messages
+    )
+
+    assert evaluation == {
+        "total": 8,
+        "needs_tools_precision": 1.0,
+        "needs_tools_recall": 1.0,
+        "no_tools_precision": 1.0,
+        "no_tools_recall": 1.0,
+        "unsure_rate": 0.0,
+    }
+
+
+def test_evaluate_intent_classifier_without_model():
+    evaluation = evaluate_intent_classifier(IntentClassifier(), labelled_messages)
+
+    # toolsが不要なメッセージは全てLLMに判定させる
+    assert evaluation == {
+        "total": 8,
+        "needs_tools_precision": 1.0,
+        "needs_tools_recall": 1.0,
+        "no_tools_precision": 0.0,
+        "no_tools_recall": 0.0,
+        "unsure_rate": 0.5,
+    }
+
+
+def test_classify_too_long_message_as_unsure():
+    assert IntentClassifier().classify("もこちゃん" * 1000) == "unsure"
@@ -0,0 +1,23 @@
+from infrastructure.intent_classifier import (
+    IntentClassifier,
+    LabelledMessage,
+    train_intent_classifier_model,
+)
+
+labelled_messages: list[LabelledMessage] = [
+    {"message": "もこちゃんの好きな食べ物を教えて", "label": "no_tools"},
+    {"message": "もこちゃんはどこに住んでいるの？", "label": "no_tools"},
+    {"message": "もこちゃんかわいいね", "label": "no_tools"},
+    {"message": "ありがとう！またね！", "label": "no_tools"},
+    {"message": "東京の天気を教えて", "label": "needs_tools"},
+    {"message": "札幌の天気はどう？", "label": "needs_tools"},
+    {"message": "大阪の天気を知りたい", "label": "needs_tools"},
+    {"message": "今何時？", "label": "needs_tools"},
+]
+
+
+# モデルが無い場合はtoolsが不要とは判定しないので、toolsの利用要否の判定を省略する場合は学習したモデルを利用する
+def create_trained_intent_classifier() -> IntentClassifier:
+    return IntentClassifier(
+        train_intent_classifier_model(labelled_messages, min_count=1)
+    )
@@ -0,0 +1,96 @@
+import pytest
+from infrastructure.japanese_city_gazetteer import (
+    JapaneseCityGazetteer,
+    default_gazetteer_path,
+    get_japanese_city_gazetteer,
+)
+
+
+@pytest.mark.parametrize(
+    "city_name, expected",
+    [
+        ("Tokyo", {"lat": 35.6895, "lon": 139.6917}),
+        ("Tōkyō", {"lat": 35.6895, "lon": 139.6917}),
+        ("Toukyou", {"lat": 35.6895, "lon": 139.6917}),
+        ("東京都", {"lat": 35.6895, "lon": 139.6917}),
+        ("Osaka City", {"lat": 34.6937, "lon": 135.5023}),
+        ("Osaka-shi", {"lat": 34.6937, "lon": 135.5023}),
+        ("大阪市", {"lat": 34.6937, "lon": 135.5023}),
+        ("オオサカ", {"lat": 34.6937, "lon": 135.5023}),
+        ("shinjuku", {"lat": 35.6938, "lon": 139.7034}),
+        ("新宿区", {"lat": 35.6938, "lon": 139.7034}),
+        ("Hokkaido", {"lat": 43.0621, "lon": 141.3544}),
+        ("Kyoto", {"lat": 35.0116, "lon": 135.7681}),
+        ("Kobe, Japan", {"lat": 34.6901, "lon": 135.1956}),
+        ("Ōita", {"lat": 33.2382, "lon": 131.6126}),
+        ("New York", None),
+        ("", None),
+    ],
+)
+def test_lookup(city_name, expected):
+    assert get_japanese_city_gazetteer().lookup(city_name) == expected
+
+
+@pytest.mark.parametrize(
+    "city_name, expected",
+    [
+        ("ながの", {"lat": 36.6485, "lon": 138.1942}),
+        ("なかの", {"lat": 35.7074, "lon": 139.6637}),
+    ],
+)
+def test_lookup_keeps_voiced_kana(city_name, expected):
+    assert get_japanese_city_gazetteer().lookup(city_name) == expected
+
+
+def create_gazetteer() -> JapaneseCityGazetteer:
+    gazetteer = JapaneseCityGazetteer()
+    gazetteer.add(["小野市", "おのし", "Ono"], 34.8533, 134.9317)
+    gazetteer.add(["大野市", "おおのし", "Oono"], 35.9797, 136.4875)
+    gazetteer.add(["府中市", "ふちゅうし", "Fuchu"], 35.6689, 139.4778)
+    gazetteer.add(["府中市", "ふちゅうし", "Fuchu"], 34.5683, 133.2364)
+    return gazetteer
+
+
+@pytest.mark.parametrize(
+    "city_name, expected",
+    [
+        ("Ono", {"lat": 34.8533, "lon": 134.9317}),
+        ("Oono", {"lat": 35.9797, "lon": 136.4875}),
+        ("Ōno", None),
+        ("Ouno", None),
+        ("おおのし", {"lat": 35.9797, "lon": 136.4875}),
+        ("府中市", None),
+        ("Fuchu", None),
+    ],
+)
+def test_lookup_returns_none_for_ambiguous_names(city_name, expected):
+    assert create_gazetteer().lookup(city_name) == expected
+
+
+def test_load_prefers_names_in_earlier_files(tmp_path):
+    cities_path = tmp_path / "japanese_cities.tsv"
+    cities_path.write_text(
+        "# 漢字名\tかな\tローマ字\t緯度\t経度\t別名（カンマ区切り）\n"
+        "盛岡市\tもりおか\tMorioka\t39.7036\t141.1527\t岩手県,岩手,いわて,Iwate\n",
+        encoding="utf-8",
+    )
+    municipalities_path = tmp_path / "japanese_municipalities.tsv"
+    municipalities_path.write_text(
+        "岩手町\tイワテマチ\tIwate Machi\t39.9728\t141.2122\t\n"
+        "関市\tセキシ\tSeki Shi\t35.4958\t136.9178\t\n",
+        encoding="utf-8",
+    )
+
+    gazetteer = JapaneseCityGazetteer.load((cities_path, municipalities_path))
+
+    assert gazetteer.lookup("岩手") == {"lat": 39.7036, "lon": 141.1527}
+    assert gazetteer.lookup("岩手町") == {"lat": 39.9728, "lon": 141.2122}
+    assert gazetteer.lookup("Seki-shi") == {"lat": 35.4958, "lon": 136.9178}
+
+
+def test_load_skips_missing_municipalities(tmp_path):
+    gazetteer = JapaneseCityGazetteer.load(
+        (default_gazetteer_path, tmp_path / "japanese_municipalities.tsv")
+    )
+
+    assert len(gazetteer) == len(get_japanese_city_gazetteer())
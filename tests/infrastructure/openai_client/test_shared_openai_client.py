@@ -0,0 +1,42 @@
+import pytest
+from logging import WARNING
+from infrastructure import openai_client
+from infrastructure.openai_client import SharedOpenAiClient, create_openai_client_config
+
+
+@pytest.fixture(autouse=True)
+def set_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+
+
+@pytest.mark.asyncio
+async def test_warns_when_http2_is_requested_without_h2(monkeypatch, caplog):
+    monkeypatch.setenv("OPENAI_HTTP2_ENABLED", "1")
+    monkeypatch.setattr(openai_client, "is_http2_available", lambda: False)
+
+    with caplog.at_level(WARNING):
+        client = SharedOpenAiClient(create_openai_client_config())
+
+    assert "falling back to HTTP/1.1" in caplog.text
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_does_not_warn_when_http2_is_disabled(monkeypatch, caplog):
+    monkeypatch.setenv("OPENAI_HTTP2_ENABLED", "0")
+    monkeypatch.setattr(openai_client, "is_http2_available", lambda: False)
+
+    with caplog.at_level(WARNING):
+        client = SharedOpenAiClient(create_openai_client_config())
+
+    assert caplog.text == ""
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_aclose_closes_http_client():
+    client = SharedOpenAiClient(create_openai_client_config())
+
+    assert not client.http_client.is_closed
+    await client.aclose()
+    assert client.http_client.is_closed
@@ -0,0 +1,100 @@
+import json
+import httpx
+import pytest
+from openai import APIError, AsyncOpenAI, AsyncStream
+from openai.types.chat import ChatCompletionChunk
+from infrastructure.openai_stream_parser import (
+    iter_chat_completion_chunks,
+    iter_server_sent_events,
+)
+
+contents = [
+    "",
+    "こんにちは",
+    "だにゃん🐱",
+    '"引用"と\\バックスラッシュ',
+    "改行\n",
+    None,
+]
+
+
+def create_sse_body(newline: str = "\n") -> bytes:
+    events = []
+    for content in contents:
+        chunk = {
+            "id": "chatcmpl-1",
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": "gpt-4o-2024-08-06",
+            "choices": [
+                {"index": 0, "delta": {"content": content}, "finish_reason": None}
+            ],
+        }
+        events.append(f"data: {json.dumps(chunk, ensure_ascii=False)}")
+    events.append(": keep-alive")
+    events.append("data: [DONE]")
+    return (newline * 2).join(events).encode() + (newline * 2).encode()
+
+
+# マルチバイト文字や改行の途中で分割されたbytesを受け取る場合も確認する
+def create_response(body: bytes, chunk_size: int) -> httpx.Response:
+    async def byte_chunks():
+        for i in range(0, len(body), chunk_size):
+            yield body[i : i + chunk_size]
+
+    return httpx.Response(
+        200,
+        headers={"content-type": "text/event-stream"},
+        content=byte_chunks(),
+        request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"),
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+async def test_iter_chat_completion_chunks_matches_sdk_stream(newline, chunk_size):
+    body = create_sse_body(newline)
+
+    sdk_stream = AsyncStream(
+        cast_to=ChatCompletionChunk,
+        response=create_response(body, chunk_size),
+        client=AsyncOpenAI(api_key="dummy"),
+    )
+    expected = [
+        (chunk.id, chunk.choices[0].delta.content) async for chunk in sdk_stream
+    ]
+
+    actual = [
+        (chunk["id"], chunk["choices"][0]["delta"].get("content"))
+        async for chunk in iter_chat_completion_chunks(
+            create_response(body, chunk_size)
+        )
+    ]
+
+    assert actual == expected
+    assert [content for _, content in actual] == contents
+
+
+@pytest.mark.asyncio
+async def test_iter_chat_completion_chunks_raises_error_chunk():
+    body = (
+        b'data: {"error": {"message": "overloaded", "type": "server_error"}}\n\n'
+        b"data: [DONE]\n\n"
+    )
+
+    with pytest.raises(APIError, match="overloaded"):
+        async for _ in iter_chat_completion_chunks(create_response(body, 4096)):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_iter_server_sent_events_returns_event_and_multiline_data():
+    async def byte_chunks():
+        yield b"event: error\ndata: 1\n"
+        yield b"data: 2\n\ndata: last"
+
+    events = [event async for event in iter_server_sent_events(byte_chunks())]
+
+    # SDKと同じく、空行が届かずに終了した最後のイベントは返さない
+    assert events == [(b"error", b"1\n2")]
@@ -0,0 +1,80 @@
+import pytest
+from collections.abc import AsyncGenerator
+from domain.repository.cat_message_repository_interface import (
+    GenerateMessageForGuestUserDto,
+    GenerateMessageForGuestUserResult,
+)
+from infrastructure.admission_controller import (
+    AdmissionControlConfig,
+    AdmissionController,
+)
+from infrastructure.repository.admission_controlled_cat_message_repository import (
+    AdmissionControlledCatMessageRepository,
+)
+
+
+class FakeCatMessageRepository:
+    def __init__(self) -> None:
+        self.cancelled = False
+
+    async def generate_message_for_guest_user(
+        self, dto: GenerateMessageForGuestUserDto
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]:
+        for message in ["はじめましてだにゃん", "🐱"]:
+            yield {"ai_response_id": "chatcmpl-1", "message": message}
+
+    async def cancel_generation(self) -> None:
+        self.cancelled = True
+
+
+def create_dto() -> GenerateMessageForGuestUserDto:
+    return {
+        "cat_id": "moko",
+        "user_id": "user-1",
+        "chat_messages": [{"role": "user", "content": "こんにちは"}],
+    }
+
+
+def create_controller() -> AdmissionController:
+    return AdmissionController(
+        AdmissionControlConfig(
+            max_concurrency=1,
+            min_concurrency=1,
+            max_queue_size=10,
+            queue_timeout_seconds=1,
+            adaptive_enabled=False,
+            target_ttft_seconds=1,
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_release_ticket_after_streaming():
+    controller = create_controller()
+    ticket = await controller.acquire("user-1")
+    repository = AdmissionControlledCatMessageRepository(
+        FakeCatMessageRepository(), controller, ticket
+    )
+
+    results = [
+        result
+        async for result in repository.generate_message_for_guest_user(create_dto())
+    ]
+
+    assert [result["message"] for result in results] == ["はじめましてだにゃん", "🐱"]
+    assert controller.snapshot()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_release_ticket_when_generation_is_cancelled():
+    controller = create_controller()
+    ticket = await controller.acquire("user-1")
+    fake_repository = FakeCatMessageRepository()
+    repository = AdmissionControlledCatMessageRepository(
+        fake_repository, controller, ticket
+    )
+
+    await repository.cancel_generation()
+
+    assert fake_repository.cancelled
+    assert controller.snapshot()["in_flight"] == 0
@@ -0,0 +1,33 @@
+import pytest
+from infrastructure.tokenizer import Tokenizer
+from infrastructure.repository.aiomysql.aiomysql_guest_users_conversation_history_repository import (
+    AiomysqlGuestUsersConversationHistoryRepository,
+    CreateMessagesWithConversationHistoryDto,
+)
+from log.request_timing import RequestTiming
+from tests.infrastructure.repository.aiomysql.aiomysql_guest_users_conversation_history.test_create_messages_with_pending_turns import (
+    FakeConnectionProvider,
+)
+from tests.infrastructure.tokenizer.byte_encoding import create_byte_encoding
+
+
+@pytest.mark.asyncio
+async def test_create_messages_records_connection_acquire_and_query_timing():
+    request_timing = RequestTiming()
+    repository = AiomysqlGuestUsersConversationHistoryRepository(
+        FakeConnectionProvider([]),  # type: ignore[arg-type]
+        datetime_context_enabled=False,
+        tokenizer=Tokenizer(create_byte_encoding(), offload_threshold_chars=2000),
+        request_timing=request_timing,
+    )
+
+    await repository.create_messages_with_conversation_history(
+        CreateMessagesWithConversationHistoryDto(
+            conversation_id="aaaaaaaa-bbbb-cccc-dddd-000000000001",
+            request_message="おはよう",
+            cat_id="moko",
+        )
+    )
+
+    # Poolからコネクションを借りた時点とクエリを実行した時点の時間を記録する
+    assert list(request_timing.stages) == ["db", "db_query"]
@@ -0,0 +1,118 @@
+import pytest
+from contextlib import asynccontextmanager
+from collections.abc import AsyncIterator
+from aiomysql import Connection
+from domain.cat import get_prompt_by_cat_id
+from infrastructure.conversation_cache import ConversationCache
+from infrastructure.tokenizer import Tokenizer
+from infrastructure.repository.aiomysql.aiomysql_guest_users_conversation_history_repository import (
+    AiomysqlGuestUsersConversationHistoryRepository,
+    CreateMessagesWithConversationHistoryDto,
+)
+from tests.infrastructure.tokenizer.byte_encoding import create_byte_encoding
+
+
+# キャッシュから会話履歴を返せる場合はDBに問い合わせない事を確認する為に、コネクションを借りようとすると失敗させる
+class UnavailableConnectionProvider:
+    def __init__(self) -> None:
+        self.acquire_count = 0
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Connection]:
+        self.acquire_count += 1
+        raise ConnectionError("database is unavailable")
+        yield
+
+
+def create_repository(
+    conversation_cache: ConversationCache,
+    connection_provider: UnavailableConnectionProvider,
+) -> AiomysqlGuestUsersConversationHistoryRepository:
+    return AiomysqlGuestUsersConversationHistoryRepository(
+        connection_provider,
+        datetime_context_enabled=False,
+        tokenizer=Tokenizer(create_byte_encoding(), offload_threshold_chars=2000),
+        conversation_cache=conversation_cache,
+    )
+
+
+def create_dto(request_message: str) -> CreateMessagesWithConversationHistoryDto:
+    return CreateMessagesWithConversationHistoryDto(
+        conversation_id="aaaaaaaa-bbbb-cccc-dddd-000000000001",
+        request_message=request_message,
+        cat_id="moko",
+    )
+
+
+@pytest.mark.asyncio
+async def test_create_messages_from_conversation_cache():
+    conversation_cache = ConversationCache(
+        {"ttl_seconds": 60, "max_bytes": 1024 * 1024}
+    )
+    conversation_cache.put(
+        "aaaaaaaa-bbbb-cccc-dddd-000000000001",
+        {
+            "turns": [
+                {
+                    "user_message": "ねこちゃん🐱",
+                    "ai_message": "人間ちゃん🐱",
+                    "user_message_token_count": 1000,
+                    "ai_message_token_count": 10,
+                },
+                {
+                    "user_message": "私の名前はおもちだよ",
+                    "ai_message": "おもちちゃんよろしくにゃん🐱",
+                    "user_message_token_count": 10,
+                    "ai_message_token_count": 10,
+                },
+            ],
+            "truncated": True,
+        },
+    )
+    connection_provider = UnavailableConnectionProvider()
+    repository = create_repository(conversation_cache, connection_provider)
+
+    chat_messages = await repository.create_messages_with_conversation_history(
+        create_dto("おもちの好きな食べ物は？")
+    )
+
+    assert chat_messages == [
+        {"role": "system", "content": get_prompt_by_cat_id("moko")},
+        {"role": "assistant", "content": "人間ちゃん🐱"},
+        {"role": "user", "content": "私の名前はおもちだよ"},
+        {"role": "assistant", "content": "おもちちゃんよろしくにゃん🐱"},
+        {"role": "user", "content": "おもちの好きな食べ物は？"},
+    ]
+    assert connection_provider.acquire_count == 0
+    assert conversation_cache.snapshot()["hit_count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_create_messages_falls_back_to_db_when_older_turns_may_fit():
+    conversation_cache = ConversationCache(
+        {"ttl_seconds": 60, "max_bytes": 1024 * 1024}
+    )
+    conversation_cache.put(
+        "aaaaaaaa-bbbb-cccc-dddd-000000000001",
+        {
+            "turns": [
+                {
+                    "user_message": "私の名前はおもちだよ",
+                    "ai_message": "おもちちゃんよろしくにゃん🐱",
+                    "user_message_token_count": 10,
+                    "ai_message_token_count": 10,
+                },
+            ],
+            "truncated": True,
+        },
+    )
+    connection_provider = UnavailableConnectionProvider()
+    repository = create_repository(conversation_cache, connection_provider)
+
+    with pytest.raises(ConnectionError):
+        await repository.create_messages_with_conversation_history(
+            create_dto("おもちの好きな食べ物は？")
+        )
+
+    assert connection_provider.acquire_count == 1
+    assert conversation_cache.snapshot()["fallback_count"] == 1
@@ -163,3 +163,110 @@ async def test_create_messages_with_conversation_history(create_test_db_connecti
     ]
 
     assert expected == chat_messages
+
+
+@pytest.mark.asyncio
+async def test_create_messages_with_conversation_history_contain_datetime_context(
+    create_test_db_connection,
+):
+    connection, test_db_name = await create_test_db_connection
+
+    dto = CreateMessagesWithConversationHistoryDto(
+        conversation_id="aaaaaaaa-bbbb-cccc-dddd-000000000002",
+        request_message="今日は何曜日？",
+        cat_id="moko",
+    )
+
+    repository = AiomysqlGuestUsersConversationHistoryRepository(
+        connection, datetime_context_enabled=True
+    )
+
+    chat_messages = await repository.create_messages_with_conversation_history(dto)
+
+    assert len(chat_messages) == 3
+    assert chat_messages[0] == {
+        "role": "system",
+        "content": get_prompt_by_cat_id(dto.get("cat_id")),
+    }
+    assert chat_messages[1]["role"] == "system"
+    assert chat_messages[1]["content"].startswith("# Context\n- 現在日時（Asia/Tokyo）")
+    assert chat_messages[2] == {"role": "user", "content": "今日は何曜日？"}
+
+
+@pytest.mark.asyncio
+async def test_create_messages_with_conversation_history_trimmed_by_token_count(
+    create_test_db_connection,
+):
+    connection, test_db_name = await create_test_db_connection
+
+    conversation_id = "aaaaaaaa-bbbb-cccc-dddd-000000000003"
+
+    async with connection.cursor() as cursor:
+        await cursor.executemany(
+            """
+            INSERT INTO
+              guest_users_conversation_histories
+              (
+                conversation_id,
+                cat_id,
+                user_id,
+                user_message,
+                ai_message,
+                user_message_token_count,
+                ai_message_token_count
+              )
+            VALUES
+              (%s, %s, %s, %s, %s, %s, %s)
+            """,
+            [
+                (
+                    conversation_id,
+                    "moko",
+                    "uuuuuuuu-uuuu-uuuu-dddd-000000000000",
+                    "1番目のメッセージ",
+                    "1番目の返信",
+                    400,
+                    400,
+                ),
+                (
+                    conversation_id,
+                    "moko",
+                    "uuuuuuuu-uuuu-uuuu-dddd-000000000000",
+                    "2番目のメッセージ",
+                    "2番目の返信",
+                    800,
+                    100,
+                ),
+                (
+                    conversation_id,
+                    "moko",
+                    "uuuuuuuu-uuuu-uuuu-dddd-000000000000",
+                    "3番目のメッセージ",
+                    "3番目の返信",
+                    100,
+                    100,
+                ),
+            ],
+        )
+    await connection.commit()
+
+    dto = CreateMessagesWithConversationHistoryDto(
+        conversation_id=conversation_id,
+        request_message="4番目のメッセージ",
+        cat_id="moko",
+    )
+
+    repository = AiomysqlGuestUsersConversationHistoryRepository(connection)
+
+    chat_messages = await repository.create_messages_with_conversation_history(dto)
+
+    # 保存されているトークン数で上限の1000を超えない所までの会話履歴が含まれる
+    expected = [
+        {"role": "system", "content": get_prompt_by_cat_id(dto.get("cat_id"))},
+        {"role": "assistant", "content": "2番目の返信"},
+        {"role": "user", "content": "3番目のメッセージ"},
+        {"role": "assistant", "content": "3番目の返信"},
+        {"role": "user", "content": "4番目のメッセージ"},
+    ]
+
+    assert expected == chat_messages
@@ -0,0 +1,114 @@
+import pytest
+from contextlib import asynccontextmanager
+from collections.abc import AsyncIterator
+from typing import Any, Dict, List
+from domain.cat import get_prompt_by_cat_id
+from infrastructure.conversation_history_writer import (
+    ConversationHistoryRecord,
+    ConversationHistoryWriter,
+    ConversationHistoryWriterConfig,
+)
+from infrastructure.tokenizer import Tokenizer
+from infrastructure.repository.aiomysql.aiomysql_guest_users_conversation_history_repository import (
+    AiomysqlGuestUsersConversationHistoryRepository,
+    CreateMessagesWithConversationHistoryDto,
+)
+from tests.infrastructure.tokenizer.byte_encoding import create_byte_encoding
+
+
+class FakeCursor:
+    def __init__(self, rows: List[Dict[str, Any]]) -> None:
+        self.rows = rows
+
+    async def __aenter__(self) -> "FakeCursor":
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        pass
+
+    async def execute(self, sql: str, args: object) -> None:
+        pass
+
+    async def fetchall(self) -> List[Dict[str, Any]]:
+        return self.rows
+
+
+class FakeConnection:
+    def __init__(self, rows: List[Dict[str, Any]]) -> None:
+        self.rows = rows
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self.rows)
+
+
+# 保存済みの会話として、新しい順に並んだ行を返す
+class FakeConnectionProvider:
+    def __init__(self, rows: List[Dict[str, Any]]) -> None:
+        self.rows = rows
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[FakeConnection]:
+        yield FakeConnection(self.rows)
+
+
+async def save_conversation_histories(records: List[ConversationHistoryRecord]) -> None:
+    pass
+
+
+@pytest.mark.asyncio
+async def test_create_messages_keeps_pending_turn_same_as_saved_turn():
+    tokenizer = Tokenizer(create_byte_encoding(), offload_threshold_chars=2000)
+    writer = ConversationHistoryWriter(
+        save_conversation_histories,
+        tokenizer,
+        ConversationHistoryWriterConfig(
+            max_queue_size=100,
+            batch_size=10,
+            flush_interval_seconds=10,
+            max_retries=0,
+            retry_backoff_seconds=0,
+        ),
+    )
+    repository = AiomysqlGuestUsersConversationHistoryRepository(
+        FakeConnectionProvider(
+            [
+                {
+                    "user_message": "おはよう",
+                    "ai_message": "おはようだにゃん🐱",
+                    "user_message_token_count": 12,
+                    "ai_message_token_count": 25,
+                }
+            ]
+        ),  # type: ignore[arg-type]
+        datetime_context_enabled=False,
+        tokenizer=tokenizer,
+        conversation_history_writer=writer,
+    )
+    # 保存済みの会話と同じ内容の会話を、まだ保存していない新しい会話として送った場合
+    await writer.enqueue(
+        {
+            "conversation_id": "aaaaaaaa-bbbb-cccc-dddd-000000000001",
+            "cat_id": "moko",
+            "user_id": "user-1",
+            "user_message": "おはよう",
+            "ai_message": "おはようだにゃん🐱",
+        }
+    )
+
+    chat_messages = await repository.create_messages_with_conversation_history(
+        CreateMessagesWithConversationHistoryDto(
+            conversation_id="aaaaaaaa-bbbb-cccc-dddd-000000000001",
+            request_message="おはよう",
+            cat_id="moko",
+        )
+    )
+
+    # 内容が同じでも別の会話なので、どちらも会話履歴に含める
+    assert chat_messages == [
+        {"role": "system", "content": get_prompt_by_cat_id("moko")},
+        {"role": "user", "content": "おはよう"},
+        {"role": "assistant", "content": "おはようだにゃん🐱"},
+        {"role": "user", "content": "おはよう"},
+        {"role": "assistant", "content": "おはようだにゃん🐱"},
+        {"role": "user", "content": "おはよう"},
+    ]
@@ -2,6 +2,8 @@ import pytest
 from typing import Tuple
 from aiomysql import Connection
 from tests.db.create_and_setup_db_connection import create_and_setup_db_connection
+from infrastructure.tokenizer import get_tokenizer
+from infrastructure.conversation_history_writer import ConversationHistoryRecord
 from infrastructure.repository.aiomysql.aiomysql_guest_users_conversation_history_repository import (
     AiomysqlGuestUsersConversationHistoryRepository,
     SaveGuestUsersConversationHistoryDto,
@@ -55,3 +57,52 @@ async def test_save_conversation_history(create_test_db_connection):
     assert result["user_id"] == user_id
     assert result["user_message"] == dto.get("user_message")
     assert result["ai_message"] == dto.get("ai_message")
+    assert result["user_message_token_count"] == get_tokenizer().count(
+        dto.get("user_message")
+    )
+    assert result["ai_message_token_count"] == get_tokenizer().count(
+        dto.get("ai_message")
+    )
+
+
+@pytest.mark.asyncio
+async def test_save_conversation_histories(create_test_db_connection):
+    connection, test_db_name = await create_test_db_connection
+
+    user_id = "uuuuuuuu-uuuu-uuuu-dddd-000000000000"
+
+    records = [
+        ConversationHistoryRecord(
+            conversation_id=f"aaaaaaaa-bbbb-cccc-dddd-00000000000{i}",
+            cat_id="moko",
+            user_id=user_id,
+            user_message=f"もこちゃん🐱テストだよ{i}",
+            ai_message=f"もこちゃんだにゃん🐱テストメッセージ{i}だにゃん🐱",
+            user_message_token_count=10 + i,
+            ai_message_token_count=20 + i,
+        )
+        for i in range(3)
+    ]
+
+    repository = AiomysqlGuestUsersConversationHistoryRepository(connection)
+
+    await repository.save_conversation_histories(records)
+
+    async with connection.cursor() as cursor:
+        sql = """
+        SELECT *
+        FROM guest_users_conversation_histories
+        WHERE user_id = %s
+        ORDER BY id ASC
+        """
+
+        await cursor.execute(sql, user_id)
+        result = await cursor.fetchall()
+
+    assert len(result) == 3
+    for row, record in zip(result, records):
+        assert row["conversation_id"] == record["conversation_id"]
+        assert row["user_message"] == record["user_message"]
+        assert row["ai_message"] == record["ai_message"]
+        assert row["user_message_token_count"] == record["user_message_token_count"]
+        assert row["ai_message_token_count"] == record["ai_message_token_count"]
@@ -0,0 +1,89 @@
+import pytest
+from typing import Tuple
+from aiomysql import Pool
+from tests.db.create_and_setup_db_pool import create_and_setup_db_pool
+from infrastructure.repository.aiomysql.aiomysql_pool_db_handler import (
+    AiomysqlPoolDbHandler,
+)
+from infrastructure.repository.aiomysql.aiomysql_guest_users_conversation_history_repository import (
+    AiomysqlGuestUsersConversationHistoryRepository,
+    SaveGuestUsersConversationHistoryDto,
+)
+
+
+@pytest.fixture
+async def create_test_db_pool() -> Tuple[Pool, str]:
+    pool, test_db_name = await create_and_setup_db_pool()
+
+    async with pool.acquire() as connection, connection.cursor() as cursor:
+        await cursor.execute("TRUNCATE TABLE guest_users_conversation_histories")
+
+    return pool, test_db_name
+
+
+@pytest.mark.asyncio
+async def test_connection_is_returned_to_pool_after_commit(create_test_db_pool):
+    pool, test_db_name = await create_test_db_pool
+
+    db_handler = AiomysqlPoolDbHandler(pool, health_check_interval_seconds=30)
+    repository = AiomysqlGuestUsersConversationHistoryRepository(db_handler)
+
+    conversation_id = "aaaaaaaa-bbbb-cccc-dddd-000000000000"
+
+    chat_messages = await repository.create_messages_with_conversation_history(
+        {
+            "conversation_id": conversation_id,
+            "request_message": "もこちゃん🐱テストだよ🐱",
+            "cat_id": "moko",
+        }
+    )
+
+    assert chat_messages[-1]["content"] == "もこちゃん🐱テストだよ🐱"
+    assert pool.size == pool.freesize
+
+    await db_handler.begin()
+
+    assert pool.size - pool.freesize == 1
+
+    await repository.save_conversation_history(
+        SaveGuestUsersConversationHistoryDto(
+            conversation_id=conversation_id,
+            cat_id="moko",
+            user_id="uuuuuuuu-uuuu-uuuu-dddd-000000000000",
+            user_message="もこちゃん🐱テストだよ🐱",
+            ai_message="もこちゃんだにゃん🐱テストメッセージだにゃん🐱",
+        )
+    )
+
+    await db_handler.commit()
+    db_handler.close()
+
+    assert pool.size == pool.freesize
+
+    async with pool.acquire() as connection, connection.cursor() as cursor:
+        await cursor.execute(
+            "SELECT COUNT(*) AS count FROM guest_users_conversation_histories WHERE conversation_id = %s",
+            conversation_id,
+        )
+        result = await cursor.fetchone()
+
+    assert result["count"] == 1
+
+    pool.close()
+    await pool.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_connection_is_returned_to_pool_after_rollback(create_test_db_pool):
+    pool, test_db_name = await create_test_db_pool
+
+    db_handler = AiomysqlPoolDbHandler(pool, health_check_interval_seconds=30)
+
+    await db_handler.begin()
+    await db_handler.rollback()
+    db_handler.close()
+
+    assert pool.size == pool.freesize
+
+    pool.close()
+    await pool.wait_closed()
@@ -0,0 +1,91 @@
+import asyncio
+from typing import Any, Dict, List
+from collections.abc import AsyncIterator
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+
+def create_chunk(chunk_id: str, delta: Dict[str, Any]) -> ChatCompletionChunk:
+    return ChatCompletionChunk.model_validate(
+        {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": "gpt-4o-2024-08-06",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+        }
+    )
+
+
+def create_completion(
+    completion_id: str, message: Dict[str, Any], finish_reason: str
+) -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": 1700000000,
+            "model": "gpt-4o-2024-08-06",
+            "choices": [
+                {"index": 0, "message": message, "finish_reason": finish_reason}
+            ],
+        }
+    )
+
+
+class FakeAsyncStream:
+    def __init__(self, chunks: List[ChatCompletionChunk], delay: float) -> None:
+        self.chunks = chunks
+        self.delay = delay
+        self.closed = False
+
+    async def __aiter__(self) -> AsyncIterator[ChatCompletionChunk]:
+        for chunk in self.chunks:
+            await asyncio.sleep(self.delay)
+            if self.closed:
+                return
+            yield chunk
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+# openai.AsyncOpenAIの代わりに利用する、ストリーミングとそれ以外のリクエストで別々に結果を返す
+class FakeCompletions:
+    def __init__(
+        self,
+        streams: List[List[ChatCompletionChunk]],
+        completions: List[ChatCompletion] | None = None,
+        stream_delay: float = 0,
+        completion_delay: float = 0,
+    ) -> None:
+        self.streams = streams
+        self.completions = completions or []
+        self.stream_delay = stream_delay
+        self.completion_delay = completion_delay
+        self.requests: List[Dict[str, Any]] = []
+        self.created_streams: List[FakeAsyncStream] = []
+
+    async def create(self, **kwargs: Any) -> Any:
+        self.requests.append(kwargs)
+
+        if kwargs.get("stream"):
+            stream = FakeAsyncStream(self.streams.pop(0), self.stream_delay)
+            self.created_streams.append(stream)
+            return stream
+
+        await asyncio.sleep(self.completion_delay)
+        return self.completions.pop(0)
+
+    @property
+    def stream_requests(self) -> List[Dict[str, Any]]:
+        return [request for request in self.requests if request.get("stream")]
+
+
+class FakeChat:
+    def __init__(self, completions: FakeCompletions) -> None:
+        self.completions = completions
+
+
+class FakeOpenAiClient:
+    def __init__(self, completions: FakeCompletions) -> None:
+        self.chat = FakeChat(completions)
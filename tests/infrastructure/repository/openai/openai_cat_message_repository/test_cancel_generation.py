@@ -0,0 +1,120 @@
+import pytest
+from infrastructure.repository.openai.openai_cat_message_repository import (
+    OpenAiCatMessageRepository,
+    StreamCancellationMetrics,
+)
+from domain.repository.cat_message_repository_interface import (
+    GenerateMessageForGuestUserDto,
+)
+from tests.infrastructure.intent_classifier.trained_intent_classifier import (
+    create_trained_intent_classifier,
+)
+from tests.infrastructure.repository.openai.openai_cat_message_repository.fake_openai_client import (
+    FakeCompletions,
+    FakeOpenAiClient,
+    create_chunk,
+)
+
+
+def create_dto(message: str) -> GenerateMessageForGuestUserDto:
+    return GenerateMessageForGuestUserDto(
+        cat_id="moko",
+        user_id="0e9633ca-1002-47d3-92d4-45a322e7eba1",
+        chat_messages=[
+            {"role": "system", "content": "system prompt"},
+            {"role": "user", "content": message},
+        ],
+    )
+
+
+@pytest.fixture(autouse=True)
+def set_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPEN_WEATHER_API_KEY", "dummy")
+
+
+@pytest.fixture
+def metrics(monkeypatch: pytest.MonkeyPatch) -> StreamCancellationMetrics:
+    stream_cancellation_metrics = StreamCancellationMetrics()
+    monkeypatch.setattr(
+        "infrastructure.repository.openai.openai_cat_message_repository.stream_cancellation_metrics",
+        stream_cancellation_metrics,
+    )
+    return stream_cancellation_metrics
+
+
+def create_repository(
+    completions: FakeCompletions, tool_call_mode: str = "serial"
+) -> OpenAiCatMessageRepository:
+    return OpenAiCatMessageRepository(
+        FakeOpenAiClient(completions),  # type: ignore[arg-type]
+        tool_call_mode=tool_call_mode,  # type: ignore[arg-type]
+        intent_classifier=create_trained_intent_classifier(),
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tool_call_mode", ["serial", "inline"])
+async def test_cancel_generation_closes_stream(tool_call_mode, metrics):
+    completions = FakeCompletions(
+        streams=[
+            [create_chunk("chatcmpl-1", {"content": f"{i}にゃん"}) for i in range(10)]
+        ],
+    )
+    repository = create_repository(completions, tool_call_mode)
+
+    generated_responses = repository.generate_message_for_guest_user(
+        create_dto("もこちゃんの好きな食べ物を教えて")
+    )
+    results = [await anext(generated_responses) for _ in range(3)]
+
+    await repository.cancel_generation()
+
+    assert [result["message"] for result in results] == [
+        "0にゃん",
+        "1にゃん",
+        "2にゃん",
+    ]
+    assert completions.created_streams[0].closed
+    assert metrics.snapshot()["disconnected_count"] == 1
+    assert metrics.snapshot()["disconnected_tokens_total"] == 3
+
+    # 切断後に再度呼び出されても二重に記録しない
+    await repository.cancel_generation()
+    assert metrics.snapshot()["disconnected_count"] == 1
+
+    await generated_responses.aclose()  # type: ignore[attr-defined]
+
+
+@pytest.mark.asyncio
+async def test_stream_is_closed_after_completion(metrics):
+    completions = FakeCompletions(
+        streams=[[create_chunk("chatcmpl-1", {"content": "チュールが好きだにゃん"})]],
+    )
+    repository = create_repository(completions)
+
+    results = [
+        result
+        async for result in repository.generate_message_for_guest_user(
+            create_dto("もこちゃんの好きな食べ物を教えて")
+        )
+    ]
+
+    assert len(results) == 1
+    assert completions.created_streams[0].closed
+    assert metrics.snapshot()["completed_count"] == 1
+    assert metrics.snapshot()["completed_tokens_total"] == 1
+
+
+def test_estimated_saved_tokens_uses_average_completed_tokens():
+    metrics = StreamCancellationMetrics()
+    metrics.record_completed(100)
+    metrics.record_completed(200)
+
+    metrics.record_disconnected(30)
+    # 平均より多く生成してから切断した場合は削減出来たトークンは0とする
+    metrics.record_disconnected(500)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["disconnected_count"] == 2
+    assert snapshot["disconnected_tokens_total"] == 530
+    assert snapshot["estimated_saved_tokens_total"] == 120
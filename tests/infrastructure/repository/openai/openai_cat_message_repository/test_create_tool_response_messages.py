@@ -0,0 +1,86 @@
+import pytest
+import json
+import asyncio
+from openai.types.chat import ChatCompletionMessageToolCall
+from infrastructure.repository.openai.openai_cat_message_repository import (
+    OpenAiCatMessageRepository,
+    FetchCurrentWeatherResponse,
+)
+from tests.infrastructure.repository.openai.openai_cat_message_repository.fake_openai_client import (
+    FakeCompletions,
+    FakeOpenAiClient,
+)
+
+
+class SlowWeatherCatMessageRepository(OpenAiCatMessageRepository):
+    async def _fetch_current_weather(
+        self, city_name: str = "Tokyo"
+    ) -> FetchCurrentWeatherResponse:
+        await asyncio.sleep(0.3 if city_name == "Sapporo" else 0.1)
+        return {"city_name": city_name, "description": "晴れ", "temperature": 20}
+
+
+def create_tool_call(
+    tool_call_id: str, name: str, arguments: str
+) -> ChatCompletionMessageToolCall:
+    return ChatCompletionMessageToolCall.model_validate(
+        {
+            "id": tool_call_id,
+            "type": "function",
+            "function": {"name": name, "arguments": arguments},
+        }
+    )
+
+
+@pytest.fixture(autouse=True)
+def set_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPEN_WEATHER_API_KEY", "dummy")
+
+
+@pytest.mark.asyncio
+async def test_tools_run_concurrently_and_keep_tool_call_order():
+    repository = SlowWeatherCatMessageRepository(
+        FakeOpenAiClient(FakeCompletions([])),  # type: ignore[arg-type]
+        tool_timeout_seconds={"fetch_current_weather": 1},
+    )
+
+    tool_calls = [
+        create_tool_call("call_1", "fetch_current_weather", '{"city_name": "Osaka"}'),
+        create_tool_call("call_2", "fetch_current_weather", '{"city_name": "Nagoya"}'),
+        create_tool_call(
+            "call_3", "get_current_datetime_in_iso_format", '{"timezone": "UTC"}'
+        ),
+    ]
+
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    messages = await repository._create_tool_response_messages(tool_calls)
+    elapsed = loop.time() - started_at
+
+    assert elapsed < 0.18
+    assert [message["tool_call_id"] for message in messages] == [
+        "call_1",
+        "call_2",
+        "call_3",
+    ]
+    assert json.loads(messages[0]["content"])["city_name"] == "Osaka"
+    assert json.loads(messages[1]["content"])["city_name"] == "Nagoya"
+
+
+@pytest.mark.asyncio
+async def test_timed_out_tool_returns_unavailable_message():
+    repository = SlowWeatherCatMessageRepository(
+        FakeOpenAiClient(FakeCompletions([])),  # type: ignore[arg-type]
+        tool_timeout_seconds={"fetch_current_weather": 0.2},
+    )
+
+    tool_calls = [
+        create_tool_call("call_1", "fetch_current_weather", '{"city_name": "Sapporo"}'),
+        create_tool_call("call_2", "fetch_current_weather", '{"city_name": "Osaka"}'),
+    ]
+
+    messages = await repository._create_tool_response_messages(tool_calls)
+
+    assert [message["tool_call_id"] for message in messages] == ["call_1", "call_2"]
+    assert json.loads(messages[0]["content"])["status"] == "unavailable"
+    assert json.loads(messages[1]["content"])["city_name"] == "Osaka"
@@ -0,0 +1,120 @@
+import pytest
+from infrastructure.repository.openai.openai_cat_message_repository import (
+    OpenAiCatMessageRepository,
+    datetime_context_metrics,
+    tools_params,
+    tools_params_with_datetime_context,
+)
+from domain.repository.cat_message_repository_interface import (
+    GenerateMessageForGuestUserDto,
+)
+from tests.infrastructure.repository.openai.openai_cat_message_repository.fake_openai_client import (
+    FakeCompletions,
+    FakeOpenAiClient,
+    create_chunk,
+    create_completion,
+)
+
+
+def create_dto() -> GenerateMessageForGuestUserDto:
+    return GenerateMessageForGuestUserDto(
+        cat_id="moko",
+        user_id="0e9633ca-1002-47d3-92d4-45a322e7eba1",
+        chat_messages=[
+            {"role": "system", "content": "system prompt"},
+            {
+                "role": "system",
+                "content": "# Context\n- 現在日時（Asia/Tokyo）: 2024-12-01T00:04:00+09:00（日曜日）",
+            },
+            {"role": "user", "content": "ニューヨークは今何時？"},
+        ],
+    )
+
+
+def create_completions() -> FakeCompletions:
+    return FakeCompletions(
+        streams=[
+            [
+                create_chunk("chatcmpl-1", {"role": "assistant", "content": ""}),
+                create_chunk("chatcmpl-1", {"content": "10時だにゃん"}),
+            ]
+        ],
+        completions=[
+            create_completion(
+                "chatcmpl-decision",
+                {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [
+                        {
+                            "id": "call_1",
+                            "type": "function",
+                            "function": {
+                                "name": "get_current_datetime_in_iso_format",
+                                "arguments": '{"timezone": "America/New_York"}',
+                            },
+                        }
+                    ],
+                },
+                "tool_calls",
+            )
+        ],
+    )
+
+
+@pytest.fixture(autouse=True)
+def set_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPEN_WEATHER_API_KEY", "dummy")
+
+
+@pytest.mark.asyncio
+async def test_offers_datetime_tool_only_for_other_timezones():
+    completions = create_completions()
+    repository = OpenAiCatMessageRepository(
+        FakeOpenAiClient(completions),  # type: ignore[arg-type]
+        tool_call_mode="serial",
+        datetime_context_enabled=True,
+    )
+    snapshot = datetime_context_metrics.snapshot()
+
+    results = [
+        result
+        async for result in repository.generate_message_for_guest_user(create_dto())
+    ]
+
+    assert results == [{"ai_response_id": "chatcmpl-1", "message": "10時だにゃん"}]
+    assert completions.requests[0]["tools"] is tools_params_with_datetime_context
+    assert "Asia/Tokyo" not in str(
+        tools_params_with_datetime_context[1]["function"]["parameters"]
+    )
+    assert (
+        datetime_context_metrics.request_count_with_context
+        == snapshot["request_count_with_context"] + 1
+    )
+    assert (
+        datetime_context_metrics.datetime_tool_call_count_with_context
+        == snapshot["datetime_tool_call_count_with_context"] + 1
+    )
+
+
+@pytest.mark.asyncio
+async def test_offers_all_tools_without_datetime_context():
+    completions = create_completions()
+    repository = OpenAiCatMessageRepository(
+        FakeOpenAiClient(completions),  # type: ignore[arg-type]
+        tool_call_mode="serial",
+        datetime_context_enabled=False,
+    )
+    snapshot = datetime_context_metrics.snapshot()
+
+    results = [
+        result
+        async for result in repository.generate_message_for_guest_user(create_dto())
+    ]
+
+    assert results == [{"ai_response_id": "chatcmpl-1", "message": "10時だにゃん"}]
+    assert completions.requests[0]["tools"] is tools_params
+    assert (
+        datetime_context_metrics.datetime_tool_call_count_without_context
+        == snapshot["datetime_tool_call_count_without_context"] + 1
+    )
@@ -0,0 +1,121 @@
+import pytest
+from infrastructure.repository.openai.openai_cat_message_repository import (
+    OpenAiCatMessageRepository,
+)
+from domain.repository.cat_message_repository_interface import (
+    GenerateMessageForGuestUserDto,
+)
+from tests.infrastructure.repository.openai.openai_cat_message_repository.fake_openai_client import (
+    FakeCompletions,
+    FakeOpenAiClient,
+    create_chunk,
+)
+
+
+def create_dto() -> GenerateMessageForGuestUserDto:
+    return GenerateMessageForGuestUserDto(
+        cat_id="moko",
+        user_id="0e9633ca-1002-47d3-92d4-45a322e7eba1",
+        chat_messages=[
+            {"role": "system", "content": "system prompt"},
+            {"role": "user", "content": "今何時？"},
+        ],
+    )
+
+
+@pytest.fixture(autouse=True)
+def set_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPEN_WEATHER_API_KEY", "dummy")
+
+
+@pytest.mark.asyncio
+async def test_streams_content_directly_when_no_tools_are_called():
+    completions = FakeCompletions(
+        [
+            [
+                create_chunk("chatcmpl-1", {"role": "assistant", "content": ""}),
+                create_chunk("chatcmpl-1", {"content": "こんにちは"}),
+                create_chunk("chatcmpl-1", {"content": "🐱"}),
+            ]
+        ]
+    )
+    repository = OpenAiCatMessageRepository(
+        FakeOpenAiClient(completions),  # type: ignore[arg-type]
+        tool_call_mode="inline",
+    )
+
+    results = [
+        result
+        async for result in repository.generate_message_for_guest_user(create_dto())
+    ]
+
+    assert results == [
+        {"ai_response_id": "chatcmpl-1", "message": "こんにちは"},
+        {"ai_response_id": "chatcmpl-1", "message": "🐱"},
+    ]
+    assert len(completions.requests) == 1
+    assert "tools" in completions.requests[0]
+
+
+@pytest.mark.asyncio
+async def test_executes_tool_calls_and_streams_second_completion():
+    completions = FakeCompletions(
+        [
+            [
+                create_chunk(
+                    "chatcmpl-1",
+                    {
+                        "role": "assistant",
+                        "tool_calls": [
+                            {
+                                "index": 0,
+                                "id": "call_1",
+                                "type": "function",
+                                "function": {
+                                    "name": "get_current_datetime_in_iso_format",
+                                    "arguments": "",
+                                },
+                            }
+                        ],
+                    },
+                ),
+                create_chunk(
+                    "chatcmpl-1",
+                    {
+                        "tool_calls": [
+                            {"index": 0, "function": {"arguments": '{"timezone": '}}
+                        ]
+                    },
+                ),
+                create_chunk(
+                    "chatcmpl-1",
+                    {"tool_calls": [{"index": 0, "function": {"arguments": '"UTC"}'}}]},
+                ),
+            ],
+            [
+                create_chunk("chatcmpl-2", {"role": "assistant", "content": ""}),
+                create_chunk("chatcmpl-2", {"content": "今は朝だにゃん🐱"}),
+            ],
+        ]
+    )
+    repository = OpenAiCatMessageRepository(
+        FakeOpenAiClient(completions),  # type: ignore[arg-type]
+        tool_call_mode="inline",
+    )
+
+    results = [
+        result
+        async for result in repository.generate_message_for_guest_user(create_dto())
+    ]
+
+    assert results == [{"ai_response_id": "chatcmpl-2", "message": "今は朝だにゃん🐱"}]
+
+    regenerated_messages = completions.requests[1]["messages"]
+    assert regenerated_messages[2]["role"] == "assistant"
+    assert regenerated_messages[2]["tool_calls"][0]["function"] == {
+        "name": "get_current_datetime_in_iso_format",
+        "arguments": '{"timezone": "UTC"}',
+    }
+    assert regenerated_messages[3]["role"] == "tool"
+    assert regenerated_messages[3]["tool_call_id"] == "call_1"
+    assert "tools" not in completions.requests[1]
@@ -0,0 +1,99 @@
+import pytest
+from infrastructure.repository.openai.openai_cat_message_repository import (
+    OpenAiCatMessageRepository,
+)
+from domain.repository.cat_message_repository_interface import (
+    GenerateMessageForGuestUserDto,
+)
+from tests.infrastructure.intent_classifier.trained_intent_classifier import (
+    create_trained_intent_classifier,
+)
+from tests.infrastructure.repository.openai.openai_cat_message_repository.fake_openai_client import (
+    FakeCompletions,
+    FakeOpenAiClient,
+    create_chunk,
+    create_completion,
+)
+
+
+def create_dto(message: str) -> GenerateMessageForGuestUserDto:
+    return GenerateMessageForGuestUserDto(
+        cat_id="moko",
+        user_id="0e9633ca-1002-47d3-92d4-45a322e7eba1",
+        chat_messages=[
+            {"role": "system", "content": "system prompt"},
+            {"role": "user", "content": message},
+        ],
+    )
+
+
+@pytest.fixture(autouse=True)
+def set_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPEN_WEATHER_API_KEY", "dummy")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tool_call_mode", ["serial", "inline", "speculative"])
+async def test_skips_tools_decision_when_tools_are_not_needed(tool_call_mode):
+    completions = FakeCompletions(
+        streams=[
+            [
+                create_chunk("chatcmpl-1", {"role": "assistant", "content": ""}),
+                create_chunk("chatcmpl-1", {"content": "チュールが好きだにゃん"}),
+            ]
+        ],
+    )
+    repository = OpenAiCatMessageRepository(
+        FakeOpenAiClient(completions),  # type: ignore[arg-type]
+        tool_call_mode=tool_call_mode,
+        intent_classifier=create_trained_intent_classifier(),
+    )
+
+    results = [
+        result
+        async for result in repository.generate_message_for_guest_user(
+            create_dto("もこちゃんの好きな食べ物を教えて")
+        )
+    ]
+
+    assert results == [
+        {"ai_response_id": "chatcmpl-1", "message": "チュールが好きだにゃん"},
+    ]
+    assert len(completions.requests) == 1
+    assert "tools" not in completions.requests[0]
+
+
+@pytest.mark.asyncio
+async def test_decides_tools_without_speculation_when_tools_are_needed():
+    completions = FakeCompletions(
+        streams=[
+            [
+                create_chunk("chatcmpl-1", {"role": "assistant", "content": ""}),
+                create_chunk("chatcmpl-1", {"content": "晴れだにゃん"}),
+            ]
+        ],
+        completions=[
+            create_completion(
+                "chatcmpl-decision",
+                {"role": "assistant", "content": '{"use_tools": false}'},
+                "stop",
+            )
+        ],
+    )
+    repository = OpenAiCatMessageRepository(
+        FakeOpenAiClient(completions),  # type: ignore[arg-type]
+        tool_call_mode="speculative",
+        intent_classifier=create_trained_intent_classifier(),
+    )
+
+    results = [
+        result
+        async for result in repository.generate_message_for_guest_user(
+            create_dto("東京の天気を教えて")
+        )
+    ]
+
+    assert results == [{"ai_response_id": "chatcmpl-1", "message": "晴れだにゃん"}]
+    # キーワードだけで判定した場合もあるので、toolsの呼び出しは強制せずLLMに任せる
+    assert completions.requests[0]["tool_choice"] == "auto"
+    assert len(completions.stream_requests) == 1
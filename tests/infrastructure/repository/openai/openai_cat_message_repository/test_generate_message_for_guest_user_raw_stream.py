@@ -0,0 +1,111 @@
+import json
+import httpx
+import pytest
+from openai import AsyncOpenAI
+from infrastructure.repository.openai.openai_cat_message_repository import (
+    OpenAiCatMessageRepository,
+)
+from domain.repository.cat_message_repository_interface import (
+    GenerateMessageForGuestUserDto,
+)
+from tests.infrastructure.intent_classifier.trained_intent_classifier import (
+    create_trained_intent_classifier,
+)
+
+messages = ["", "チュール", "が好き", "だにゃん🐱"]
+
+
+def create_dto(message: str) -> GenerateMessageForGuestUserDto:
+    return GenerateMessageForGuestUserDto(
+        cat_id="moko",
+        user_id="0e9633ca-1002-47d3-92d4-45a322e7eba1",
+        chat_messages=[
+            {"role": "system", "content": "system prompt"},
+            {"role": "user", "content": message},
+        ],
+    )
+
+
+@pytest.fixture(autouse=True)
+def set_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPEN_WEATHER_API_KEY", "dummy")
+
+
+# OpenAIのAPIの代わりにストリーミングのレスポンスを返す
+def handle_request(request: httpx.Request) -> httpx.Response:
+    assert json.loads(request.content)["stream"] is True
+
+    body = "".join(
+        "data: "
+        + json.dumps(
+            {
+                "id": "chatcmpl-1",
+                "object": "chat.completion.chunk",
+                "created": 1700000000,
+                "model": "gpt-4o-2024-08-06",
+                "choices": [
+                    {"index": 0, "delta": {"content": message}, "finish_reason": None}
+                ],
+            },
+            ensure_ascii=False,
+        )
+        + "\n\n"
+        for message in messages
+    )
+    return httpx.Response(
+        200,
+        headers={"content-type": "text/event-stream"},
+        content=(body + "data: [DONE]\n\n").encode(),
+    )
+
+
+def create_repository(raw_stream_enabled: bool) -> OpenAiCatMessageRepository:
+    return OpenAiCatMessageRepository(
+        AsyncOpenAI(
+            api_key="dummy",
+            http_client=httpx.AsyncClient(
+                transport=httpx.MockTransport(handle_request)
+            ),
+        ),
+        intent_classifier=create_trained_intent_classifier(),
+        raw_stream_enabled=raw_stream_enabled,
+    )
+
+
+@pytest.mark.asyncio
+async def test_raw_stream_returns_same_results_as_sdk_stream():
+    results = {}
+    for raw_stream_enabled in (False, True):
+        repository = create_repository(raw_stream_enabled)
+        results[raw_stream_enabled] = [
+            result
+            async for result in repository.generate_message_for_guest_user(
+                create_dto("もこちゃんの好きな食べ物を教えて")
+            )
+        ]
+
+    assert results[True] == results[False]
+    assert results[True] == [
+        {"ai_response_id": "chatcmpl-1", "message": message}
+        for message in messages
+        if message != ""
+    ]
+
+
+@pytest.mark.asyncio
+async def test_cancel_generation_closes_raw_stream():
+    repository = create_repository(True)
+
+    results = repository.generate_message_for_guest_user(
+        create_dto("もこちゃんの好きな食べ物を教えて")
+    )
+    assert (await anext(results))["message"] == "チュール"
+    assert len(repository._open_streams) == 1
+    response = next(iter(repository._open_streams))
+
+    await repository.cancel_generation()
+
+    assert response.is_closed
+    assert repository._open_streams == set()
+
+    await results.aclose()  # type: ignore[attr-defined]
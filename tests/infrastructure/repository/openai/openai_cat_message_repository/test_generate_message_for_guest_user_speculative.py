@@ -0,0 +1,130 @@
+import pytest
+from infrastructure.repository.openai.openai_cat_message_repository import (
+    OpenAiCatMessageRepository,
+    StreamCancellationMetrics,
+    speculation_metrics,
+)
+from domain.repository.cat_message_repository_interface import (
+    GenerateMessageForGuestUserDto,
+)
+from tests.infrastructure.repository.openai.openai_cat_message_repository.fake_openai_client import (
+    FakeCompletions,
+    FakeOpenAiClient,
+    create_chunk,
+    create_completion,
+)
+
+
+def create_dto() -> GenerateMessageForGuestUserDto:
+    return GenerateMessageForGuestUserDto(
+        cat_id="moko",
+        user_id="0e9633ca-1002-47d3-92d4-45a322e7eba1",
+        chat_messages=[
+            {"role": "system", "content": "system prompt"},
+            {"role": "user", "content": "今何時？"},
+        ],
+    )
+
+
+@pytest.fixture(autouse=True)
+def set_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPEN_WEATHER_API_KEY", "dummy")
+
+
+@pytest.mark.asyncio
+async def test_flushes_speculative_stream_when_tools_are_not_needed():
+    completions = FakeCompletions(
+        streams=[
+            [
+                create_chunk("chatcmpl-1", {"role": "assistant", "content": ""}),
+                create_chunk("chatcmpl-1", {"content": "こんにちは"}),
+                create_chunk("chatcmpl-1", {"content": "🐱"}),
+            ]
+        ],
+        completions=[
+            create_completion(
+                "chatcmpl-decision",
+                {"role": "assistant", "content": '{"use_tools": false}'},
+                "stop",
+            )
+        ],
+        completion_delay=0.05,
+    )
+    repository = OpenAiCatMessageRepository(
+        FakeOpenAiClient(completions),  # type: ignore[arg-type]
+        tool_call_mode="speculative",
+    )
+    hit_count = speculation_metrics.hit_count
+
+    results = [
+        result
+        async for result in repository.generate_message_for_guest_user(create_dto())
+    ]
+
+    assert results == [
+        {"ai_response_id": "chatcmpl-1", "message": "こんにちは"},
+        {"ai_response_id": "chatcmpl-1", "message": "🐱"},
+    ]
+    assert len(completions.stream_requests) == 1
+    assert speculation_metrics.hit_count == hit_count + 1
+
+
+@pytest.mark.asyncio
+async def test_discards_speculative_stream_when_tools_are_needed(monkeypatch):
+    stream_cancellation_metrics = StreamCancellationMetrics()
+    monkeypatch.setattr(
+        "infrastructure.repository.openai.openai_cat_message_repository.stream_cancellation_metrics",
+        stream_cancellation_metrics,
+    )
+    completions = FakeCompletions(
+        streams=[
+            [
+                create_chunk("chatcmpl-1", {"role": "assistant", "content": ""}),
+                create_chunk("chatcmpl-1", {"content": "わからない"}),
+                create_chunk("chatcmpl-1", {"content": "にゃん"}),
+            ],
+            [
+                create_chunk("chatcmpl-2", {"role": "assistant", "content": ""}),
+                create_chunk("chatcmpl-2", {"content": "今は朝だにゃん🐱"}),
+            ],
+        ],
+        completions=[
+            create_completion(
+                "chatcmpl-decision",
+                {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [
+                        {
+                            "id": "call_1",
+                            "type": "function",
+                            "function": {
+                                "name": "get_current_datetime_in_iso_format",
+                                "arguments": '{"timezone": "UTC"}',
+                            },
+                        }
+                    ],
+                },
+                "tool_calls",
+            )
+        ],
+        stream_delay=0.01,
+        completion_delay=0.05,
+    )
+    repository = OpenAiCatMessageRepository(
+        FakeOpenAiClient(completions),  # type: ignore[arg-type]
+        tool_call_mode="speculative",
+    )
+    miss_count = speculation_metrics.miss_count
+
+    results = [
+        result
+        async for result in repository.generate_message_for_guest_user(create_dto())
+    ]
+
+    assert results == [{"ai_response_id": "chatcmpl-2", "message": "今は朝だにゃん🐱"}]
+    assert completions.created_streams[0].closed
+    assert completions.stream_requests[1]["messages"][-1]["role"] == "tool"
+    assert speculation_metrics.miss_count == miss_count + 1
+    # 破棄した投機的なストリーミングのトークンは返したトークンに含めない
+    assert stream_cancellation_metrics.snapshot()["completed_tokens_total"] == 1
@@ -0,0 +1,11 @@
+import tiktoken
+
+
+# テストではBPEのファイルをダウンロードしなくて済むように、1バイトを1トークンとして数えるencodingを利用する
+def create_byte_encoding() -> tiktoken.Encoding:
+    return tiktoken.Encoding(
+        name="test_bytes",
+        pat_str=r"\S+|\s+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={"<|endoftext|>": 256},
+    )
@@ -0,0 +1,74 @@
+import pytest
+import infrastructure.tokenizer as tokenizer_module
+from infrastructure.tokenizer import Tokenizer, get_tiktoken_cache_dir
+from tests.infrastructure.tokenizer.byte_encoding import create_byte_encoding
+
+
+def test_count():
+    tokenizer = Tokenizer(create_byte_encoding(), offload_threshold_chars=100)
+
+    assert tokenizer.count("もこ🐱") == len("もこ🐱".encode())
+
+
+def test_count_treats_special_tokens_as_text():
+    tokenizer = Tokenizer(create_byte_encoding(), offload_threshold_chars=100)
+
+    assert tokenizer.count("<|endoftext|>") == len("<|endoftext|>")
+
+
+def test_count_batch():
+    tokenizer = Tokenizer(create_byte_encoding(), offload_threshold_chars=100)
+
+    assert tokenizer.count_batch(["ねこ", "hello", ""]) == [6, 5, 0]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("offload_threshold_chars", [1, 100000])
+async def test_count_batch_async(offload_threshold_chars):
+    tokenizer = Tokenizer(
+        create_byte_encoding(), offload_threshold_chars=offload_threshold_chars
+    )
+    texts = ["もこちゃん" * 1000, "hello"]
+
+    assert await tokenizer.count_batch_async(texts) == tokenizer.count_batch(texts)
+    assert await tokenizer.count_async("hello") == 5
+
+
+@pytest.mark.asyncio
+async def test_count_batch_async_offloads_large_texts(monkeypatch):
+    tokenizer = Tokenizer(create_byte_encoding(), offload_threshold_chars=10)
+    offloaded = []
+
+    async def to_thread(func, *args):
+        offloaded.append(args)
+        return func(*args)
+
+    monkeypatch.setattr("asyncio.to_thread", to_thread)
+
+    await tokenizer.count_batch_async(["short"])
+    await tokenizer.count_batch_async(["long enough text"])
+
+    assert offloaded == [(["long enough text"],)]
+
+
+def test_get_tiktoken_cache_dir_prefers_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", "/tmp/tiktoken")
+    monkeypatch.setattr(tokenizer_module, "bundled_tiktoken_cache_dir", tmp_path)
+
+    assert get_tiktoken_cache_dir() == "/tmp/tiktoken"
+
+
+def test_get_tiktoken_cache_dir_uses_bundled_dir(monkeypatch, tmp_path):
+    monkeypatch.delenv("TIKTOKEN_CACHE_DIR", raising=False)
+    monkeypatch.setattr(tokenizer_module, "bundled_tiktoken_cache_dir", tmp_path)
+
+    assert get_tiktoken_cache_dir() == str(tmp_path)
+
+
+def test_get_tiktoken_cache_dir_without_bundled_dir(monkeypatch, tmp_path):
+    monkeypatch.delenv("TIKTOKEN_CACHE_DIR", raising=False)
+    monkeypatch.setattr(
+        tokenizer_module, "bundled_tiktoken_cache_dir", tmp_path / "missing"
+    )
+
+    assert get_tiktoken_cache_dir() is None
@@ -0,0 +1,100 @@
+import pytest
+import asyncio
+from typing import List, Tuple
+from infrastructure.open_weather import WeatherObservation
+from infrastructure.weather_cache import WeatherCache, WeatherCacheConfig
+
+
+class FakeFetcher:
+    def __init__(self, delay: float = 0) -> None:
+        self.delay = delay
+        self.calls: List[Tuple[float, float]] = []
+
+    async def __call__(self, lat: float, lon: float) -> WeatherObservation:
+        self.calls.append((lat, lon))
+        await asyncio.sleep(self.delay)
+        return {"description": "晴れ", "temperature": len(self.calls)}
+
+
+def create_config(**kwargs: float) -> WeatherCacheConfig:
+    config = WeatherCacheConfig(
+        ttl_seconds=600,
+        max_entries=100,
+        refresh_top_n=0,
+        refresh_interval_seconds=60,
+    )
+    config.update(kwargs)  # type: ignore[typeddict-item]
+    return config
+
+
+@pytest.mark.asyncio
+async def test_returns_cached_observation_for_nearby_coordinates():
+    fetcher = FakeFetcher()
+    cache = WeatherCache(fetcher, create_config())
+
+    first = await cache.get(35.6895, 139.6917)
+    second = await cache.get(35.6899, 139.6921)
+
+    assert first == second
+    assert len(fetcher.calls) == 1
+    assert cache.snapshot()["hit_count"] == 1
+    assert cache.snapshot()["miss_count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_observation_is_fetched_again():
+    fetcher = FakeFetcher()
+    cache = WeatherCache(fetcher, create_config(ttl_seconds=0.05))
+
+    await cache.get(35.6895, 139.6917)
+    await asyncio.sleep(0.1)
+    await cache.get(35.6895, 139.6917)
+
+    assert len(fetcher.calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_request():
+    fetcher = FakeFetcher(delay=0.05)
+    cache = WeatherCache(fetcher, create_config())
+
+    results = await asyncio.gather(*[cache.get(34.6937, 135.5023) for _ in range(10)])
+
+    assert len(fetcher.calls) == 1
+    assert all(result == results[0] for result in results)
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_entry_is_evicted():
+    fetcher = FakeFetcher()
+    cache = WeatherCache(fetcher, create_config(max_entries=2))
+
+    await cache.get(35.0, 135.0)
+    await cache.get(36.0, 136.0)
+    await cache.get(35.0, 135.0)
+    await cache.get(37.0, 137.0)
+
+    assert cache.snapshot()["size"] == 2
+
+    await cache.get(35.0, 135.0)
+    await cache.get(36.0, 136.0)
+
+    assert fetcher.calls == [(35.0, 135.0), (36.0, 136.0), (37.0, 137.0), (36.0, 136.0)]
+
+
+@pytest.mark.asyncio
+async def test_refresh_popular_entries_before_they_expire():
+    fetcher = FakeFetcher()
+    cache = WeatherCache(
+        fetcher,
+        create_config(ttl_seconds=30, refresh_top_n=1, refresh_interval_seconds=60),
+    )
+
+    for _ in range(3):
+        await cache.get(35.0, 135.0)
+    await cache.get(36.0, 136.0)
+
+    await cache.refresh_popular_entries()
+
+    assert fetcher.calls == [(35.0, 135.0), (36.0, 136.0), (35.0, 135.0)]
+    assert cache.snapshot()["refresh_count"] == 1
@@ -0,0 +1,123 @@
+import sys
+import json
+import queue
+import logging
+import pytest
+from log.logger import (
+    AppLogger,
+    ConversationHistoryDropLogExtra,
+    ErrorLogExtra,
+    InfoLogSampler,
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    configure_logging,
+)
+from log.metrics import Counter
+
+
+def create_record(level: int = logging.ERROR, **extra) -> logging.LogRecord:
+    return logging.getLogger("test").makeRecord(
+        "root", level, __file__, 0, "message %s", ("arg",), None, extra=extra
+    )
+
+
+@pytest.mark.asyncio
+async def test_json_formatter_truncates_only_extra_fields():
+    record = create_record(
+        **ErrorLogExtra(
+            request_id="dummy000-0000-0000-0000-requestid000",
+            conversation_id="dummy000-0000-0000-0000-requestid000",
+            cat_id="moko",
+            user_id="dummy000-user-id00-0000-000000000000",
+            user_message="にゃ" * 2500,
+        )
+    )
+    record.pathname = "p" * 100
+
+    data = json.loads(JsonFormatter(max_field_length=20).format(record))
+
+    assert data["user_message"] == "にゃ" * 10
+    assert data["truncated_fields"] == [
+        "request_id",
+        "conversation_id",
+        "user_id",
+        "user_message",
+    ]
+    assert data["pathname"] == "p" * 100
+
+
+@pytest.mark.asyncio
+async def test_json_formatter_does_not_truncate_exempt_records():
+    record = create_record(
+        **ConversationHistoryDropLogExtra(
+            conversation_id="dummy000-0000-0000-0000-requestid000",
+            cat_id="moko",
+            user_id="dummy000-user-id00-0000-000000000000",
+            user_message="にゃ" * 2500,
+            ai_message="にゃん" * 2500,
+            truncation_exempt=True,
+        )
+    )
+
+    data = json.loads(JsonFormatter(max_field_length=20).format(record))
+
+    assert data["user_message"] == "にゃ" * 2500
+    assert data["ai_message"] == "にゃん" * 2500
+    assert "truncated_fields" not in data
+
+
+@pytest.mark.asyncio
+async def test_info_log_sampler_keeps_warning_and_error_logs():
+    sampler = InfoLogSampler(0)
+
+    assert not sampler.filter(create_record(logging.INFO))
+    assert sampler.filter(create_record(logging.WARNING))
+    assert sampler.filter(create_record(logging.ERROR))
+    assert InfoLogSampler(1).filter(create_record(logging.INFO))
+
+
+@pytest.mark.asyncio
+async def test_non_blocking_queue_handler_drops_records_when_queue_is_full(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    dropped_total = Counter("log_records_dropped_total", "テスト")
+    monkeypatch.setattr("log.logger.log_records_dropped_total", dropped_total)
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue(1)
+    handler = NonBlockingQueueHandler(log_queue)
+
+    handler.handle(create_record())
+    handler.handle(create_record())
+
+    assert log_queue.qsize() == 1
+    assert dropped_total.render()[-1] == "log_records_dropped_total 1"
+
+
+@pytest.mark.asyncio
+async def test_non_blocking_queue_handler_converts_exception_to_text():
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue()
+    handler = NonBlockingQueueHandler(log_queue)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = create_record()
+        record.exc_info = sys.exc_info()
+
+    handler.handle(record)
+    queued_record = log_queue.get_nowait()
+
+    assert queued_record.exc_info is None
+    assert queued_record.msg == "message arg"
+    data = json.loads(JsonFormatter().format(queued_record))
+    assert data["traceback"][-1] == "ValueError: boom"
+
+
+@pytest.mark.asyncio
+async def test_logging_is_configured_only_once():
+    configure_logging()
+    handlers = logging.getLogger().handlers[:]
+
+    AppLogger()
+    configure_logging()
+
+    assert logging.getLogger().handlers == handlers
+    assert any(isinstance(handler, NonBlockingQueueHandler) for handler in handlers)
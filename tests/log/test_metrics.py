@@ -0,0 +1,107 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from log.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    ThreadSafeCounter,
+)
+
+
+@pytest.mark.asyncio
+async def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "テスト", buckets=(0.1, 1))
+
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(0.5)
+    histogram.observe(3)
+
+    assert histogram.render() == [
+        "# HELP test_seconds テスト",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        "test_seconds_sum 3.65",
+        "test_seconds_count 4",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_histogram_labels_and_time():
+    histogram = Histogram(
+        "tool_seconds", "テスト", buckets=(10,), label_names=("tool",)
+    )
+
+    with histogram.labels("fetch_current_weather").time():
+        pass
+
+    lines = histogram.render()
+
+    assert 'tool_seconds_bucket{tool="fetch_current_weather",le="10"} 1' in lines
+    assert 'tool_seconds_count{tool="fetch_current_weather"} 1' in lines
+
+
+@pytest.mark.asyncio
+async def test_counter_and_gauge():
+    counter = Counter("errors_total", "テスト", label_names=("type",))
+    counter.inc(1, "generation")
+    counter.inc(2, "generation")
+    counter.inc(1, 'a"b')
+
+    gauge = Gauge("in_flight", "テスト")
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+
+    assert counter.render()[2:] == [
+        'errors_total{type="generation"} 3',
+        'errors_total{type="a\\"b"} 1',
+    ]
+    assert gauge.render() == [
+        "# HELP in_flight テスト",
+        "# TYPE in_flight gauge",
+        "in_flight 1",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_thread_safe_counter_counts_increments_from_threads():
+    registry = MetricsRegistry()
+    counter = registry.counter("dropped_total", "テスト", thread_safe=True)
+
+    def increment() -> None:
+        for _ in range(10000):
+            counter.inc()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for _ in range(8):
+            executor.submit(increment)
+
+    assert isinstance(counter, ThreadSafeCounter)
+    assert counter.render()[2:] == ["dropped_total 80000"]
+
+
+@pytest.mark.asyncio
+async def test_registry_renders_snapshot_as_gauges():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "テスト").inc()
+    registry.register_snapshot(
+        "cache", lambda: {"hit_count": 3, "hit_rate": 0.75, "model": "gpt-4o"}
+    )
+
+    assert registry.render() == (
+        "# HELP requests_total テスト\n"
+        "# TYPE requests_total counter\n"
+        "requests_total 1\n"
+        "# TYPE cache_hit_count gauge\n"
+        "cache_hit_count 3\n"
+        "# TYPE cache_hit_rate gauge\n"
+        "cache_hit_rate 0.75\n"
+    )
+
+    registry.unregister("cache")
+
+    assert "cache_hit_count" not in registry.render()
@@ -0,0 +1,49 @@
+import pytest
+from log.request_timing import RequestTiming, measure_stage
+
+
+@pytest.mark.asyncio
+async def test_server_timing_header_lists_stages_in_recorded_order():
+    request_timing = RequestTiming()
+
+    request_timing.record("db", 0.0012)
+    with measure_stage(request_timing, "history"):
+        pass
+    request_timing.record("tools", 0.25)
+    request_timing.record("tools", 0.05)
+
+    header = request_timing.server_timing_header()
+
+    assert [metric.split(";")[0] for metric in header.split(", ")] == [
+        "db",
+        "history",
+        "tools",
+    ]
+    assert header.startswith("db;dur=1.2, history;dur=")
+    assert header.endswith("tools;dur=300.0")
+
+
+@pytest.mark.asyncio
+async def test_summary():
+    request_timing = RequestTiming()
+
+    assert request_timing.summary()["ttft_ms"] is None
+    assert request_timing.summary()["tokens_per_second"] is None
+
+    request_timing.started_at = 10.0
+    request_timing.first_token_at = 10.5
+    request_timing.last_token_at = 12.5
+    request_timing.token_count = 21
+
+    summary = request_timing.summary()
+
+    assert summary["ttft_ms"] == 500.0
+    assert summary["token_count"] == 21
+    assert summary["tokens_per_second"] == 10.0
+    assert "ttft;dur=500.0" in request_timing.server_timing_header()
+
+
+@pytest.mark.asyncio
+async def test_measure_stage_without_request_timing():
+    with measure_stage(None, "history"):
+        pass
@@ -0,0 +1,53 @@
+from logging import Logger, getLogger
+from typing import Optional
+from presentation.container import (
+    AppContainerInterface,
+    ConversationHistoryDependencies,
+)
+from presentation.stream_coalescer import StreamCoalescingConfig
+from domain.repository.cat_message_repository_interface import (
+    CatMessageRepositoryInterface,
+)
+from infrastructure.admission_controller import AdmissionController, AdmissionTicket
+from infrastructure.conversation_history_writer import ConversationHistoryWriter
+from infrastructure.repository.mock.mock_db_handler import MockDbHandler
+from infrastructure.repository.mock.mock_users_conversation_history_repository import (
+    MockGuestUsersConversationHistoryRepository,
+)
+from infrastructure.repository.mock.mock_cat_message_repository import (
+    MockCatMessageRepository,
+)
+from log.request_timing import RequestTiming
+
+
+# DBやOpenAIに接続せずに、Mockのリポジトリを返すコンテナ
+class MockAppContainer(AppContainerInterface):
+    def __init__(
+        self,
+        db_connect_error: Optional[Exception] = None,
+        cat_message_repository: Optional[CatMessageRepositoryInterface] = None,
+    ) -> None:
+        self.logger: Logger = getLogger()
+        self.admission_controller: Optional[AdmissionController] = None
+        self.conversation_history_writer: Optional[ConversationHistoryWriter] = None
+        self.stream_coalescing_config: Optional[StreamCoalescingConfig] = None
+        self.db_connect_error = db_connect_error
+        self.cat_message_repository = cat_message_repository
+
+    async def create_conversation_history_dependencies(
+        self, request_timing: Optional[RequestTiming] = None
+    ) -> ConversationHistoryDependencies:
+        if self.db_connect_error is not None:
+            raise self.db_connect_error
+
+        return ConversationHistoryDependencies(
+            db_handler=MockDbHandler(),
+            repository=MockGuestUsersConversationHistoryRepository(),
+        )
+
+    def create_cat_message_repository(
+        self, request_timing: RequestTiming, ticket: Optional[AdmissionTicket]
+    ) -> CatMessageRepositoryInterface:
+        if self.cat_message_repository is not None:
+            return self.cat_message_repository
+        return MockCatMessageRepository()
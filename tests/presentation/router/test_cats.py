@@ -0,0 +1,135 @@
+import json
+import asyncio
+import httpx
+import pytest
+from collections.abc import AsyncGenerator
+from fastapi import FastAPI
+from domain.repository.cat_message_repository_interface import (
+    GenerateMessageForGuestUserDto,
+    GenerateMessageForGuestUserResult,
+)
+from infrastructure.repository.mock.mock_cat_message_repository import (
+    MockCatMessageRepository,
+)
+from presentation.auth import basic_auth
+from presentation.container import get_app_container
+from presentation.router import cats
+from presentation.controller.generate_cat_message_for_guest_user_controller import (
+    GenerateCatMessageForGuestUserController,
+    GenerateCatMessageForGuestUserRequestBody,
+)
+from tests.presentation.mock_app_container import MockAppContainer
+
+
+def create_app(container: MockAppContainer) -> FastAPI:
+    app = FastAPI()
+    app.include_router(cats.router)
+    # 依存関係をまとめてMockに差し替える
+    app.dependency_overrides[get_app_container] = lambda: container
+    app.dependency_overrides[basic_auth] = lambda: None
+    return app
+
+
+async def post_message(app: FastAPI) -> httpx.Response:
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        return await client.post(
+            "/cats/moko/messages-for-guest-users",
+            json={
+                "userId": "0e9633ca-1002-47d3-92d4-45a322e7eba1",
+                "message": "ねこちゃんこんにちは🐱",
+                "conversationId": "839a145b-3028-4a2c-86d0-8ce6ca6fa9b2",
+            },
+            auth=("user", "password"),
+        )
+
+
+def parse_sse_data(body: str):
+    return [
+        json.loads(line.removeprefix("data: "))
+        for line in body.splitlines()
+        if line.startswith("data: ")
+    ]
+
+
+@pytest.mark.asyncio
+async def test_generate_cat_message_for_guest_user_with_mock_container():
+    response = await post_message(create_app(MockAppContainer()))
+
+    assert response.status_code == 200
+    assert parse_sse_data(response.text) == [
+        {
+            "conversationId": "839a145b-3028-4a2c-86d0-8ce6ca6fa9b2",
+            "message": "はじめましてだにゃん",
+        },
+        {"conversationId": "839a145b-3028-4a2c-86d0-8ce6ca6fa9b2", "message": "🐱"},
+        {
+            "conversationId": "839a145b-3028-4a2c-86d0-8ce6ca6fa9b2",
+            "message": "何かお手伝いできる事はないにゃんか？",
+        },
+    ]
+
+
+@pytest.mark.asyncio
+async def test_generate_cat_message_for_guest_user_db_connect_error():
+    response = await post_message(
+        create_app(MockAppContainer(db_connect_error=Exception("connection refused")))
+    )
+
+    assert response.status_code == 500
+    assert parse_sse_data(response.text) == [
+        {"type": "INTERNAL_SERVER_ERROR", "title": "an unexpected error has occurred."}
+    ]
+
+
+# 最初のトークンを返すまでに時間がかかるOpenAIの代わりに、テストから指示するまで応答を返さない
+class WaitingCatMessageRepository(MockCatMessageRepository):
+    def __init__(self) -> None:
+        self.first_token_ready = asyncio.Event()
+
+    async def generate_message_for_guest_user(
+        self, dto: GenerateMessageForGuestUserDto
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]:
+        await self.first_token_ready.wait()
+        yield GenerateMessageForGuestUserResult(
+            ai_response_id="chatcmpl-abcdefghijklmnopqrstuvwxyz001", message="にゃん"
+        )
+
+
+@pytest.mark.asyncio
+async def test_generate_cat_message_for_guest_user_returns_headers_before_first_token():
+    repository = WaitingCatMessageRepository()
+    controller = GenerateCatMessageForGuestUserController(
+        "moko",
+        GenerateCatMessageForGuestUserRequestBody(
+            userId="0e9633ca-1002-47d3-92d4-45a322e7eba1",
+            message="ねこちゃんこんにちは🐱",
+            conversationId="839a145b-3028-4a2c-86d0-8ce6ca6fa9b2",
+        ),
+        MockAppContainer(cat_message_repository=repository),
+        timing_event_enabled=True,
+    )
+
+    # 最初のトークンを待たずにレスポンスを返す
+    response = await asyncio.wait_for(controller.exec(), timeout=1)
+
+    assert response.status_code == 200
+    assert "server-timing" not in response.headers
+
+    repository.first_token_ready.set()
+    body = "".join(
+        [
+            chunk.decode() if isinstance(chunk, bytes) else str(chunk)
+            async for chunk in response.body_iterator
+        ]
+    )
+
+    data = parse_sse_data(body)
+    assert data[0] == {
+        "conversationId": "839a145b-3028-4a2c-86d0-8ce6ca6fa9b2",
+        "message": "にゃん",
+    }
+    # 会話履歴の取得以降の処理時間の内訳はtimingイベントで返す
+    assert data[1]["serverTiming"].startswith("history;dur=")
+    assert "ttft;dur=" in data[1]["serverTiming"]
@@ -0,0 +1,153 @@
+import asyncio
+import pytest
+import main
+from logging import getLogger
+from presentation.container import AppContainer
+from infrastructure.admission_controller import (
+    AdmissionControlConfig,
+    AdmissionController,
+)
+from infrastructure.db import create_db_pool_config
+from infrastructure.openai_client import SharedOpenAiClient, create_openai_client_config
+from infrastructure.weather_cache import WeatherCache, create_weather_cache_config
+from infrastructure.repository.openai.openai_cat_message_repository import (
+    OpenAiCatMessageRepository,
+    OpenAiCatMessageRepositoryConfig,
+)
+from infrastructure.repository.admission_controlled_cat_message_repository import (
+    AdmissionControlledCatMessageRepository,
+)
+from usecase.generate_cat_message_for_guest_user_use_case import _disconnect_tasks
+from log.request_timing import RequestTiming
+
+
+async def fetch_weather_observation(lat, lon):
+    raise Exception("weather is not fetched in this test")
+
+
+def create_container(admission_controller=None) -> AppContainer:
+    return AppContainer(
+        logger=getLogger(),
+        # 会話履歴のリポジトリは生成しないのでトークン数の計算は利用しない
+        tokenizer=None,
+        openai_client=SharedOpenAiClient(create_openai_client_config()),
+        weather_cache=WeatherCache(
+            fetch_weather_observation, create_weather_cache_config()
+        ),
+        cat_message_repository_config=OpenAiCatMessageRepositoryConfig(
+            open_weather_api_key="dummy",
+            tool_call_mode="inline",
+            tool_timeout_seconds={"fetch_current_weather": 3},
+            intent_classifier_enabled=False,
+            datetime_context_enabled=True,
+            raw_stream_enabled=True,
+        ),
+        db_pool_config=create_db_pool_config(),
+        admission_controller=admission_controller,
+    )
+
+
+@pytest.fixture(autouse=True)
+def set_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+
+
+@pytest.mark.asyncio
+async def test_create_cat_message_repository_without_reading_env(monkeypatch):
+    container = create_container()
+    # 起動時に読み込んだ設定を利用するので、起動後の環境変数は参照しない
+    monkeypatch.delenv("OPEN_WEATHER_API_KEY", raising=False)
+    monkeypatch.setenv("OPENAI_TOOL_CALL_MODE", "serial")
+    monkeypatch.setenv("DATETIME_CONTEXT_ENABLED", "0")
+    request_timing = RequestTiming()
+
+    repository = container.create_cat_message_repository(request_timing, None)
+
+    assert isinstance(repository, OpenAiCatMessageRepository)
+    assert repository.client is container.openai_client.client
+    assert repository.weather_cache is container.weather_cache
+    assert repository.request_timing is request_timing
+    assert repository.OPEN_WEATHER_API_KEY == "dummy"
+    assert repository.tool_call_mode == "inline"
+    assert repository.tool_timeout_seconds == {"fetch_current_weather": 3}
+    assert repository.datetime_context_enabled is True
+    assert repository.raw_stream_enabled is True
+    assert repository.intent_classifier is None
+
+    await container.openai_client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_create_cat_message_repository_with_admission_ticket():
+    admission_controller = AdmissionController(
+        AdmissionControlConfig(
+            max_concurrency=1,
+            min_concurrency=1,
+            max_queue_size=10,
+            queue_timeout_seconds=1,
+            adaptive_enabled=False,
+            target_ttft_seconds=1,
+        )
+    )
+    container = create_container(admission_controller)
+    ticket = await admission_controller.acquire("user-1")
+
+    repository = container.create_cat_message_repository(RequestTiming(), ticket)
+
+    assert isinstance(repository, AdmissionControlledCatMessageRepository)
+    assert isinstance(repository.repository, OpenAiCatMessageRepository)
+
+    ticket.release()
+    await container.openai_client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_aclose_waits_for_client_disconnect_tasks():
+    container = create_container()
+    saved = []
+
+    async def save_truncated_message() -> None:
+        await asyncio.sleep(0.05)
+        # PoolやOpenAIのClientを閉じる前に保存する
+        assert not container.openai_client.http_client.is_closed
+        saved.append(True)
+
+    task = asyncio.create_task(save_truncated_message())
+    _disconnect_tasks.add(task)
+    task.add_done_callback(_disconnect_tasks.discard)
+
+    await container.aclose()
+
+    assert saved == [True]
+
+
+@pytest.mark.asyncio
+async def test_lifespan_shares_one_openai_client_and_closes_it(monkeypatch):
+    created_containers = []
+
+    async def create_app_container() -> AppContainer:
+        container = create_container()
+        created_containers.append(container)
+        return container
+
+    monkeypatch.setenv("STARTUP_WARMUP_ENABLED", "0")
+    monkeypatch.setattr(main, "create_app_container", create_app_container)
+    # テスト中のログの出力先を差し替えないようにする
+    monkeypatch.setattr(main, "configure_logging", lambda config: None)
+    monkeypatch.setattr(main, "shutdown_logging", lambda: None)
+
+    async with main.lifespan(main.app):
+        container = main.app.state.container
+        # リクエスト毎にリポジトリを生成しても、同じClientとコネクションを使い回す
+        first_repository = container.create_cat_message_repository(
+            RequestTiming(), None
+        )
+        second_repository = container.create_cat_message_repository(
+            RequestTiming(), None
+        )
+        assert first_repository.client is container.openai_client.client
+        assert second_repository.client is container.openai_client.client
+        assert not container.openai_client.http_client.is_closed
+
+    assert len(created_containers) == 1
+    assert container.openai_client.http_client.is_closed
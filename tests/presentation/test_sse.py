@@ -0,0 +1,22 @@
+import pytest
+from presentation.sse import SseMessageEncoder, format_sse
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "message",
+    [
+        "だにゃん🐱",
+        "",
+        'ねこの"鳴き声"は\\にゃー\\',
+        "改行\nタブ\t制御文字\x00\x1f\x7f",
+        " </script>",
+    ],
+)
+async def test_sse_message_encoder_matches_format_sse(message):
+    conversation_id = "839a145b-3028-4a2c-86d0-8ce6ca6fa9b2"
+    sse_encoder = SseMessageEncoder(conversation_id)
+
+    expected = format_sse({"conversationId": conversation_id, "message": message})
+
+    assert sse_encoder.encode(message) == expected.encode()
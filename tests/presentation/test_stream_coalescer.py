@@ -0,0 +1,230 @@
+import asyncio
+import pytest
+from presentation.stream_coalescer import (
+    StreamCoalescingConfig,
+    coalesce_stream,
+    coalesce_use_case_results,
+    max_pending_results,
+    resolve_stream_coalescing_config,
+)
+
+conversation_id = "839a145b-3028-4a2c-86d0-8ce6ca6fa9b2"
+
+
+async def generate_results(messages, delay_seconds=0.0):
+    for message in messages:
+        if delay_seconds > 0:
+            await asyncio.sleep(delay_seconds)
+        yield {"conversation_id": conversation_id, "message": message}
+
+
+@pytest.mark.asyncio
+async def test_first_token_is_returned_immediately_and_rest_are_coalesced_by_bytes():
+    # "だにゃん" はUTF-8で12バイト
+    results = coalesce_use_case_results(
+        generate_results(["こんにちは"] + ["だにゃん"] * 5),
+        StreamCoalescingConfig(max_bytes=24, max_delay_seconds=10),
+    )
+
+    messages = [result["message"] async for result in results]
+
+    assert messages == [
+        "こんにちは",
+        "だにゃんだにゃん",
+        "だにゃんだにゃん",
+        "だにゃん",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_coalesced_messages_are_returned_when_deadline_passes():
+    results = coalesce_use_case_results(
+        generate_results(["こ", "ん", "に", "ち", "は"], delay_seconds=0.03),
+        StreamCoalescingConfig(max_bytes=1024, max_delay_seconds=0.001),
+    )
+
+    messages = [result["message"] async for result in results]
+
+    # 次のトークンが届く前に期限が過ぎるので、まとめずに返る
+    assert messages == ["こ", "ん", "に", "ち", "は"]
+
+
+@pytest.mark.asyncio
+async def test_coalesced_messages_are_returned_when_deadline_passes_while_draining(
+    monkeypatch,
+):
+    # 期限を確実に過ぎた状態にする為、イベントループの時刻を差し替えてテストから進める
+    loop = asyncio.get_running_loop()
+    now = loop.time()
+    monkeypatch.setattr(loop, "time", lambda: now)
+    released = asyncio.Event()
+
+    async def generate_results_delayed_by_busy_event_loop():
+        nonlocal now
+        yield {"conversation_id": conversation_id, "message": "こ"}
+        yield {"conversation_id": conversation_id, "message": "ん"}
+        await released.wait()
+        yield {"conversation_id": conversation_id, "message": "に"}
+        # 他のリクエストの処理でイベントループが塞がり、溜まった結果を処理する前に期限が過ぎた場合
+        now += 1
+        yield {"conversation_id": conversation_id, "message": "ち"}
+
+    results = coalesce_use_case_results(
+        generate_results_delayed_by_busy_event_loop(),
+        StreamCoalescingConfig(max_bytes=1024, max_delay_seconds=0.01),
+    )
+
+    assert (await anext(results))["message"] == "こ"
+    next_result = asyncio.create_task(anext(results))
+    # 「ん」を受け取って次の結果を待つ状態まで進める
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert not next_result.done()
+
+    released.set()
+    messages = [(await next_result)["message"]] + [
+        result["message"] async for result in results
+    ]
+
+    # 期限を過ぎたメッセージは、後から溜まっている結果とまとめずに返す
+    assert messages == ["んに", "ち"]
+
+
+@pytest.mark.asyncio
+async def test_pending_results_are_bounded_when_client_is_slow():
+    generated_count = 0
+
+    async def generate_many_results():
+        nonlocal generated_count
+        for _ in range(max_pending_results * 3):
+            generated_count += 1
+            yield {"conversation_id": conversation_id, "message": "に"}
+
+    results = coalesce_use_case_results(
+        generate_many_results(),
+        StreamCoalescingConfig(max_bytes=1024 * 1024, max_delay_seconds=10),
+    )
+
+    assert (await anext(results))["message"] == "に"
+    # クライアントへの書き込みが終わらない間に受け取る結果は上限までにする
+    await asyncio.sleep(0.05)
+    assert generated_count <= max_pending_results + 2
+
+    messages = [result["message"] async for result in results]
+    assert "".join(messages) == "に" * (max_pending_results * 3 - 1)
+
+
+@pytest.mark.asyncio
+async def test_error_result_is_returned_after_coalesced_messages():
+    async def generate_results_with_error():
+        async for result in generate_results(["こ", "ん", "に"]):
+            yield result
+        yield {
+            "type": "INTERNAL_SERVER_ERROR",
+            "title": "an unexpected error has occurred.",
+        }
+
+    results = coalesce_use_case_results(
+        generate_results_with_error(),
+        StreamCoalescingConfig(max_bytes=1024, max_delay_seconds=10),
+    )
+
+    assert [result async for result in results] == [
+        {"conversation_id": conversation_id, "message": "こ"},
+        {"conversation_id": conversation_id, "message": "んに"},
+        {"type": "INTERNAL_SERVER_ERROR", "title": "an unexpected error has occurred."},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_closing_coalesced_stream_cancels_pending_result():
+    cancelled = asyncio.Event()
+
+    async def generate_slow_results():
+        try:
+            yield {"conversation_id": conversation_id, "message": "こ"}
+            yield {"conversation_id": conversation_id, "message": "ん"}
+            await asyncio.sleep(10)
+            yield {"conversation_id": conversation_id, "message": "に"}
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    results = coalesce_use_case_results(
+        generate_slow_results(),
+        StreamCoalescingConfig(max_bytes=1024, max_delay_seconds=0.01),
+    )
+
+    assert (await anext(results))["message"] == "こ"
+    # 次のトークンを待っている間に期限が過ぎて返る
+    assert (await anext(results))["message"] == "ん"
+
+    await results.aclose()
+
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_upstream_is_closed_when_closing_is_cancelled_again():
+    closed = asyncio.Event()
+
+    async def generate_many_results():
+        try:
+            for _ in range(max_pending_results * 2):
+                yield {"conversation_id": conversation_id, "message": "こ"}
+        finally:
+            closed.set()
+
+    # 参照が無くなってガベージコレクションで閉じられないように、上流のジェネレータを保持しておく
+    upstream = generate_many_results()
+    results = coalesce_use_case_results(
+        upstream,
+        StreamCoalescingConfig(max_bytes=1024, max_delay_seconds=10),
+    )
+
+    assert (await anext(results))["message"] == "こ"
+    # 溜めている結果が上限に達して、受け取るタスクが空きを待っている状態にする
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+    # 受け取るタスクの終了を待っている間に、閉じる処理が再度キャンセルされる
+    closing = asyncio.create_task(results.aclose())
+    await asyncio.sleep(0)
+    closing.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await closing
+
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+    assert closed.is_set()
+
+
+@pytest.mark.asyncio
+async def test_coalesce_stream_returns_results_as_is_when_disabled():
+    results = generate_results(["こ", "ん"])
+
+    assert coalesce_stream(results, None) is results
+    assert (
+        coalesce_stream(
+            results, StreamCoalescingConfig(max_bytes=0, max_delay_seconds=0.005)
+        )
+        is results
+    )
+
+
+@pytest.mark.asyncio
+async def test_resolve_stream_coalescing_config_overrides_with_request_values():
+    config = StreamCoalescingConfig(max_bytes=48, max_delay_seconds=0.005)
+
+    assert resolve_stream_coalescing_config(config) is config
+    assert resolve_stream_coalescing_config(config, max_delay_ms=20) == {
+        "max_bytes": 48,
+        "max_delay_seconds": 0.02,
+    }
+    assert resolve_stream_coalescing_config(config, max_bytes=0) == {
+        "max_bytes": 0,
+        "max_delay_seconds": 0.005,
+    }
+    # 元の設定は変更しない
+    assert config == {"max_bytes": 48, "max_delay_seconds": 0.005}
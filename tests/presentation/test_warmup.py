@@ -0,0 +1,63 @@
+import asyncio
+import httpx
+import pytest
+from typing import List
+from presentation.warmup import StartupWarmupConfig, warmup_app_container
+from infrastructure.tokenizer import Tokenizer
+from tests.infrastructure.tokenizer.byte_encoding import create_byte_encoding
+from tests.presentation.test_container import create_container
+
+
+@pytest.fixture(autouse=True)
+def set_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+
+
+@pytest.mark.asyncio
+async def test_warmup_app_container():
+    requested_paths: List[str] = []
+
+    def handle_request(request: httpx.Request) -> httpx.Response:
+        requested_paths.append(request.url.path)
+        return httpx.Response(200, json={"id": "gpt-4o-mini", "object": "model"})
+
+    container = create_container()
+    container.tokenizer = Tokenizer(create_byte_encoding(), offload_threshold_chars=100)
+    container.openai_client.http_client = httpx.AsyncClient(
+        transport=httpx.MockTransport(handle_request)
+    )
+
+    result = await warmup_app_container(
+        container, StartupWarmupConfig(timeout_seconds=1)
+    )
+
+    assert result["failed_stages"] == []
+    assert list(result["seconds"]) == ["tokenizer", "gazetteer", "openai"]
+    assert len(requested_paths) == 1
+    assert requested_paths[0].startswith("/v1/models/")
+
+    await container.openai_client.http_client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_warmup_app_container_continues_when_openai_is_unavailable():
+    async def handle_request(request: httpx.Request) -> httpx.Response:
+        # タイムアウトするまで応答しない
+        await asyncio.sleep(10)
+        return httpx.Response(200)
+
+    container = create_container()
+    container.tokenizer = Tokenizer(create_byte_encoding(), offload_threshold_chars=100)
+    container.openai_client.http_client = httpx.AsyncClient(
+        transport=httpx.MockTransport(handle_request)
+    )
+
+    result = await warmup_app_container(
+        container, StartupWarmupConfig(timeout_seconds=0.1)
+    )
+
+    # 接続出来なくても起動は続ける
+    assert result["failed_stages"] == ["openai"]
+    assert result["seconds"]["openai"] < 1
+
+    await container.openai_client.http_client.aclose()
@@ -1,10 +1,25 @@
+import asyncio
+import logging
 import pytest
+from unittest import mock
+from collections.abc import AsyncGenerator
 import asyncstdlib
+from typing import List
+from domain.repository.cat_message_repository_interface import (
+    GenerateMessageForGuestUserDto,
+    GenerateMessageForGuestUserResult,
+)
+from domain.repository.guest_users_conversation_history_repository_interface import (
+    SaveGuestUsersConversationHistoryDto,
+)
 from usecase.generate_cat_message_for_guest_user_use_case import (
     GenerateCatMessageForGuestUserUseCase,
     GenerateCatMessageForGuestUserUseCaseDto,
+    _disconnect_tasks,
+    wait_for_client_disconnect_tasks,
 )
 from infrastructure.repository.mock.mock_db_handler import MockDbHandler
+from log.request_timing import RequestTiming
 from infrastructure.repository.mock.mock_users_conversation_history_repository import (
     MockGuestUsersConversationHistoryRepository,
 )
@@ -144,3 +159,151 @@ async def test_execute_error_failed_to_generate_message_for_guest_user():
         assert "type" in result
         assert result["title"] == "an unexpected error has occurred."
         assert result["type"] == "INTERNAL_SERVER_ERROR"
+
+
+class FakeConversationHistoryWriter:
+    def __init__(self) -> None:
+        self.conversation_histories: List[SaveGuestUsersConversationHistoryDto] = []
+
+    async def enqueue(self, dto: SaveGuestUsersConversationHistoryDto) -> None:
+        self.conversation_histories.append(dto)
+
+
+@pytest.mark.asyncio
+async def test_execute_success_with_conversation_history_writer():
+    conversation_history_writer = FakeConversationHistoryWriter()
+    dto = GenerateCatMessageForGuestUserUseCaseDto(
+        request_id="dummy000-0000-0000-0000-requestid000",
+        user_id="dummy000-user-id00-0000-000000000000",
+        cat_id="moko",
+        message="ねこちゃんこんにちは🐱",
+        db_handler=MockDbHandler(),
+        guest_users_conversation_history_repository=MockGuestUsersConversationHistoryRepository(),
+        cat_message_repository=MockCatMessageRepository(),
+        # DBに直接保存する場合はエラーになるconversation_id
+        conversation_id="ERROR",
+        conversation_history_writer=conversation_history_writer,
+    )
+
+    use_case = GenerateCatMessageForGuestUserUseCase(dto)
+
+    results = [result async for result in use_case.execute()]
+
+    assert all("message" in result for result in results)
+    assert conversation_history_writer.conversation_histories == [
+        {
+            "conversation_id": "ERROR",
+            "cat_id": "moko",
+            "user_id": "dummy000-user-id00-0000-000000000000",
+            "user_message": "ねこちゃんこんにちは🐱",
+            "ai_message": "はじめましてだにゃん🐱何かお手伝いできる事はないにゃんか？",
+        }
+    ]
+
+
+@pytest.mark.asyncio
+async def test_execute_records_request_timing():
+    request_timing = RequestTiming()
+    dto = GenerateCatMessageForGuestUserUseCaseDto(
+        request_id="dummy000-0000-0000-0000-requestid000",
+        user_id="dummy000-user-id00-0000-000000000000",
+        cat_id="moko",
+        message="ねこちゃんこんにちは🐱",
+        db_handler=MockDbHandler(),
+        guest_users_conversation_history_repository=MockGuestUsersConversationHistoryRepository(),
+        cat_message_repository=MockCatMessageRepository(),
+        request_timing=request_timing,
+    )
+
+    use_case = GenerateCatMessageForGuestUserUseCase(dto)
+
+    results = [result async for result in use_case.execute()]
+
+    summary = request_timing.summary()
+
+    assert list(request_timing.stages) == ["history"]
+    assert summary["token_count"] == len(results) == 3
+    assert summary["ttft_ms"] is not None
+    assert summary["total_duration_ms"] >= summary["ttft_ms"]
+    assert request_timing.server_timing_header().startswith("history;dur=")
+
+
+class CancellableMockCatMessageRepository(MockCatMessageRepository):
+    def __init__(self) -> None:
+        self.cancelled = False
+        self.closed = False
+
+    async def generate_message_for_guest_user(
+        self, dto: GenerateMessageForGuestUserDto
+    ) -> AsyncGenerator[GenerateMessageForGuestUserResult, None]:
+        try:
+            async for result in super().generate_message_for_guest_user(dto):
+                yield result
+        finally:
+            self.closed = True
+
+    async def cancel_generation(self) -> None:
+        self.cancelled = True
+
+
+@pytest.mark.asyncio
+async def test_execute_saves_truncated_message_when_client_disconnected():
+    conversation_history_writer = FakeConversationHistoryWriter()
+    cat_message_repository = CancellableMockCatMessageRepository()
+    dto = GenerateCatMessageForGuestUserUseCaseDto(
+        request_id="dummy000-0000-0000-0000-requestid000",
+        user_id="dummy000-user-id00-0000-000000000000",
+        cat_id="moko",
+        message="ねこちゃんこんにちは🐱",
+        db_handler=MockDbHandler(),
+        guest_users_conversation_history_repository=MockGuestUsersConversationHistoryRepository(),
+        cat_message_repository=cat_message_repository,
+        conversation_id="dummyid0-0000-0000-0000-conversation",
+        conversation_history_writer=conversation_history_writer,
+    )
+
+    use_case = GenerateCatMessageForGuestUserUseCase(dto)
+
+    use_case_stream = use_case.execute()
+    await anext(use_case_stream)
+    await anext(use_case_stream)
+    # クライアントが切断するとStreamingResponseのジェネレーターが途中で閉じられる
+    await use_case_stream.aclose()
+    await asyncio.gather(*_disconnect_tasks)
+
+    assert cat_message_repository.cancelled
+    # リポジトリのジェネレーターも閉じる
+    assert cat_message_repository.closed
+    assert conversation_history_writer.conversation_histories == [
+        {
+            "conversation_id": "dummyid0-0000-0000-0000-conversation",
+            "cat_id": "moko",
+            "user_id": "dummy000-user-id00-0000-000000000000",
+            "user_message": "ねこちゃんこんにちは🐱",
+            "ai_message": "はじめましてだにゃん🐱",
+            "ai_message_truncated": True,
+        }
+    ]
+
+
+@pytest.mark.asyncio
+async def test_wait_for_client_disconnect_tasks():
+    finished: List[str] = []
+
+    async def save(name: str, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+        finished.append(name)
+
+    for name, seconds in [("fast", 0.01), ("slow", 10)]:
+        task = asyncio.create_task(save(name, seconds))
+        _disconnect_tasks.add(task)
+        task.add_done_callback(_disconnect_tasks.discard)
+
+    logger = logging.getLogger("test_wait_for_client_disconnect_tasks")
+    with mock.patch.object(logger, "warning") as warning:
+        await wait_for_client_disconnect_tasks(logger, timeout_seconds=0.1)
+
+    # 時間内に終わらなかった後処理は中断し、ログに出力する
+    assert finished == ["fast"]
+    assert _disconnect_tasks == set()
+    warning.assert_called_once()